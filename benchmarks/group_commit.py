@@ -0,0 +1,52 @@
+import argparse
+import os
+import sys
+import tempfile
+import threading
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src"))
+
+from database import Database
+from systems.internal.vote_system import VoteRepository
+
+def run(path, threads, votes_per_thread, **options):
+    db = Database(path, **options)
+    db.create_db()
+    repository = VoteRepository(db)
+    entry_id = db.execute("INSERT INTO entry_data (title) VALUES('benchmark')").lastrowid
+    db.commit()
+
+    def cast(offset):
+        for i in range(votes_per_thread):
+            repository.cast_vote(entry_id, offset * votes_per_thread + i, "approve" if i % 2 else "disapprove")
+
+    workers = [threading.Thread(target=cast, args=(i,)) for i in range(threads)]
+    start = time.perf_counter()
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join()
+    elapsed = time.perf_counter() - start
+    db.close()
+    return threads * votes_per_thread / elapsed
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Compare vote throughput with and without group commit")
+    parser.add_argument("--threads", type=int, default=16)
+    parser.add_argument("--votes", type=int, default=200, help="votes cast per thread")
+    parser.add_argument("--window", type=float, default=0.0, help="extra group commit window in seconds")
+    parser.add_argument("--max-batch", type=int, default=64)
+    parser.add_argument("--synchronous", default="FULL", help="PRAGMA synchronous used for both runs")
+    args = parser.parse_args(argv)
+
+    with tempfile.TemporaryDirectory() as directory:
+        before = run(os.path.join(directory, "single.db"), args.threads, args.votes, synchronous=args.synchronous)
+        after = run(os.path.join(directory, "group.db"), args.threads, args.votes, synchronous=args.synchronous,
+                    group_commit=True, commit_window=args.window, max_batch=args.max_batch)
+
+    print(f"commit per vote: {before:10.1f} votes/sec")
+    print(f"group commit:    {after:10.1f} votes/sec ({after / before:.1f}x)")
+
+if __name__ == "__main__":
+    main()
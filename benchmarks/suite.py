@@ -0,0 +1,276 @@
+from typing import NamedTuple
+import argparse
+import json
+import os
+import platform
+import random
+import shutil
+import sqlite3
+import statistics
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src"))
+
+from ambassador import Ambassador
+from database import Database
+from exceptions import *
+from systems.entry_system import EntryRepository, EntryLogic
+from systems.internal.user_system import UserRepository, UserLogic
+from systems.internal.vote_system import VoteRepository, VoteLogic, VOTE_OPTIONS, VOTE_CODES
+from systems.repeal_system import RepealRepository, RepealLogic
+
+class Dataset:
+    def __init__(self, users, active, completed, repeals, fresh_casters) -> None:
+        self.users = users
+        self.active = active
+        self.completed = completed
+        self.repeals = repeals
+        # members that have not voted on anything, every vote they cast is a first vote
+        self.fresh_casters = fresh_casters
+
+    @property
+    def entries(self):
+        return self.active + self.completed + self.repeals
+
+def build_database(path, users, entries, votes, seed, fresh_casters = 50) -> Dataset:
+    rng = random.Random(seed)
+    db = Database(path)
+    db.create_db()
+    enums = db.enums
+    now = int(time.time())
+
+    db.execute_many("INSERT INTO user (id, discord_id, discord_username, display_name, role) VALUES(?, ?, ?, ?, ?)",
+                    [(id, str(10 ** 17 + id), f"user{id}", f"User {id}", enums.roles.id_of("member"))
+                     for id in range(1, users + fresh_casters + 1)])
+
+    repeal_count = entries // 10
+    rows = []
+    active, completed, repeals = [], [], []
+    for id in range(1, entries + 1):
+        if id > entries - repeal_count:
+            type, state = "repeal", "completed"
+            repeals.append(id)
+        elif rng.random() < 0.4:
+            type, state = "resolution", "active"
+            active.append(id)
+        else:
+            type, state = "resolution", "completed"
+            completed.append(id)
+        deadline = now + 86400 if state == "active" else now - rng.randint(1, 86400 * 365)
+        rows.append((id, enums.entry_types.id_of(type), enums.state_types.id_of(state), enums.roles.id_of("member"),
+                     rng.randint(1, users), deadline - 86400 * 7, deadline, f"Resolution {id}", f"Synthetic content of entry {id}. " * 20))
+    db.execute_many("""INSERT INTO entry_data (id, type, state, role, author, creation_date, deadline, title, content)
+                    VALUES(?, ?, ?, ?, ?, ?, ?, ?, ?)""", rows)
+    db.execute_many("INSERT INTO repeal_store (entry_id, repealed_id) VALUES(?, ?)",
+                    [(id, rng.choice(completed)) for id in repeals])
+
+    all_entries = active + completed + repeals
+    # a caster voting twice on the same entry keeps the later vote, like a re-vote would
+    db.execute_many("INSERT OR REPLACE INTO vote_store (caster, entry, vote) VALUES(?, ?, ?)",
+                    ((rng.randint(1, users), rng.choice(all_entries), VOTE_CODES[rng.choice(VOTE_OPTIONS)]) for _ in range(votes)))
+    db.rebuild_tallies()
+    db.rebuild_laws()
+    db.commit()
+    db.close()
+    return Dataset(list(range(1, users + 1)), active, completed, repeals, list(range(users + 1, users + fresh_casters + 1)))
+
+class Stack:
+    def __init__(self, db: Database) -> None:
+        self.entry_logic = EntryLogic(EntryRepository(db))
+        self.user_logic = UserLogic(UserRepository(db))
+        self.vote_logic = VoteLogic(VoteRepository(db), self.user_logic, self.entry_logic)
+        self.repeal_logic = RepealLogic(RepealRepository(db), self.vote_logic, self.entry_logic)
+        self.ambassador = Ambassador(self.entry_logic, self.entry_logic, self.user_logic)
+        self.ambassador.register_logic(self.vote_logic, "resolution")
+        self.ambassador.register_logic(self.repeal_logic, "repeal")
+
+def change_role(stack: Stack, source_id, target_id, role):
+    try:
+        stack.user_logic.change_role(source_id, target_id, role)
+    except UserNotEnoughPermissionsError:
+        return "rejected"
+
+def repeal_verdict(stack: Stack, entry_id):
+    try:
+        stack.repeal_logic.get_verdict(entry_id)
+    except AmbassadorError:
+        return "rejected"
+
+def warm_vote(stack: Stack, caster_id, entry_id, vote):
+    stack.entry_logic.get_header(entry_id)
+    stack.user_logic.get_user(caster_id)
+
+def warm_repeal(stack: Stack, entry_id):
+    stack.entry_logic.get_header(entry_id)
+    stack.vote_logic.get_tally(entry_id)
+    stack.entry_logic.get_header(stack.repeal_logic.get(entry_id).repealed_id)
+
+class Benchmark(NamedTuple):
+    sampler: callable
+    operation: callable
+    # operations that change the database get unique arguments and a fresh copy of the fixture per pass,
+    # the warm pass primes the caches through warmup instead of repeating the operation
+    key: callable = None
+    warmup: callable = None
+
+BENCHMARKS = {
+    "EntryLogic.get": Benchmark(lambda data, rng: (rng.choice(data.entries),),
+                                lambda stack, entry_id: stack.entry_logic.get(entry_id)),
+    "VoteLogic.cast_vote": Benchmark(lambda data, rng: (rng.choice(data.fresh_casters), rng.choice(data.active), rng.choice(VOTE_OPTIONS)),
+                                     lambda stack, caster_id, entry_id, vote: stack.vote_logic.cast_vote(caster_id, entry_id, vote),
+                                     key=lambda caster_id, entry_id, vote: (caster_id, entry_id), warmup=warm_vote),
+    "VoteLogic.get_verdict": Benchmark(lambda data, rng: (rng.choice(data.completed),),
+                                       lambda stack, entry_id: stack.vote_logic.get_verdict(entry_id)),
+    "UserLogic.change_role": Benchmark(lambda data, rng: (rng.choice(data.users), rng.choice(data.users), rng.choice(("member", "everyone"))),
+                                       change_role),
+    "RepealLogic.get_verdict": Benchmark(lambda data, rng: (rng.choice(data.repeals),), repeal_verdict,
+                                         key=lambda entry_id: entry_id, warmup=warm_repeal),
+    "Ambassador.get_vote_proxy": Benchmark(lambda data, rng: (rng.choice(data.active + data.completed),),
+                                           lambda stack, entry_id: stack.ambassador.get_vote_proxy(entry_id)),
+}
+
+def summarize(samples, rejected):
+    samples = sorted(samples)
+    def percentile(fraction):
+        return samples[min(len(samples) - 1, int(fraction * len(samples)))] / 1000
+    return {
+        "ops": len(samples),
+        "rejected": rejected,
+        "mean_us": statistics.fmean(samples) / 1000,
+        "p50_us": percentile(0.50),
+        "p95_us": percentile(0.95),
+        "p99_us": percentile(0.99),
+        "ops_per_sec": len(samples) / (sum(samples) / 1e9) if sum(samples) else None,
+    }
+
+def time_operations(stack, operation, arguments):
+    samples = []
+    rejected = 0
+    for args in arguments:
+        start = time.perf_counter_ns()
+        result = operation(stack, *args)
+        samples.append(time.perf_counter_ns() - start)
+        if result == "rejected":
+            rejected += 1
+    return summarize(samples, rejected)
+
+def sample_arguments(benchmark: Benchmark, dataset: Dataset, rng, ops):
+    if benchmark.key is None:
+        return [benchmark.sampler(dataset, rng) for _ in range(ops)]
+    arguments, seen = [], set()
+    # stops early when the fixture has fewer distinct keys than ops
+    for _ in range(ops * 20):
+        args = benchmark.sampler(dataset, rng)
+        if benchmark.key(*args) not in seen:
+            seen.add(benchmark.key(*args))
+            arguments.append(args)
+            if len(arguments) == ops:
+                break
+    return arguments
+
+def copy_fixture(path) -> str:
+    copy = path + ".run"
+    for suffix in ("", "-wal", "-shm"):
+        if os.path.exists(copy + suffix):
+            os.remove(copy + suffix)
+    shutil.copyfile(path, copy)
+    return copy
+
+def time_mutating(path, benchmark: Benchmark, arguments, warm):
+    db = Database(copy_fixture(path))
+    try:
+        stack = Stack(db)
+        if warm:
+            for args in arguments:
+                benchmark.warmup(stack, *args)
+        return time_operations(stack, benchmark.operation, arguments)
+    finally:
+        db.close()
+
+def run_suite(path, dataset: Dataset, ops, seed, selected):
+    results = {}
+    for name, benchmark in BENCHMARKS.items():
+        if selected and name not in selected:
+            continue
+        rng = random.Random(f"{seed}:{name}")
+        arguments = sample_arguments(benchmark, dataset, rng, ops)
+        if benchmark.key is not None:
+            # both passes start from the same unchanged data, only the caches differ
+            results[name] = {
+                "cold": time_mutating(path, benchmark, arguments, warm=False),
+                "warm": time_mutating(path, benchmark, arguments, warm=True),
+            }
+            continue
+        db = Database(path)
+        try:
+            # the first pass runs against empty caches, the second repeats the same keys
+            stack = Stack(db)
+            results[name] = {
+                "cold": time_operations(stack, benchmark.operation, arguments),
+                "warm": time_operations(stack, benchmark.operation, arguments),
+            }
+        finally:
+            db.close()
+    return results
+
+def compare(results, baseline, threshold):
+    regressions = []
+    for name, phases in results.items():
+        for phase, summary in phases.items():
+            previous = baseline.get("results", {}).get(name, {}).get(phase)
+            if previous is None:
+                continue
+            ratio = summary["p50_us"] / previous["p50_us"] if previous["p50_us"] else float("inf")
+            marker = "REGRESSION" if ratio > threshold else ""
+            print(f"{name:28} {phase:5} p50 {previous['p50_us']:10.1f}us -> {summary['p50_us']:10.1f}us ({ratio:5.2f}x) {marker}")
+            if ratio > threshold:
+                regressions.append((name, phase))
+    return regressions
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Time the repository and logic hot paths against a synthetic database")
+    parser.add_argument("--users", type=int, default=1000)
+    parser.add_argument("--entries", type=int, default=5000)
+    parser.add_argument("--votes", type=int, default=50000)
+    parser.add_argument("--ops", type=int, default=2000, help="operations timed per benchmark and phase")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--only", action="append", help="run only the named benchmark (repeatable)")
+    parser.add_argument("--output", default="bench_results.json")
+    parser.add_argument("--compare", help="earlier results file to compare the p50 latencies against")
+    parser.add_argument("--threshold", type=float, default=1.25, help="slowdown ratio reported as a regression")
+    args = parser.parse_args(argv)
+
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, "bench.db")
+        start = time.perf_counter()
+        dataset = build_database(path, args.users, args.entries, args.votes, args.seed)
+        build_seconds = time.perf_counter() - start
+        results = run_suite(path, dataset, args.ops, args.seed, args.only)
+
+    report = {
+        "created": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+        "python": platform.python_version(),
+        "sqlite": sqlite3.sqlite_version,
+        "parameters": {"users": args.users, "entries": args.entries, "votes": args.votes, "ops": args.ops, "seed": args.seed},
+        "build_seconds": build_seconds,
+        "results": results,
+    }
+    with open(args.output, "w") as file:
+        json.dump(report, file, indent=2)
+
+    for name, phases in results.items():
+        for phase, summary in phases.items():
+            print(f"{name:28} {phase:5} p50 {summary['p50_us']:10.1f}us  p95 {summary['p95_us']:10.1f}us  {summary['ops_per_sec']:12.0f} ops/s")
+    print(f"Results written to {args.output}")
+
+    if args.compare:
+        with open(args.compare) as file:
+            baseline = json.load(file)
+        if compare(results, baseline, args.threshold):
+            return 1
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
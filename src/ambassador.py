@@ -1,9 +1,12 @@
+from contextlib import nullcontext
+
 from database import Database
 from systems.interface.abstract_logic import *
 from exceptions import *
 from proxies.user_proxy import UserProxy
 from proxies.vote_proxy import VoteProxy
 from proxies.entry_proxy import EntryProxy
+from proxies.election_proxy import ElectionProxy
 
 class Ambassador:
     def __init__(self, type_provider: EntryTypeProvider, entry_logic: EntryInterface, user_logic: UserInterface) -> None:
@@ -25,6 +28,11 @@ class Ambassador:
             raise AmbassadorOperationNotSupportedError(f"The entry of type \"{entry_id}\" does not support the attempted operation")
         return logic
     
+    def _transaction(self):
+        if isinstance(self._entry_logic, Transactional):
+            return self._entry_logic.transaction()
+        return nullcontext()
+
     def register_logic(self, logic: LogicInterface, type: str):
         if type in self._logic_registry:
             raise AmbassadorLogicAlreadyRegisteredError(f"A logic instance was already registered for type \"{type}\"")
@@ -41,12 +49,19 @@ class Ambassador:
 
     def register_repeal(self, title, content, author, role, deadline, repealed_id):
         logic = self._get_logic_instance("repeal")
-        entry_id = self.register_entry(title, content, "repeal", author, role, deadline)
-        logic.set_repeal(entry_id, repealed_id)
+        with self._transaction():
+            entry_id = self.register_entry(title, content, "repeal", author, role, deadline)
+            logic.set_repeal(entry_id, repealed_id)
         return entry_id
     
-    def register_election(self, title, content, author, role, deadline, candidates: list[int]):
-        pass
+    def register_election(self, title, content, author, role, deadline, candidates: list[int], method = "instant-runoff", seats = 1):
+        logic = self._get_logic_instance("election")
+        if logic is None:
+            raise AmbassadorOperationNotSupportedError("No logic instance was registered for elections")
+        with self._transaction():
+            entry_id = self.register_entry(title, content, "election", author, role, deadline)
+            logic.set_election(entry_id, candidates, method, seats)
+        return entry_id
     
     def get_user_proxy(self, user_id):
         return UserProxy(self._user_logic, user_id)
@@ -57,10 +72,38 @@ class Ambassador:
     
     def get_entry_proxy(self, entry_id):
         return EntryProxy(self._entry_logic, entry_id)
+
+    def list_entries(self, *, state = None, type = None, author = None, deadline_from = None, deadline_to = None, after = None, limit = 50,
+                     max_staleness = None):
+        return self._entry_logic.list_entries(state=state, type=type, author=author, deadline_from=deadline_from,
+                                              deadline_to=deadline_to, after=after, limit=limit, max_staleness=max_staleness)
+
+    def search_entries(self, text, *, state = None, type = None, limit = 20, offset = 0, prefix = False, max_staleness = None):
+        return self._entry_logic.search_entries(text, state=state, type=type, limit=limit, offset=offset, prefix=prefix,
+                                                max_staleness=max_staleness)
+
+    def get_entries(self, entry_ids):
+        return self._entry_logic.get_entries(entry_ids)
+
+    def get_users(self, user_ids):
+        return self._user_logic.get_users(user_ids)
     
     def get_repeal_target(self, entry_id):
         logic = self._get_logic(entry_id, LogicInterface)
         return logic.get(entry_id)
     
+    def _get_repeal_logic(self) -> RepealInterface:
+        logic = self._get_logic_instance("repeal")
+        if not isinstance(logic, RepealInterface):
+            raise AmbassadorOperationNotSupportedError("No logic instance was registered for repeals")
+        return logic
+
+    def get_laws_in_force(self):
+        return self._get_repeal_logic().laws_in_force()
+
+    def is_in_force(self, entry_id):
+        return self._get_repeal_logic().is_in_force(entry_id)
+
     def get_election_proxy(self, entry_id):
-        pass
\ No newline at end of file
+        logic = self._get_logic(entry_id, ElectionInterface)
+        return ElectionProxy(logic, entry_id)
\ No newline at end of file
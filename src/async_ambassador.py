@@ -0,0 +1,80 @@
+from ambassador import Ambassador
+from async_database import AsyncDatabase
+
+class AsyncAmbassador:
+    def __init__(self, ambassador: Ambassador, executor: AsyncDatabase) -> None:
+        self._ambassador = ambassador
+        self._executor = executor
+
+    @property
+    def ambassador(self) -> Ambassador:
+        return self._ambassador
+
+    async def _run(self, function, *args, **kwargs):
+        return await self._executor.run(function, *args, **kwargs)
+
+    async def register_entry(self, title, content, type, author, role, deadline) -> int:
+        return await self._run(self._ambassador.register_entry, title, content, type, author, role, deadline)
+
+    async def register_user(self, discord_id, username, display_name):
+        return await self._run(self._ambassador.register_user, discord_id, username, display_name)
+
+    async def register_resolution(self, title, content, author, role, deadline):
+        return await self._run(self._ambassador.register_resolution, title, content, author, role, deadline)
+
+    async def register_repeal(self, title, content, author, role, deadline, repealed_id):
+        return await self._run(self._ambassador.register_repeal, title, content, author, role, deadline, repealed_id)
+
+    async def register_election(self, title, content, author, role, deadline, candidates: list[int], method = "instant-runoff", seats = 1):
+        return await self._run(self._ambassador.register_election, title, content, author, role, deadline, candidates, method, seats)
+
+    async def get_entry(self, entry_id):
+        return await self._run(lambda: self._ambassador.get_entry_proxy(entry_id).info)
+
+    async def get_user(self, user_id):
+        return await self._run(lambda: self._ambassador.get_user_proxy(user_id).info)
+
+    async def list_entries(self, **filters):
+        return await self._run(lambda: self._ambassador.list_entries(**filters))
+
+    async def search_entries(self, text, **options):
+        return await self._run(lambda: self._ambassador.search_entries(text, **options))
+
+    async def get_entries(self, entry_ids):
+        return await self._run(self._ambassador.get_entries, entry_ids)
+
+    async def get_users(self, user_ids):
+        return await self._run(self._ambassador.get_users, user_ids)
+
+    async def get_repeal_target(self, entry_id):
+        return await self._run(self._ambassador.get_repeal_target, entry_id)
+
+    async def approve(self, entry_id):
+        return await self._run(lambda: self._ambassador.get_entry_proxy(entry_id).approve())
+
+    async def deny(self, entry_id):
+        return await self._run(lambda: self._ambassador.get_entry_proxy(entry_id).deny())
+
+    async def cancel(self, entry_id):
+        return await self._run(lambda: self._ambassador.get_entry_proxy(entry_id).cancel())
+
+    async def complete(self, entry_id, *, early=False):
+        return await self._run(lambda: self._ambassador.get_entry_proxy(entry_id).complete(early=early))
+
+    async def cast_vote(self, entry_id, caster_id: int, vote: str):
+        return await self._run(lambda: self._ambassador.get_vote_proxy(entry_id).cast_vote(caster_id, vote))
+
+    async def elect(self, entry_id, elector_id: int, ranking: list[int]):
+        return await self._run(lambda: self._ambassador.get_election_proxy(entry_id).elect(elector_id, ranking))
+
+    async def get_winner(self, entry_id):
+        return await self._run(lambda: self._ambassador.get_election_proxy(entry_id).get_winner())
+
+    async def get_vote(self, entry_id):
+        return await self._run(lambda: self._ambassador.get_vote_proxy(entry_id).info)
+
+    async def get_tally(self, entry_id):
+        return await self._run(lambda: self._ambassador.get_vote_proxy(entry_id).tally)
+
+    async def get_verdict(self, entry_id):
+        return await self._run(lambda: self._ambassador.get_vote_proxy(entry_id).get_verdict())
@@ -0,0 +1,89 @@
+import asyncio
+import queue
+import threading
+import weakref
+
+from database import Database
+
+def _resolve(future: asyncio.Future, result, error):
+    if future.done():
+        return
+    if error is not None:
+        future.set_exception(error)
+    else:
+        future.set_result(result)
+
+class AsyncDatabase:
+    def __init__(self, db: Database, *, max_queue=256) -> None:
+        self._db = db
+        self._max_queue = max_queue
+        self._queue = queue.Queue()
+        # one semaphore per event loop, an asyncio primitive is bound to the loop it is first used on
+        self._slots = weakref.WeakKeyDictionary()
+        self._closed = False
+        self._thread = threading.Thread(target=self._work, name="ambassador-db", daemon=True)
+        self._thread.start()
+
+    @property
+    def database(self) -> Database:
+        return self._db
+
+    def _work(self):
+        while True:
+            job = self._queue.get()
+            if job is None:
+                return
+            function, args, kwargs, future, loop, slots = job
+            result, error = None, None
+            if not future.cancelled():
+                try:
+                    result = function(*args, **kwargs)
+                except BaseException as exception:
+                    error = exception
+            try:
+                loop.call_soon_threadsafe(_resolve, future, result, error)
+                # the slot is only given back once the job left the queue, even if its caller was cancelled meanwhile
+                loop.call_soon_threadsafe(slots.release)
+            except RuntimeError:
+                pass # the loop was closed while the job was running
+
+    async def run(self, function, *args, **kwargs):
+        if self._closed:
+            raise RuntimeError("The database executor was already closed")
+        loop = asyncio.get_running_loop()
+        slots = self._slots.get(loop)
+        if slots is None:
+            slots = self._slots[loop] = asyncio.Semaphore(self._max_queue)
+        await slots.acquire()
+        future = loop.create_future()
+        self._queue.put((function, args, kwargs, future, loop, slots))
+        return await future
+
+    async def execute(self, sql_command: str, *args):
+        return await self.run(self._db.execute, sql_command, *args)
+
+    async def insert(self, table: str, data, *, ignore=False):
+        return await self.run(self._db.insert, table, data, ignore=ignore)
+
+    async def query(self, query_statement: str, *params):
+        return await self.run(self._db.query, query_statement, *params)
+
+    async def query_once(self, query_statement: str, *params):
+        return await self.run(self._db.query_once, query_statement, *params)
+
+    async def commit(self):
+        return await self.run(self._db.commit)
+
+    async def close(self, *, close_database=True):
+        if self._closed:
+            return
+        if close_database:
+            await self.run(self._db.close)
+        self._closed = True
+        self._queue.put(None)
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc_info):
+        await self.close()
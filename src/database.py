@@ -1,14 +1,327 @@
+from contextlib import contextmanager
 from typing import Union
 from typing_extensions import Literal
+from urllib.parse import quote
+import json
+import logging
+import queue
 import sqlite3
+import threading
+import time
+import zlib
+
+from utils.enum_map import EnumMap, Enums
+from utils.metrics import Metrics
+
+logger = logging.getLogger(__name__)
+
+# votes are stored as 0 approve, 1 disapprove, 2 abstain
+TALLY_QUERY = """SELECT entry, SUM(vote = 0), SUM(vote = 1), SUM(vote = 2)
+              FROM vote_store
+              GROUP BY entry"""
+
+class ConnectionManager:
+    def __init__(self, path: str, *, read_pool_size=4, journal_mode="WAL", synchronous="NORMAL",
+                 busy_timeout=5000, cache_size=-16000, mmap_size=64 * 1024 * 1024, pragmas: dict[str, any] = None,
+                 attach: dict[str, str] = None) -> None:
+        self._path = path
+        self._attach = dict(attach or {})
+        self._pragmas = {
+            "busy_timeout": busy_timeout,
+            "cache_size": cache_size,
+            "mmap_size": mmap_size,
+        }
+        self._pragmas.update(pragmas or {})
+        # a private in-memory database cannot be shared, so every read goes through the writer
+        self._read_pool_size = 0 if path in (":memory:", "") else read_pool_size
+        self._readers = queue.LifoQueue()
+        self._reader_count = 0
+        self._pool_lock = threading.Lock()
+        self._all_readers = []
+
+        self.writer = sqlite3.connect(path, check_same_thread=False)
+        self.writer_lock = threading.RLock()
+        if journal_mode is not None:
+            self.writer.execute(f"PRAGMA journal_mode = {journal_mode}")
+        if synchronous is not None:
+            self.writer.execute(f"PRAGMA synchronous = {synchronous}")
+        self._apply_pragmas(self.writer)
+        # attached on the writer first, so the files exist before a reader opens them read-only
+        for name, attached_path in self._attach.items():
+            self.writer.execute(f"ATTACH DATABASE ? AS {name}", (attached_path,))
+            if journal_mode is not None:
+                self.writer.execute(f"PRAGMA {name}.journal_mode = {journal_mode}")
+
+    def _apply_pragmas(self, connection: sqlite3.Connection):
+        for pragma, value in self._pragmas.items():
+            if value is not None:
+                connection.execute(f"PRAGMA {pragma} = {value}")
+
+    def _open_reader(self) -> sqlite3.Connection:
+        connection = sqlite3.connect(f"file:{quote(self._path)}?mode=ro", uri=True, check_same_thread=False)
+        self.attach_read_only(connection)
+        self._apply_pragmas(connection)
+        connection.execute("PRAGMA query_only = 1")
+        return connection
+
+    def attach_read_only(self, connection: sqlite3.Connection):
+        for name, attached_path in self._attach.items():
+            connection.execute(f"ATTACH DATABASE ? AS {name}", (f"file:{quote(attached_path)}?mode=ro",))
+
+    def open_snapshot_source(self) -> sqlite3.Connection:
+        if self._read_pool_size <= 0:
+            raise ValueError("A read replica needs a database file, an in-memory database cannot be copied from another connection")
+        return self._open_reader()
+
+    @contextmanager
+    def reader(self):
+        if self._read_pool_size <= 0:
+            with self.writer_lock:
+                yield self.writer
+            return
+
+        try:
+            connection = self._readers.get_nowait()
+        except queue.Empty:
+            connection = None
+            with self._pool_lock:
+                if self._reader_count < self._read_pool_size:
+                    self._reader_count += 1
+                    try:
+                        connection = self._open_reader()
+                    except Exception:
+                        self._reader_count -= 1
+                        raise
+                    self._all_readers.append(connection)
+            if connection is None:
+                connection = self._readers.get()
+        try:
+            yield connection
+        finally:
+            self._readers.put(connection)
+
+    def close(self):
+        with self._pool_lock:
+            for connection in self._all_readers:
+                connection.close()
+            self._all_readers.clear()
+            self._reader_count = 0
+            self._readers = queue.LifoQueue()
+        self.writer.close()
+
+class _Snapshot:
+    def __init__(self, origin: sqlite3.Connection, taken, version, *, size, prepare) -> None:
+        self.taken = taken
+        self.version = version
+        self.users = 0
+        self._origin = origin
+        self._size = size
+        self._prepare = prepare
+        self._idle = queue.LifoQueue()
+        self._idle.put(origin)
+        self._all = [origin]
+        self._lock = threading.Lock()
+
+    @contextmanager
+    def connection(self):
+        # a connection runs one read at a time, readers that overlap get their own copy of the snapshot up to size
+        try:
+            connection = self._idle.get_nowait()
+        except queue.Empty:
+            connection = None
+            with self._lock:
+                if len(self._all) < self._size:
+                    connection = self._copy()
+                    self._all.append(connection)
+            if connection is None:
+                connection = self._idle.get()
+        try:
+            yield connection
+        finally:
+            self._idle.put(connection)
+
+    def _copy(self) -> sqlite3.Connection:
+        copy = sqlite3.connect(":memory:", check_same_thread=False)
+        try:
+            self._origin.backup(copy)
+            self._prepare(copy)
+        except BaseException:
+            copy.close()
+            raise
+        return copy
+
+    def close(self):
+        with self._lock:
+            for connection in self._all:
+                connection.close()
+            self._all.clear()
+
+class ReadReplica:
+    def __init__(self, connections: ConnectionManager, *, interval=5.0, refresh_after_commits=None, pages=-1,
+                 readers=2, clock=time.monotonic) -> None:
+        self._connections = connections
+        self._interval = interval
+        self._refresh_after_commits = refresh_after_commits
+        self._pages = pages
+        self._readers = readers
+        self._clock = clock
+        self._source = None
+        self._snapshot = None
+        self._commits = 0
+        # only guards swapping the snapshot and counting its readers, the reads themselves run without it
+        self._lock = threading.Lock()
+        self._refresh_lock = threading.Lock()
+        self._wake = threading.Event()
+        self._thread = None
+        self._running = False
+
+    @property
+    def age(self) -> float:
+        snapshot = self._snapshot
+        return None if snapshot is None else self._clock() - snapshot.taken
+
+    def refresh(self, force=False) -> bool:
+        with self._refresh_lock:
+            started = self._clock()
+            if self._source is None:
+                self._source = self._connections.open_snapshot_source()
+            # data_version only moves when another connection commits, so an unchanged file is not copied again
+            version = self._source.execute("PRAGMA data_version").fetchone()[0]
+            snapshot = self._snapshot
+            if snapshot is not None and version == snapshot.version and not force:
+                snapshot.taken = started
+                return False
+            # the copy is built next to the current one and swapped in, readers never see a half copied database.
+            # with pages=-1 it is taken in one read transaction, which in WAL mode does not block the writer,
+            # a stepped copy restarts whenever the file changes between two steps
+            replica = sqlite3.connect(":memory:", check_same_thread=False)
+            try:
+                self._source.backup(replica, pages=self._pages)
+                self._prepare(replica)
+            except BaseException:
+                replica.close()
+                raise
+            with self._lock:
+                previous = self._snapshot
+                self._snapshot = _Snapshot(replica, started, version, size=self._readers, prepare=self._prepare)
+                self._commits = 0
+                # a snapshot still being read is closed by its last reader
+                if previous is not None and previous.users == 0:
+                    previous.close()
+            return True
+
+    def _prepare(self, connection: sqlite3.Connection):
+        self._connections.attach_read_only(connection)
+        connection.execute("PRAGMA query_only = 1")
+
+    @contextmanager
+    def reader(self, max_staleness):
+        # yields None when the copy is older than the caller accepts, the caller then reads the file instead
+        with self._lock:
+            snapshot = self._snapshot
+            current = snapshot is not None and self._clock() - snapshot.taken <= max_staleness
+            if current:
+                snapshot.users += 1
+        if not current:
+            yield None
+            return
+        try:
+            with snapshot.connection() as connection:
+                yield connection
+        finally:
+            with self._lock:
+                snapshot.users -= 1
+                if snapshot.users == 0 and snapshot is not self._snapshot:
+                    snapshot.close()
+
+    def committed(self):
+        self._commits += 1
+        if self._refresh_after_commits is not None and self._commits >= self._refresh_after_commits:
+            self._wake.set()
+
+    def _run(self):
+        while True:
+            self._wake.wait(self._interval)
+            self._wake.clear()
+            if not self._running:
+                return
+            try:
+                self.refresh()
+            except Exception:
+                logger.exception("Failed to refresh the read replica")
+
+    def start(self):
+        self.refresh()
+        if self._running or (self._interval is None and self._refresh_after_commits is None):
+            return
+        self._running = True
+        self._thread = threading.Thread(target=self._run, name="read-replica", daemon=True)
+        self._thread.start()
+
+    def close(self):
+        self._running = False
+        self._wake.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+        with self._refresh_lock:
+            with self._lock:
+                snapshot, self._snapshot = self._snapshot, None
+                if snapshot is not None and snapshot.users == 0:
+                    snapshot.close()
+            if self._source is not None:
+                self._source.close()
+                self._source = None
+
+class _CommitGroup:
+    def __init__(self) -> None:
+        self.size = 0
+        self.done = threading.Event()
+        self.error = None
 
 class Database:
-    def __init__(self, path: str) -> None:
-        self.connection = sqlite3.connect(path)
+    def __init__(self, path: str, *, read_pool_size=4, journal_mode="WAL", synchronous="NORMAL",
+                 busy_timeout=5000, cache_size=-16000, mmap_size=64 * 1024 * 1024, pragmas: dict[str, any] = None,
+                 group_commit=False, commit_window=0.0, max_batch=64, metrics: Metrics = None, archive_path: str = None,
+                 read_replica=False, replica_interval=5.0, replica_refresh_commits=None, replica_pages=-1,
+                 replica_readers=2) -> None:
+        self._closed = True
+        self._connections = ConnectionManager(path, read_pool_size=read_pool_size, journal_mode=journal_mode,
+                                              synchronous=synchronous, busy_timeout=busy_timeout, cache_size=cache_size,
+                                              mmap_size=mmap_size, pragmas=pragmas,
+                                              attach={"archive": archive_path} if archive_path is not None else None)
+        self.has_archive = archive_path is not None
+        self.connection = self._connections.writer
+        self._lock = self._connections.writer_lock
+        self._group_commit = group_commit
+        self._commit_window = commit_window
+        self._max_batch = max_batch
+        self._group_condition = threading.Condition()
+        self._group = None
+        self._committing = False
+        self._enums = None
+        self._metrics = metrics
+        self._transaction_owner = None
+        self._savepoints = 0
+        self._after_commit = []
+        # reads that accept data up to a few seconds old can be served from an in-memory copy of the file
+        self._replica = None
+        if read_replica:
+            self._replica = ReadReplica(self._connections, interval=replica_interval,
+                                        refresh_after_commits=replica_refresh_commits, pages=replica_pages,
+                                        readers=replica_readers)
+            self._replica.start()
+        self._closed = False
 
     def __del__(self):
         self.close()
 
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
     def create_db(self):
         cursor = self.connection.cursor()
         cursor.execute("""CREATE TABLE IF NOT EXISTS roles(
@@ -80,16 +393,60 @@ class Database:
         cursor.execute("""CREATE INDEX IF NOT EXISTS idx_entry_data_type
                      ON entry_data(type)
             """)
+        cursor.execute("""CREATE INDEX IF NOT EXISTS idx_entry_data_state_deadline
+                     ON entry_data(state, deadline)
+            """)
+        cursor.execute("""CREATE INDEX IF NOT EXISTS idx_entry_data_state_type_deadline
+                     ON entry_data(state, type, deadline)
+            """)
+        cursor.execute("""CREATE INDEX IF NOT EXISTS idx_entry_data_author_deadline
+                     ON entry_data(author, deadline)
+            """)
         
-        cursor.execute("""CREATE TABLE IF NOT EXISTS vote_store(
-                     caster INTEGER REFERENCES user,
-                     entry INTEGER REFERENCES entry_data,
-                     vote TEXT CHECK(vote IN ("approve", "disapprove", "abstain"))
+        legacy_votes = self._has_legacy_votes()
+        # a legacy table left next to the new one was renamed by a run that did not finish copying it
+        migrate_votes = legacy_votes or self.table_exists("vote_store_legacy")
+        if migrate_votes:
+            self.execute("SAVEPOINT migrate_votes")
+        try:
+            if legacy_votes:
+                self.execute("ALTER TABLE vote_store RENAME TO vote_store_legacy")
+            cursor.execute("""CREATE TABLE IF NOT EXISTS vote_store(
+                         entry INTEGER REFERENCES entry_data,
+                         caster INTEGER REFERENCES user,
+                         vote INTEGER NOT NULL CHECK(vote IN (0, 1, 2)),
+                         PRIMARY KEY(entry, caster)
+                         ) WITHOUT ROWID
+                """)
+            if migrate_votes:
+                # the old table kept every vote ever cast, only the latest one per caster and entry is carried over,
+                # rows without an entry, a caster or a known vote cannot be keyed or counted and are dropped
+                self.execute("""INSERT OR IGNORE INTO vote_store (entry, caster, vote)
+                             SELECT entry, caster, CASE vote WHEN 'approve' THEN 0 WHEN 'disapprove' THEN 1 ELSE 2 END
+                             FROM (SELECT entry, caster, vote, MAX(rowid) FROM vote_store_legacy
+                                   WHERE entry IS NOT NULL AND caster IS NOT NULL AND vote IN ('approve', 'disapprove', 'abstain')
+                                   GROUP BY entry, caster)
+                    """)
+                self.execute("DROP TABLE vote_store_legacy")
+        except BaseException:
+            if migrate_votes:
+                # the rename is undone too, the next start finds the legacy table as it was and tries again
+                self.execute("ROLLBACK TO migrate_votes")
+                self.execute("RELEASE migrate_votes")
+            raise
+        if migrate_votes:
+            self.execute("RELEASE migrate_votes")
+
+        rebuild_tallies = migrate_votes or not self.table_exists("vote_tally")
+        cursor.execute("""CREATE TABLE IF NOT EXISTS vote_tally(
+                     entry INTEGER PRIMARY KEY REFERENCES entry_data,
+                     approve INTEGER NOT NULL DEFAULT 0,
+                     disapprove INTEGER NOT NULL DEFAULT 0,
+                     abstain INTEGER NOT NULL DEFAULT 0
                      )
             """)
-        cursor.execute("""CREATE INDEX IF NOT EXISTS idx_vote
-                     ON vote_store(entry)
-            """)
+        if rebuild_tallies:
+            self.rebuild_tallies()
         
         cursor.execute("""CREATE TABLE IF NOT EXISTS repeal_store(
                      entry_id INTEGER PRIMARY KEY,
@@ -97,6 +454,102 @@ class Database:
                      FOREIGN KEY(entry_id) REFERENCES entry_data
                      )
             """)
+        cursor.execute("""CREATE INDEX IF NOT EXISTS idx_repeal_repealed
+                     ON repeal_store(repealed_id)
+            """)
+
+        # completed resolutions that passed and were not repealed since
+        rebuild_laws = not self.table_exists("laws_in_force")
+        cursor.execute("""CREATE TABLE IF NOT EXISTS laws_in_force(
+                     entry_id INTEGER PRIMARY KEY,
+                     enacted INTEGER
+                     )
+            """)
+
+        cursor.execute("""CREATE TABLE IF NOT EXISTS election_data(
+                     entry_id INTEGER PRIMARY KEY REFERENCES entry_data,
+                     method TEXT CHECK(method IN ("plurality", "instant-runoff", "stv")),
+                     seats INTEGER NOT NULL DEFAULT 1
+                     )
+            """)
+        cursor.execute("""CREATE TABLE IF NOT EXISTS election_candidates(
+                     election INTEGER REFERENCES entry_data,
+                     position INTEGER,
+                     candidate INTEGER REFERENCES user,
+                     PRIMARY KEY(election, position)
+                     ) WITHOUT ROWID
+            """)
+        cursor.execute("""CREATE TABLE IF NOT EXISTS election_ballots(
+                     election INTEGER REFERENCES entry_data,
+                     elector INTEGER REFERENCES user,
+                     ranking BLOB NOT NULL,
+                     PRIMARY KEY(election, elector)
+                     ) WITHOUT ROWID
+            """)
+
+        cursor.execute("""CREATE TABLE IF NOT EXISTS change_log(
+                     version INTEGER PRIMARY KEY AUTOINCREMENT,
+                     kind TEXT NOT NULL,
+                     key INTEGER,
+                     changed INTEGER NOT NULL DEFAULT (CAST(strftime('%s', 'now') AS INTEGER))
+                     )
+            """)
+        cursor.execute("""CREATE INDEX IF NOT EXISTS idx_change_log_changed
+                     ON change_log(changed)
+            """)
+
+        cursor.execute("""CREATE TABLE IF NOT EXISTS event_outbox(
+                     id INTEGER PRIMARY KEY AUTOINCREMENT,
+                     kind TEXT NOT NULL,
+                     entry INTEGER,
+                     payload TEXT,
+                     created INTEGER NOT NULL DEFAULT (CAST(strftime('%s', 'now') AS INTEGER))
+                     )
+            """)
+        cursor.execute("""CREATE TABLE IF NOT EXISTS event_cursor(
+                     consumer TEXT PRIMARY KEY,
+                     position INTEGER NOT NULL
+                     ) WITHOUT ROWID
+            """)
+
+        if self.has_archive:
+            self._create_archive(cursor)
+
+        if rebuild_laws:
+            self.rebuild_laws()
+
+        if self.supports_fts5():
+            rebuild_search = not self.table_exists("entry_search")
+            cursor.execute("""CREATE VIRTUAL TABLE IF NOT EXISTS entry_search USING fts5(
+                         title, content,
+                         content = 'entry_data', content_rowid = 'id',
+                         tokenize = 'unicode61 remove_diacritics 2'
+                         )
+                """)
+            cursor.execute("""CREATE TRIGGER IF NOT EXISTS entry_search_insert AFTER INSERT ON entry_data BEGIN
+                         INSERT INTO entry_search (rowid, title, content) VALUES(new.id, new.title, new.content);
+                         END
+                """)
+            cursor.execute("""CREATE TRIGGER IF NOT EXISTS entry_search_delete AFTER DELETE ON entry_data BEGIN
+                         INSERT INTO entry_search (entry_search, rowid, title, content) VALUES('delete', old.id, old.title, old.content);
+                         END
+                """)
+            cursor.execute("""CREATE TRIGGER IF NOT EXISTS entry_search_update AFTER UPDATE OF title, content ON entry_data BEGIN
+                         INSERT INTO entry_search (entry_search, rowid, title, content) VALUES('delete', old.id, old.title, old.content);
+                         INSERT INTO entry_search (rowid, title, content) VALUES(new.id, new.title, new.content);
+                         END
+                """)
+            if self.has_archive:
+                # archived content is stored compressed, so this index keeps its own copy of the text.
+                # the archive system adds entries to it as it moves them, triggers cannot reach another file
+                rebuild_search = rebuild_search or not self.table_exists("entry_search", "archive")
+                cursor.execute("""CREATE VIRTUAL TABLE IF NOT EXISTS archive.entry_search USING fts5(
+                             title, content,
+                             tokenize = 'unicode61 remove_diacritics 2'
+                             )
+                    """)
+            if rebuild_search:
+                self.rebuild_search()
         
         self.insert("state_types", {"state": "proposed"}, ignore=True)
         self.insert("state_types", {"state": "denied"}, ignore=True)
@@ -117,12 +570,172 @@ class Database:
 
         cursor.close()
         self.commit()
+        self._enums = None
+        # the first copy was taken before the schema existed
+        if self._replica is not None:
+            self._replica.refresh(force=True)
+
+    @property
+    def enums(self) -> Enums:
+        # roles, entry types and states never change after create_db, so they are read once
+        if self._enums is None:
+            self._enums = Enums(
+                EnumMap("roles", self.query("SELECT id, role FROM roles")),
+                EnumMap("entry_types", self.query("SELECT id, type FROM entry_types")),
+                EnumMap("state_types", self.query("SELECT id, state FROM state_types")),
+            )
+        return self._enums
+
+    def _create_archive(self, cursor: sqlite3.Cursor):
+        # finished entries moved out of the hot tables, content is stored zlib compressed
+        cursor.execute("""CREATE TABLE IF NOT EXISTS archive.entry_data(
+                     id INTEGER PRIMARY KEY,
+                     type INTEGER,
+                     state INTEGER,
+                     role INTEGER,
+                     author INTEGER,
+                     creation_date INTEGER,
+                     deadline INTEGER,
+                     title TEXT,
+                     content BLOB,
+                     archived INTEGER
+                     )
+            """)
+        cursor.execute("""CREATE TABLE IF NOT EXISTS archive.vote_store(
+                     entry INTEGER,
+                     caster INTEGER,
+                     vote INTEGER NOT NULL,
+                     PRIMARY KEY(entry, caster)
+                     ) WITHOUT ROWID
+            """)
+        cursor.execute("""CREATE TABLE IF NOT EXISTS archive.vote_tally(
+                     entry INTEGER PRIMARY KEY,
+                     approve INTEGER NOT NULL DEFAULT 0,
+                     disapprove INTEGER NOT NULL DEFAULT 0,
+                     abstain INTEGER NOT NULL DEFAULT 0
+                     )
+            """)
+        cursor.execute("""CREATE TABLE IF NOT EXISTS archive.repeal_store(
+                     entry_id INTEGER PRIMARY KEY,
+                     repealed_id INTEGER
+                     )
+            """)
+        cursor.execute("""CREATE INDEX IF NOT EXISTS archive.idx_repeal_repealed
+                     ON repeal_store(repealed_id)
+            """)
+
+    def vacuum_archive(self):
+        # VACUUM cannot run inside a transaction
+        with self._lock:
+            self._commit()
+            self._run(self.connection, "VACUUM archive", ())
+
+    def _has_legacy_votes(self) -> bool:
+        columns = {row[1]: row[2] for row in self.query("PRAGMA table_info(vote_store)")}
+        return columns.get("vote", "").upper() == "TEXT"
+
+    def table_exists(self, table: str, schema = "main") -> bool:
+        return self.query_once(f"SELECT 1 FROM {schema}.sqlite_master WHERE type = 'table' AND name = ?", table) is not None
+
+    def supports_fts5(self) -> bool:
+        try:
+            self.execute("CREATE VIRTUAL TABLE IF NOT EXISTS temp.fts5_probe USING fts5(probe)")
+            self.execute("DROP TABLE temp.fts5_probe")
+        except sqlite3.OperationalError:
+            return False
+        return True
+
+    def rebuild_search(self):
+        self.execute("INSERT INTO entry_search (entry_search) VALUES('rebuild')")
+        if self.has_archive and self.table_exists("entry_search", "archive"):
+            self.execute("DELETE FROM archive.entry_search")
+            rows = self.connection.execute("SELECT id, title, content FROM archive.entry_data")
+            self.execute_many("INSERT INTO archive.entry_search (rowid, title, content) VALUES(?, ?, ?)",
+                              ((id, title, None if content is None else zlib.decompress(content).decode())
+                               for id, title, content in rows))
+
+    def rebuild_tallies(self):
+        self.execute("DELETE FROM vote_tally")
+        self.execute(f"INSERT INTO vote_tally (entry, approve, disapprove, abstain) {TALLY_QUERY}")
+
+    @contextmanager
+    def deferred_indexes(self, tables):
+        # secondary indexes and triggers are dropped for a bulk load and built once at the end,
+        # the implicit indexes of primary keys and unique columns stay and keep enforcing their constraints
+        keys = ", ".join(["?"] * len(tables))
+        deferred = self.query(f"""SELECT type, name, sql FROM sqlite_master
+                              WHERE type IN ('index', 'trigger') AND tbl_name IN ({keys}) AND sql IS NOT NULL
+                              ORDER BY type
+            """, *tables)
+        for type, name, _ in deferred:
+            self.execute(f"DROP {type.upper()} IF EXISTS {name}")
+        self.commit()
+        try:
+            yield
+        finally:
+            for _, _, sql in deferred:
+                self.execute(sql)
+            if any(name.startswith("entry_search") for _, name, _ in deferred):
+                # writes made while the search triggers were gone are not in the index yet
+                self.rebuild_search()
+            self.commit()
+
+    def log_change(self, kind: str, key = None):
+        # written in the same transaction as the change itself, other processes tail it to invalidate their caches
+        self.execute("INSERT INTO change_log (kind, key) VALUES(?, ?)", kind, key)
+
+    def append_event(self, kind: str, entry = None, payload: dict = None):
+        # like log_change, part of the caller's transaction so an event exists exactly when its change does
+        self.execute("INSERT INTO event_outbox (kind, entry, payload) VALUES(?, ?, ?)",
+                     kind, entry, None if payload is None else json.dumps(payload))
+
+    def rebuild_laws(self):
+        self.execute("DELETE FROM laws_in_force")
+        sources = [("entry_data", "vote_tally")]
+        if self.has_archive:
+            sources.append(("archive.entry_data", "archive.vote_tally"))
+        for entries, tallies in sources:
+            self.execute(f"""INSERT OR IGNORE INTO laws_in_force (entry_id, enacted)
+                         SELECT e.id, e.deadline FROM {entries} AS e JOIN {tallies} AS t ON t.entry = e.id
+                         WHERE e.type = (SELECT id FROM entry_types WHERE type = 'resolution')
+                         AND e.state IN (SELECT id FROM state_types WHERE state IN ('completed', 'completed early'))
+                         AND t.approve > t.disapprove
+                """)
 
     def close(self):
-        self.connection.close()
+        if self._closed:
+            return
+        self._closed = True
+        if self._replica is not None:
+            self._replica.close()
+        self._connections.close()
+
+    def _run(self, connection: sqlite3.Connection, statement: str, params, fetch = None):
+        if self._metrics is None:
+            cursor = connection.execute(statement, params)
+            return cursor if fetch is None else fetch(cursor)
+        start = time.perf_counter()
+        cursor = connection.execute(statement, params)
+        if fetch is None:
+            result, rows = cursor, max(cursor.rowcount, 0)
+        else:
+            result = fetch(cursor)
+            rows = len(result) if isinstance(result, list) else int(result is not None)
+        self._metrics.observe_query(statement, time.perf_counter() - start, rows)
+        return result
 
     def execute(self, sql_command: str, *args):
-        return self.connection.execute(sql_command, args)
+        with self._lock:
+            return self._run(self.connection, sql_command, args)
+
+    def execute_many(self, sql_command: str, rows):
+        with self._lock:
+            if self._metrics is None:
+                return self.connection.executemany(sql_command, rows)
+            start = time.perf_counter()
+            cursor = self.connection.executemany(sql_command, rows)
+            self._metrics.observe_query(sql_command, time.perf_counter() - start, max(cursor.rowcount, 0))
+            return cursor
 
     def insert(self, table: str, data: Union[dict[str, any], tuple[any]], *, ignore=False):
         ph_string = ", ".join(["?"] * len(data))
@@ -136,12 +749,123 @@ class Database:
         pass
 
     def query(self, query_statement: str, *params):
-        result = self.execute(query_statement, *params)
-        return result.fetchall()
+        with self._lock:
+            return self._run(self.connection, query_statement, params, sqlite3.Cursor.fetchall)
     
     def query_once(self, query_statement: str, *params):
-        result = self.execute(query_statement, *params)
-        return result.fetchone()
+        with self._lock:
+            return self._run(self.connection, query_statement, params, sqlite3.Cursor.fetchone)
+
+    def in_transaction(self) -> bool:
+        return self._transaction_owner == threading.get_ident()
+
+    @contextmanager
+    def transaction(self):
+        # the writer stays locked until the outermost transaction ends, commit() calls inside it are deferred
+        # and nested transactions become savepoints that can be rolled back on their own
+        with self._lock:
+            if self.in_transaction():
+                self._savepoints += 1
+                savepoint = f"transaction_{self._savepoints}"
+                callbacks = len(self._after_commit)
+                self.connection.execute(f"SAVEPOINT {savepoint}")
+                try:
+                    yield self
+                except BaseException:
+                    self.connection.execute(f"ROLLBACK TO {savepoint}")
+                    self.connection.execute(f"RELEASE {savepoint}")
+                    del self._after_commit[callbacks:]
+                    raise
+                else:
+                    self.connection.execute(f"RELEASE {savepoint}")
+                finally:
+                    self._savepoints -= 1
+                return
+
+            group = self._group_commit
+            if self.connection.in_transaction and not group:
+                # statements left uncommitted by someone else are not rolled back with this transaction
+                self._commit()
+            began = not self.connection.in_transaction
+            if began:
+                self.connection.execute("BEGIN IMMEDIATE")
+            if group:
+                # with group commit the transaction is a savepoint on top of the work already waiting for the next
+                # commit, a failure only rolls back its own statements and a success joins the group once the
+                # writer is released, so a leader never commits it halfway
+                self.connection.execute("SAVEPOINT transaction_0")
+            self._transaction_owner = threading.get_ident()
+            try:
+                yield self
+                if group:
+                    self.connection.execute("RELEASE transaction_0")
+                else:
+                    self._commit()
+            except BaseException:
+                if began:
+                    self.connection.rollback()
+                else:
+                    self.connection.execute("ROLLBACK TO transaction_0")
+                    self.connection.execute("RELEASE transaction_0")
+                self._after_commit.clear()
+                raise
+            finally:
+                self._transaction_owner = None
+            callbacks, self._after_commit = self._after_commit, []
+        if group:
+            self.commit()
+        for callback in callbacks:
+            callback()
+
+    def after_commit(self, callback):
+        if self.in_transaction():
+            self._after_commit.append(callback)
+        else:
+            callback()
+
+    @property
+    def replica(self) -> ReadReplica:
+        return self._replica
+
+    @contextmanager
+    def _reader(self, max_staleness=None):
+        # inside a transaction reads go through the writer, so they see the transaction's own changes
+        if self.in_transaction():
+            yield self.connection
+            return
+        if max_staleness is not None and self._replica is not None:
+            with self._replica.reader(max_staleness) as connection:
+                if connection is not None:
+                    yield connection
+                    return
+        with self._connections.reader() as connection:
+            yield connection
+
+    def read_query_many(self, query_statement: str, keys, *params, chunk_size=900, max_staleness=None):
+        # query_statement holds an "{keys}" placeholder that is expanded to one "?" per key
+        keys = list(keys)
+        rows = []
+        for start in range(0, len(keys), chunk_size):
+            chunk = keys[start:start + chunk_size]
+            statement = query_statement.format(keys=", ".join(["?"] * len(chunk)))
+            rows.extend(self.read_query(statement, *params, *chunk, max_staleness=max_staleness))
+        return rows
+
+    def read_query(self, query_statement: str, *params, max_staleness=None):
+        # max_staleness is how many seconds old the data may be, only then the read replica is used
+        with self._reader(max_staleness) as connection:
+            return self._run(connection, query_statement, params, sqlite3.Cursor.fetchall)
+
+    def read_query_once(self, query_statement: str, *params, max_staleness=None):
+        with self._reader(max_staleness) as connection:
+            return self._run(connection, query_statement, params, sqlite3.Cursor.fetchone)
+
+    def iter_query(self, query_statement: str, *params, batch_size=1000):
+        # rows are fetched batch_size at a time, the reader stays checked out until the generator is exhausted or closed
+        with self._reader() as connection:
+            cursor = self._run(connection, query_statement, params)
+            while rows := cursor.fetchmany(batch_size):
+                yield from rows
     
     #doesnt work!!!
     def update(self, table: str, update_dict: dict[str, any], where_string: str):
@@ -152,7 +876,63 @@ class Database:
             args_list.append(field, value)
         self.execute(f"UPDATE {table} SET {set_string} WHERE {where_string}", args_list)
         
+    def _commit(self):
+        with self._lock:
+            if self._metrics is None:
+                self.connection.commit()
+            else:
+                start = time.perf_counter()
+                self.connection.commit()
+                self._metrics.observe_commit(time.perf_counter() - start)
+            if self._replica is not None:
+                self._replica.committed()
+
     def commit(self):
-        self.connection.commit()   
+        if self.in_transaction():
+            return
+        if not self._group_commit:
+            self._commit()
+            return
+
+        # callers arriving while a commit is in flight (or within the window) join one group,
+        # the first of them commits for everyone and each caller returns once it is durable
+        with self._group_condition:
+            group = self._group
+            leader = group is None
+            if leader:
+                group = self._group = _CommitGroup()
+            group.size += 1
+            if group.size >= self._max_batch:
+                self._group_condition.notify_all()
+            if leader:
+                self._group_condition.wait_for(lambda: not self._committing)
+                if self._commit_window > 0:
+                    self._group_condition.wait_for(lambda: group.size >= self._max_batch, self._commit_window)
+                self._group = None
+                self._committing = True
+
+        if leader:
+            try:
+                self._commit()
+            except Exception as error:
+                group.error = error
+            finally:
+                with self._group_condition:
+                    self._committing = False
+                    self._group_condition.notify_all()
+                group.done.set()
+        else:
+            group.done.wait()
+
+        if group.error is not None:
+            raise group.error
+
+class Repository:
+    def transaction(self):
+        return self._db.transaction()
 
+    def in_transaction(self) -> bool:
+        return self._db.in_transaction()
 
+    def after_commit(self, callback):
+        self._db.after_commit(callback)
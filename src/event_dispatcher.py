@@ -0,0 +1,99 @@
+import asyncio
+import logging
+
+from async_database import AsyncDatabase
+from systems.event_system import Event, EventRepository
+
+logger = logging.getLogger(__name__)
+
+class EventDispatcher:
+    def __init__(self, repository: EventRepository, executor: AsyncDatabase, *, consumer = "discord",
+                 batch_size = 100, interval = 1.0, retry_delay = 5.0) -> None:
+        self._repository = repository
+        self._executor = executor
+        self._consumer = consumer
+        self._batch_size = batch_size
+        self._interval = interval
+        self._retry_delay = retry_delay
+        self._subscribers = []
+        self._position = None
+        self._wake = None
+        self._loop = None
+        self._task = None
+
+    @property
+    def position(self):
+        return self._position
+
+    def subscribe(self, callback, kinds = None):
+        # callback is awaited with every Event of the given kinds, in outbox order
+        self._subscribers.append((callback, None if kinds is None else frozenset(kinds)))
+
+    def unsubscribe(self, callback):
+        self._subscribers = [(subscriber, kinds) for subscriber, kinds in self._subscribers if subscriber is not callback]
+
+    def notify(self):
+        # safe to call from any thread, e.g. an EntryLogic listener, to deliver without waiting for the next poll
+        if self._loop is not None and self._wake is not None:
+            self._loop.call_soon_threadsafe(self._wake.set)
+
+    async def _deliver(self, event: Event):
+        for callback, kinds in list(self._subscribers):
+            if kinds is None or event.kind in kinds:
+                await callback(event)
+
+    async def dispatch_pending(self) -> int:
+        if self._position is None:
+            self._position = await self._executor.run(self._repository.get_cursor, self._consumer)
+        delivered = 0
+        while True:
+            events = await self._executor.run(self._repository.get_events, self._position, self._batch_size)
+            if not events:
+                return delivered
+            try:
+                for event in events:
+                    await self._deliver(event)
+                    self._position = event.id
+                    delivered += 1
+            finally:
+                # the cursor is stored per batch, after a crash at most one batch is delivered again
+                await self._executor.run(self._repository.set_cursor, self._consumer, self._position)
+            if len(events) < self._batch_size:
+                return delivered
+
+    async def run(self):
+        self._loop = asyncio.get_running_loop()
+        self._wake = asyncio.Event()
+        while True:
+            delay = self._interval
+            try:
+                await self.dispatch_pending()
+            except asyncio.CancelledError:
+                raise
+            except Exception:
+                # ordering is kept by retrying the failed event before anything after it
+                logger.exception("Failed to deliver event after %s to %s", self._position, self._consumer)
+                delay = self._retry_delay
+            try:
+                await asyncio.wait_for(self._wake.wait(), delay)
+            except asyncio.TimeoutError:
+                pass
+            self._wake.clear()
+
+    def start(self) -> asyncio.Task:
+        if self._task is None or self._task.done():
+            self._task = asyncio.get_running_loop().create_task(self.run())
+        return self._task
+
+    async def stop(self):
+        if self._task is None:
+            return
+        self._task.cancel()
+        try:
+            await self._task
+        except asyncio.CancelledError:
+            pass
+        self._task = None
+
+    async def prune(self) -> int:
+        return await self._executor.run(self._repository.prune)
@@ -10,6 +10,10 @@ class AmbassadorLogicAlreadyRegisteredError(AmbassadorError):
 
 class AmbassadorOperationNotSupportedError(AmbassadorError):
     """Raised when an unsupported operation is attempted on a given entry"""
+
+class AmbassadorUnknownValueError(AmbassadorError):
+    """Raised when a role, entry type or state name (or id) does not exist"""
+
 class EntryError(AmbassadorError):
     """Base class for all entry related exceptions."""
     pass
@@ -53,5 +57,17 @@ class VoteError(AmbassadorError):
 class VoteNotDoneError(VoteError):
     """Raised when an operation is attempted on a vote that was not completed"""
 
+class VoteInvalidError(VoteError):
+    """Raised when a vote is cast with an option that does not exist"""
+
 class VoteAlreadyDoneError(VoteError):
-    """Raised when an operation is attempted on a vote which was already completed"""
\ No newline at end of file
+    """Raised when an operation is attempted on a vote which was already completed"""
+
+class ElectionError(AmbassadorError):
+    """Base class for all election related exceptions."""
+
+class ElectionInvalidBallotError(ElectionError):
+    """Raised when a ballot names unknown candidates or ranks a candidate twice"""
+
+class ElectionNotDoneError(ElectionError):
+    """Raised when the result of an election that has not been completed is requested"""
\ No newline at end of file
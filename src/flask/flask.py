@@ -0,0 +1,216 @@
+import os
+import sys
+
+# run as a script this directory is sys.path[0], which would shadow the flask package and hide the src modules
+_directory = os.path.dirname(os.path.abspath(__file__))
+if sys.path and os.path.abspath(sys.path[0] or os.curdir) == _directory:
+    sys.path[0] = os.path.dirname(_directory)
+
+from typing import NamedTuple
+import argparse
+import gzip
+import hashlib
+import json
+
+from flask import Flask, Response, request
+
+from ambassador import Ambassador
+from database import Database
+from exceptions import *
+from utils.cache import Cache
+from systems.change_system import ChangeLogRepository, ChangeLogTailer
+from systems.entry_system import EntryRepository, EntryLogic
+from systems.election_system import ElectionRepository, ElectionLogic
+from systems.internal.user_system import UserRepository, UserLogic
+from systems.internal.vote_system import VoteRepository, VoteLogic
+from systems.repeal_system import RepealRepository, RepealLogic
+
+# bodies smaller than this are sent as they are, gzip would barely shrink them
+GZIP_MIN_SIZE = 1024
+
+class Rendered(NamedTuple):
+    body: bytes
+    etag: str
+    gzipped: bytes
+
+def render(data, compress = False) -> Rendered:
+    body = json.dumps(data, separators=(",", ":")).encode()
+    etag = hashlib.blake2b(body, digest_size=12).hexdigest()
+    gzipped = gzip.compress(body, 6) if compress and len(body) >= GZIP_MIN_SIZE else None
+    return Rendered(body, etag, gzipped)
+
+def format_cursor(cursor) -> str:
+    if cursor is None:
+        return None
+    # an entry without a deadline is written as "null"
+    return f"{'null' if cursor[0] is None else cursor[0]}:{cursor[1]}"
+
+def parse_cursor(cursor: str):
+    if not cursor:
+        return None
+    deadline, _, id = cursor.partition(":")
+    if deadline == "null":
+        return None, int(id)
+    # deadlines written from time.time() keep their fraction
+    return (float(deadline) if "." in deadline else int(deadline)), int(id)
+
+def _int_list(value: str) -> list[int]:
+    return [int(item) for item in value.split(",") if item]
+
+def _error(status, message):
+    response = Response(json.dumps({"error": message}), status=status, mimetype="application/json")
+    response.headers["Cache-Control"] = "no-store"
+    return response
+
+def create_app(ambassador: Ambassador, tailer: ChangeLogTailer = None, *, cache_size = 4096, ttl = None,
+               page_size = 50, max_page_size = 200) -> Flask:
+    app = Flask(__name__)
+    # without a tailer nothing tells us about writes from other processes, so renders only live briefly
+    ttl = ttl if ttl is not None else (300 if tailer is not None else 5)
+    renders = Cache(max_size=cache_size, ttl=ttl)
+    pages = Cache(max_size=cache_size, ttl=ttl)
+
+    if tailer is not None:
+        def invalidator(*names, lists = False):
+            def invalidate(key):
+                if key is None:
+                    renders.clear_cache()
+                else:
+                    for name in names:
+                        renders.clear_cache((name, key))
+                if lists:
+                    pages.clear_cache()
+            return invalidate
+
+        tailer.subscribe("entry", invalidator("entry", lists=True))
+        tailer.subscribe("vote", invalidator("tally", "votes"))
+        tailer.subscribe("user", invalidator("user", lists=True))
+        tailer.subscribe("repeal", invalidator("repeal"))
+
+        @app.before_request
+        def poll_changes():
+            tailer.poll()
+
+    def respond(rendered: Rendered):
+        if request.if_none_match.contains_weak(rendered.etag):
+            response = Response(status=304)
+        else:
+            response = Response(rendered.body, mimetype="application/json")
+            if rendered.gzipped is not None and "gzip" in request.accept_encodings:
+                response.set_data(rendered.gzipped)
+                response.headers["Content-Encoding"] = "gzip"
+        # the body is identical for both encodings, so the etag is weak
+        response.set_etag(rendered.etag, weak=True)
+        response.headers["Cache-Control"] = "no-cache"
+        response.vary.add("Accept-Encoding")
+        return response
+
+    def cached(key, build, compress = False, cache = renders):
+        return respond(cache.get(key, lambda: render(build(), compress)))
+
+    @app.errorhandler(EntryNotFoundError)
+    @app.errorhandler(UserNotFoundError)
+    @app.errorhandler(AmbassadorOperationNotSupportedError)
+    def not_found(error):
+        return _error(404, str(error))
+
+    @app.errorhandler(AmbassadorUnknownValueError)
+    @app.errorhandler(ValueError)
+    def bad_request(error):
+        return _error(400, str(error))
+
+    @app.get("/entries")
+    def list_entries():
+        args = request.args
+        limit = min(args.get("limit", page_size, type=int), max_page_size)
+        if limit <= 0:
+            raise ValueError("limit must be positive")
+        key = ("entries", args.get("cursor"), limit, tuple(args.getlist("state")), tuple(args.getlist("type")),
+               tuple(args.getlist("author", type=int)), args.get("deadline_from", type=float), args.get("deadline_to", type=float))
+
+        def build():
+            page = ambassador.list_entries(state=args.getlist("state") or None, type=args.getlist("type") or None,
+                                           author=args.getlist("author", type=int) or None,
+                                           deadline_from=key[6], deadline_to=key[7],
+                                           after=parse_cursor(args.get("cursor")), limit=limit)
+            return {"entries": [header._asdict() for header in page.entries], "next_cursor": format_cursor(page.next_cursor)}
+        return cached(key, build, compress=True, cache=pages)
+
+    @app.get("/entries/<int:entry_id>")
+    def get_entry(entry_id):
+        return cached(("entry", entry_id), lambda: ambassador.get_entry_proxy(entry_id).info._asdict())
+
+    @app.get("/entries/<int:entry_id>/tally")
+    def get_tally(entry_id):
+        def build():
+            tally = ambassador.get_vote_proxy(entry_id).tally
+            return dict(tally._asdict(), total=tally.total, verdict=tally.get_current_verdict())
+        return cached(("tally", entry_id), build)
+
+    @app.get("/entries/<int:entry_id>/votes")
+    def get_votes(entry_id):
+        def build():
+            vote = ambassador.get_vote_proxy(entry_id).info
+            return {"entry_id": vote.entry_id, "votes": {str(caster): choice for caster, choice in vote.votes.items()}}
+        return cached(("votes", entry_id), build, compress=True)
+
+    @app.get("/entries/<int:entry_id>/repeal")
+    def get_repeal(entry_id):
+        def build():
+            if ambassador.get_entry_proxy(entry_id).info.type != "repeal":
+                raise AmbassadorOperationNotSupportedError(f"The entry with id \"{entry_id}\" is not a repeal")
+            return ambassador.get_repeal_target(entry_id)._asdict()
+        return cached(("repeal", entry_id), build)
+
+    @app.get("/users")
+    def get_users():
+        ids = _int_list(request.args.get("ids", ""))
+        if not ids or len(ids) > max_page_size:
+            raise ValueError(f"ids must list between 1 and {max_page_size} user ids")
+        key = ("users", tuple(sorted(set(ids))))
+
+        def build():
+            users = ambassador.get_users(key[1])
+            return {"users": [users[id]._asdict() for id in key[1] if id in users]}
+        return cached(key, build, compress=True, cache=pages)
+
+    @app.get("/users/<int:user_id>")
+    def get_user(user_id):
+        return cached(("user", user_id), lambda: ambassador.get_user_proxy(user_id).info._asdict())
+
+    return app
+
+def create_stack(db: Database) -> tuple[Ambassador, ChangeLogTailer]:
+    entry_logic = EntryLogic(EntryRepository(db))
+    user_logic = UserLogic(UserRepository(db))
+    vote_logic = VoteLogic(VoteRepository(db), user_logic, entry_logic)
+    repeal_logic = RepealLogic(RepealRepository(db), vote_logic, entry_logic)
+    election_logic = ElectionLogic(ElectionRepository(db), user_logic, entry_logic)
+
+    ambassador = Ambassador(entry_logic, entry_logic, user_logic)
+    ambassador.register_logic(vote_logic, "resolution")
+    ambassador.register_logic(repeal_logic, "repeal")
+    ambassador.register_logic(election_logic, "election")
+
+    tailer = ChangeLogTailer(ChangeLogRepository(db))
+    tailer.subscribe("entry", entry_logic.invalidate)
+    tailer.subscribe("user", user_logic.invalidate)
+    tailer.subscribe("vote", vote_logic.invalidate)
+    tailer.subscribe("repeal", repeal_logic.invalidate)
+    tailer.subscribe("election", election_logic.invalidate)
+    return ambassador, tailer
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Read-only HTTP API over the ambassador database")
+    parser.add_argument("--db", required=True, help="path to the sqlite database")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=5000)
+    args = parser.parse_args(argv)
+
+    db = Database(args.db)
+    db.create_db()
+    ambassador, tailer = create_stack(db)
+    create_app(ambassador, tailer).run(host=args.host, port=args.port, threaded=True)
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,118 @@
+from contextlib import nullcontext
+import argparse
+import sys
+
+from database import Database
+from systems.archive_system import ArchiveRepository, ArchiveLogic
+from systems.internal.vote_system import VoteRepository
+from systems.repeal_system import RepealRepository
+from systems.transfer_system import COLUMNS, TransferRepository, TransferLogic, read_csv, read_jsonl, write_csv, write_jsonl
+
+def tallies_command(db: Database, args):
+    repository = VoteRepository(db)
+    if args.rebuild:
+        repository.rebuild_tallies()
+        print("Rebuilt vote tallies from vote_store")
+    mismatched = repository.verify_tallies()
+    if mismatched:
+        print(f"{len(mismatched)} tallies do not match vote_store: {', '.join(map(str, mismatched))}")
+        return 1
+    print("All vote tallies match vote_store")
+    return 0
+
+def search_command(db: Database, args):
+    if not db.table_exists("entry_search"):
+        print("sqlite was built without fts5, there is no search index to rebuild")
+        return 1
+    db.rebuild_search()
+    db.commit()
+    print("Rebuilt the entry search index from entry_data")
+    return 0
+
+def laws_command(db: Database, args):
+    repository = RepealRepository(db)
+    repository.rebuild_laws()
+    print(f"Rebuilt the laws in force, {len(repository.get_laws_in_force())} resolutions are in force")
+    return 0
+
+def _format(args):
+    return args.format or ("csv" if args.path.endswith(".csv") else "jsonl")
+
+def _open(path, mode):
+    if path == "-":
+        return nullcontext(sys.stdin if mode == "r" else sys.stdout)
+    return open(path, mode, encoding="utf-8", newline="")
+
+def import_command(db: Database, args):
+    read = read_csv if _format(args) == "csv" else read_jsonl
+    with _open(args.path, "r") as stream:
+        imported = TransferLogic(TransferRepository(db)).import_records(args.kind, read(stream), batch_size=args.batch_size,
+                                                                         defer_indexes=args.defer_indexes)
+    print(f"Imported {imported} {args.kind}", file=sys.stderr)
+    return 0
+
+def export_command(db: Database, args):
+    write = write_csv if _format(args) == "csv" else write_jsonl
+    with _open(args.path, "w") as stream:
+        exported = write(stream, COLUMNS[args.kind], TransferLogic(TransferRepository(db)).export_records(args.kind))
+    print(f"Exported {exported} {args.kind}", file=sys.stderr)
+    return 0
+
+def archive_command(db: Database, args):
+    if not db.has_archive:
+        print("--archive is required to move entries into an archive database")
+        return 1
+    logic = ArchiveLogic(ArchiveRepository(db))
+    archived = logic.archive(older_than=args.older_than * 86400, batch_size=args.batch_size)
+    print(f"Archived {archived} entries, {logic.count()} entries are in the archive")
+    if args.vacuum:
+        logic.vacuum()
+        print("Vacuumed the archive database")
+    return 0
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Maintenance commands for the ambassador database")
+    parser.add_argument("--db", required=True, help="path to the sqlite database")
+    parser.add_argument("--archive", help="path to the archive database attached next to it")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    tallies = commands.add_parser("tallies", help="verify (and optionally rebuild) the vote tallies")
+    tallies.add_argument("--rebuild", action="store_true", help="recompute every tally from vote_store first")
+    tallies.set_defaults(handler=tallies_command)
+
+    search = commands.add_parser("search-index", help="rebuild the full-text search index from entry_data")
+    search.set_defaults(handler=search_command)
+
+    laws = commands.add_parser("laws", help="rebuild the laws in force from the completed resolutions and their tallies")
+    laws.set_defaults(handler=laws_command)
+
+    imports = commands.add_parser("import", help="bulk load users, entries, votes or repeals from json lines or csv")
+    imports.add_argument("kind", choices=COLUMNS)
+    imports.add_argument("path", help="file to read, - for stdin")
+    imports.add_argument("--format", choices=("jsonl", "csv"), help="defaults to csv for .csv files and json lines otherwise")
+    imports.add_argument("--batch-size", type=int, default=10000, help="records written per transaction")
+    imports.add_argument("--defer-indexes", action="store_true", help="drop the secondary indexes during the load and rebuild them once")
+    imports.set_defaults(handler=import_command)
+
+    exports = commands.add_parser("export", help="stream users, entries, votes or repeals to json lines or csv")
+    exports.add_argument("kind", choices=COLUMNS)
+    exports.add_argument("path", help="file to write, - for stdout")
+    exports.add_argument("--format", choices=("jsonl", "csv"), help="defaults to csv for .csv files and json lines otherwise")
+    exports.set_defaults(handler=export_command)
+
+    archive = commands.add_parser("archive", help="move finished entries with their votes into the archive database")
+    archive.add_argument("--older-than", type=float, default=30, help="only entries whose deadline passed this many days ago")
+    archive.add_argument("--batch-size", type=int, default=500)
+    archive.add_argument("--vacuum", action="store_true", help="vacuum the archive database afterwards")
+    archive.set_defaults(handler=archive_command)
+
+    args = parser.parse_args(argv)
+    db = Database(args.db, archive_path=args.archive)
+    try:
+        db.create_db()
+        return args.handler(db, args)
+    finally:
+        db.close()
+
+if __name__ == "__main__":
+    sys.exit(main())
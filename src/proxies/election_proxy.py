@@ -0,0 +1,19 @@
+from systems.interface.abstract_logic import ElectionInterface
+
+class ElectionProxy:
+    def __init__(self, logic: ElectionInterface, id) -> None:
+        self._logic = logic
+        self._id = id
+
+    @property
+    def info(self):
+        return self._logic.get_election(self._id)
+
+    def elect(self, elector_id: int, ranking: list[int]):
+        self._logic.elect(elector_id, self._id, ranking)
+
+    def is_election_done(self):
+        return self._logic.is_election_done(self._id)
+
+    def get_winner(self):
+        return self._logic.get_winner(self._id)
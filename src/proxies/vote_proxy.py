@@ -9,6 +9,16 @@ class VoteProxy:
     def info(self):
         return self._logic.get_vote(self._id)
 
+    @property
+    def tally(self):
+        return self._logic.get_tally(self._id)
+
+    def subscribe(self, callback, interval = None):
+        return self._logic.subscribe(self._id, callback, interval)
+
+    def unsubscribe(self, subscription):
+        self._logic.unsubscribe(subscription)
+
     def cast_vote(self, caster_id: int, vote: str):
         self._logic.cast_vote(caster_id, self._id, vote)
 
@@ -0,0 +1,206 @@
+from typing import NamedTuple
+import threading
+import time
+
+import numpy as np
+
+from database import Database, Repository
+from systems.internal.vote_system import VOTE_OPTIONS, VOTE_CODES
+
+# entries whose voting is over, a repealed resolution was completed before
+CLOSED_STATES = ("completed", "completed early", "repealed")
+
+APPROVE = VOTE_CODES["approve"]
+DISAPPROVE = VOTE_CODES["disapprove"]
+
+class Participation(NamedTuple):
+    user_id: int
+    votes: int
+    eligible: int
+    rate: float
+    approve: int
+    disapprove: int
+    abstain: int
+    approval_rate: float
+
+class Turnout(NamedTuple):
+    entry_id: int
+    deadline: int
+    voters: int
+    members: int
+    rate: float
+
+class Alignment(NamedTuple):
+    user_ids: list[int]
+    # agreement[i, j] is the share of the entries both voted on where they cast the same vote, nan if there were none
+    agreement: np.ndarray
+    shared: np.ndarray
+
+class AnalyticsRepository(Repository):
+    def __init__(self, db: Database) -> None:
+        self._db = db
+
+    def get_closed_entries(self, states = CLOSED_STATES) -> list[tuple[int, int]]:
+        state_ids = [self._db.enums.state_types.id_of(state) for state in states]
+        keys = ", ".join(["?"] * len(state_ids))
+        # entries without a deadline have no place on the timeline, so turnout and participation leave them out
+        result = self._db.read_query(f"SELECT id, deadline FROM entry_data WHERE state IN ({keys}) AND deadline IS NOT NULL", *state_ids)
+        if self._db.has_archive:
+            result += self._db.read_query(f"SELECT id, deadline FROM archive.entry_data WHERE state IN ({keys}) AND deadline IS NOT NULL",
+                                          *state_ids)
+        return result
+
+    def get_votes(self, ids) -> list[tuple[int, int, int]]:
+        result = self._db.read_query_many("SELECT entry, caster, vote FROM vote_store WHERE entry IN ({keys})", ids)
+        if self._db.has_archive:
+            found = {row[0] for row in result}
+            missing = [id for id in ids if id not in found]
+            result += self._db.read_query_many("SELECT entry, caster, vote FROM archive.vote_store WHERE entry IN ({keys})", missing)
+        return result
+
+def _rate(numerator, denominator) -> np.ndarray:
+    numerator = np.asarray(numerator, dtype=np.float64)
+    return np.divide(numerator, denominator, out=np.full(numerator.shape, np.nan), where=np.asarray(denominator) > 0)
+
+def _alignment_counts(members, entries, casters, codes, chunk_size):
+    size = len(members)
+    agree = np.zeros((size, size))
+    shared = np.zeros((size, size))
+    keep = np.isin(casters, members)
+    if not keep.any():
+        return agree, shared
+    rows = np.searchsorted(members, casters[keep])
+    columns = np.unique(entries[keep], return_inverse=True)[1].reshape(-1)
+    codes = codes[keep]
+    # the one-hot votes are built for a slice of entries at a time, so memory stays at members x chunk_size
+    for start in range(0, int(columns.max()) + 1, chunk_size):
+        select = (columns >= start) & (columns < start + chunk_size)
+        onehot = np.zeros((len(VOTE_OPTIONS), size, chunk_size), dtype=np.float32)
+        onehot[codes[select], rows[select], columns[select] - start] = 1
+        cast = onehot.sum(axis=0)
+        shared += cast @ cast.T
+        agree += sum(option @ option.T for option in onehot)
+    return agree, shared
+
+class AnalyticsLogic:
+    def __init__(self, repository: AnalyticsRepository, *, refresh_interval = 300, max_alignments = 8,
+                 chunk_size = 4096, clock = time.monotonic) -> None:
+        self._repository = repository
+        self._refresh_interval = refresh_interval
+        self._max_alignments = max_alignments
+        self._chunk_size = chunk_size
+        self._clock = clock
+        self._lock = threading.RLock()
+        self._reset()
+
+    def _reset(self):
+        self._refreshed = None
+        # closed entries in the order they were loaded
+        self._entry_ids = np.zeros(0, dtype=np.int64)
+        self._deadlines = np.zeros(0, dtype=np.int64)
+        self._voters = np.zeros(0, dtype=np.int64)
+        # every loaded vote, one row per (entry, caster)
+        self._vote_entries = np.zeros(0, dtype=np.int64)
+        self._vote_casters = np.zeros(0, dtype=np.int64)
+        self._vote_codes = np.zeros(0, dtype=np.int8)
+        # per user, sorted by id
+        self._user_ids = np.zeros(0, dtype=np.int64)
+        self._counts = np.zeros((0, len(VOTE_OPTIONS)), dtype=np.int64)
+        self._first_deadlines = np.zeros(0, dtype=np.int64)
+        self._alignments = {}
+
+    def refresh(self) -> int:
+        # only entries that closed since the last run are loaded, everything else is updated in place
+        with self._lock:
+            self._refreshed = self._clock()
+            closed = np.array(self._repository.get_closed_entries(), dtype=np.int64).reshape(-1, 2)
+            closed = closed[~np.isin(closed[:, 0], self._entry_ids)]
+            # an entry copied to the archive but not yet removed is listed twice
+            closed = closed[np.unique(closed[:, 0], return_index=True)[1]]
+            if not len(closed):
+                return 0
+            votes = np.array(self._repository.get_votes(closed[:, 0].tolist()), dtype=np.int64).reshape(-1, 3)
+            self._add(closed, votes)
+            return len(closed)
+
+    def _add(self, closed, votes):
+        entries, casters, codes = votes[:, 0], votes[:, 1], votes[:, 2].astype(np.int8)
+        positions = np.searchsorted(closed[:, 0], entries)
+
+        users = np.union1d(self._user_ids, casters)
+        if len(users) > len(self._user_ids):
+            moved = np.searchsorted(users, self._user_ids)
+            counts = np.zeros((len(users), len(VOTE_OPTIONS)), dtype=np.int64)
+            counts[moved] = self._counts
+            first_deadlines = np.full(len(users), np.iinfo(np.int64).max)
+            first_deadlines[moved] = self._first_deadlines
+            self._user_ids, self._counts, self._first_deadlines = users, counts, first_deadlines
+        user_rows = np.searchsorted(self._user_ids, casters)
+        np.add.at(self._counts, (user_rows, codes), 1)
+        np.minimum.at(self._first_deadlines, user_rows, closed[positions, 1])
+
+        self._entry_ids = np.concatenate((self._entry_ids, closed[:, 0]))
+        self._deadlines = np.concatenate((self._deadlines, closed[:, 1]))
+        self._voters = np.concatenate((self._voters, np.bincount(positions, minlength=len(closed))))
+        self._vote_entries = np.concatenate((self._vote_entries, entries))
+        self._vote_casters = np.concatenate((self._vote_casters, casters))
+        self._vote_codes = np.concatenate((self._vote_codes, codes))
+
+        for members, (agree, shared) in self._alignments.items():
+            added = _alignment_counts(np.array(members, dtype=np.int64), entries, casters, codes, self._chunk_size)
+            agree += added[0]
+            shared += added[1]
+
+    def _refresh_if_stale(self):
+        if self._refreshed is None or self._clock() - self._refreshed >= self._refresh_interval:
+            self.refresh()
+
+    def participation(self, user_ids = None) -> dict[int, Participation]:
+        with self._lock:
+            self._refresh_if_stale()
+            rows = np.arange(len(self._user_ids))
+            if user_ids is not None:
+                rows = rows[np.isin(self._user_ids, list(user_ids))]
+            counts = self._counts[rows]
+            votes = counts.sum(axis=1)
+            # members are only counted from the first entry they voted on, before that they were not around
+            deadlines = np.sort(self._deadlines)
+            eligible = len(deadlines) - np.searchsorted(deadlines, self._first_deadlines[rows])
+            rates = _rate(votes, eligible)
+            approval_rates = _rate(counts[:, APPROVE], counts[:, APPROVE] + counts[:, DISAPPROVE])
+            return {int(user_id): Participation(int(user_id), int(count), int(eligible[i]), float(rates[i]),
+                                                *map(int, counts[i]), float(approval_rates[i]))
+                    for i, (user_id, count) in enumerate(zip(self._user_ids[rows], votes))}
+
+    def turnout(self, since = None, until = None) -> list[Turnout]:
+        with self._lock:
+            self._refresh_if_stale()
+            order = np.lexsort((self._entry_ids, self._deadlines))
+            deadlines = self._deadlines[order]
+            members = np.searchsorted(np.sort(self._first_deadlines), deadlines, side="right")
+            rates = _rate(self._voters[order], members)
+            select = np.ones(len(order), dtype=bool)
+            if since is not None:
+                select &= deadlines >= since
+            if until is not None:
+                select &= deadlines < until
+            return [Turnout(int(self._entry_ids[index]), int(deadlines[i]), int(self._voters[index]), int(members[i]), float(rates[i]))
+                    for i, index in enumerate(order) if select[i]]
+
+    def alignment(self, user_ids = None) -> Alignment:
+        with self._lock:
+            self._refresh_if_stale()
+            members = tuple(int(id) for id in (self._user_ids if user_ids is None else np.unique(list(user_ids))))
+            counts = self._alignments.get(members)
+            if counts is None:
+                counts = _alignment_counts(np.array(members, dtype=np.int64), self._vote_entries, self._vote_casters,
+                                           self._vote_codes, self._chunk_size)
+                if len(self._alignments) >= self._max_alignments:
+                    del self._alignments[next(iter(self._alignments))]
+                self._alignments[members] = counts
+            agree, shared = counts
+            return Alignment(list(members), _rate(agree, shared), shared.astype(np.int64))
+
+    def clear(self):
+        with self._lock:
+            self._reset()
@@ -0,0 +1,93 @@
+import time
+import zlib
+
+from exceptions import *
+from database import Database
+
+ARCHIVED_STATES = ("completed", "completed early", "cancelled", "denied", "repealed")
+
+class ArchiveRepository:
+    def __init__(self, db: Database) -> None:
+        if not db.has_archive:
+            raise AmbassadorOperationNotSupportedError("The database was opened without an archive")
+        self._db = db
+
+    def get_archivable(self, states, before, limit) -> list[int]:
+        state_ids = [self._db.enums.state_types.id_of(state) for state in states]
+        result = self._db.query(f"""SELECT id FROM entry_data
+                                WHERE state IN ({", ".join(["?"] * len(state_ids))}) AND deadline < ?
+                                ORDER BY id LIMIT ?
+            """, *state_ids, before, limit)
+        return [row[0] for row in result]
+
+    def copy_entries(self, ids):
+        keys = ", ".join(["?"] * len(ids))
+        with self._db.transaction():
+            rows = self._db.query(f"""SELECT id, type, state, role, author, creation_date, deadline, title, content
+                                  FROM entry_data WHERE id IN ({keys})
+                """, *ids)
+            archived = int(time.time())
+            # OR REPLACE: a copy left behind by an interrupted run is overwritten with the current row
+            self._db.execute_many("""INSERT OR REPLACE INTO archive.entry_data
+                                  (id, type, state, role, author, creation_date, deadline, title, content, archived)
+                                  VALUES(?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+                """, [(*row[:8], None if row[8] is None else zlib.compress(row[8].encode(), 9), archived) for row in rows])
+            if self._db.table_exists("entry_search", "archive"):
+                # the index over the archive is kept by hand, so archived resolutions can still be searched
+                self._db.execute(f"DELETE FROM archive.entry_search WHERE rowid IN ({keys})", *ids)
+                self._db.execute_many("INSERT INTO archive.entry_search (rowid, title, content) VALUES(?, ?, ?)",
+                                      [(row[0], row[7], row[8]) for row in rows])
+            self._db.execute(f"INSERT OR REPLACE INTO archive.vote_store SELECT entry, caster, vote FROM vote_store WHERE entry IN ({keys})", *ids)
+            self._db.execute(f"""INSERT OR REPLACE INTO archive.vote_tally
+                             SELECT entry, approve, disapprove, abstain FROM vote_tally WHERE entry IN ({keys})
+                """, *ids)
+            self._db.execute(f"""INSERT OR REPLACE INTO archive.repeal_store
+                             SELECT entry_id, repealed_id FROM repeal_store WHERE entry_id IN ({keys})
+                """, *ids)
+
+    def remove_entries(self, ids) -> int:
+        keys = ", ".join(["?"] * len(ids))
+        with self._db.transaction():
+            # an entry whose state changed after it was copied stays, the next run copies it again
+            result = self._db.execute(f"""DELETE FROM entry_data
+                                      WHERE id IN ({keys})
+                                      AND state = (SELECT state FROM archive.entry_data AS archived WHERE archived.id = entry_data.id)
+                """, *ids)
+            for table, column in (("vote_store", "entry"), ("vote_tally", "entry"), ("repeal_store", "entry_id")):
+                self._db.execute(f"""DELETE FROM {table}
+                                 WHERE {column} IN ({keys}) AND {column} NOT IN (SELECT id FROM entry_data WHERE id IN ({keys}))
+                    """, *ids, *ids)
+        return result.rowcount
+
+    def count(self) -> int:
+        return self._db.query_once("SELECT COUNT(*) FROM archive.entry_data")[0]
+
+    def vacuum(self):
+        self._db.vacuum_archive()
+
+class ArchiveLogic:
+    def __init__(self, repository: ArchiveRepository, *, clock = time.time) -> None:
+        self._repository = repository
+        self._clock = clock
+
+    def archive(self, older_than = 30 * 86400, batch_size = 500, states = ARCHIVED_STATES) -> int:
+        before = self._clock() - older_than
+        archived = 0
+        while True:
+            ids = self._repository.get_archivable(states, before, batch_size)
+            if not ids:
+                return archived
+            # copied and removed in two commits, a transaction spanning both files is not atomic in WAL mode,
+            # so a crash in between leaves a duplicate instead of losing the entry
+            self._repository.copy_entries(ids)
+            removed = self._repository.remove_entries(ids)
+            archived += removed
+            if removed < len(ids):
+                # the rest changed state meanwhile, leave them for the next run instead of spinning on them
+                return archived
+
+    def count(self) -> int:
+        return self._repository.count()
+
+    def vacuum(self):
+        self._repository.vacuum()
@@ -0,0 +1,119 @@
+from typing import NamedTuple
+import logging
+import threading
+import time
+
+from database import Database
+
+logger = logging.getLogger(__name__)
+
+class Change(NamedTuple):
+    version: int
+    kind: str
+    key: int
+
+class ChangeLogRepository:
+    def __init__(self, db: Database) -> None:
+        self._db = db
+
+    def get_data_version(self) -> int:
+        # data_version is per connection, so it is always asked on the writer
+        return self._db.query_once("PRAGMA data_version")[0]
+
+    def get_version(self) -> int:
+        return self._db.query_once("SELECT IFNULL(MAX(version), 0) FROM change_log")[0]
+
+    def get_oldest_version(self) -> int:
+        return self._db.query_once("SELECT MIN(version) FROM change_log")[0]
+
+    def get_changes(self, after, limit = 1000) -> list[Change]:
+        result = self._db.query("SELECT version, kind, key FROM change_log WHERE version > ? ORDER BY version LIMIT ?", after, limit)
+        return [Change(*row) for row in result]
+
+    def prune(self, before) -> int:
+        result = self._db.execute("DELETE FROM change_log WHERE changed < ?", before)
+        self._db.commit()
+        return result.rowcount
+
+class ChangeLogTailer:
+    def __init__(self, repository: ChangeLogRepository) -> None:
+        self._repository = repository
+        self._subscribers = {}
+        self._lock = threading.Lock()
+        self._version = repository.get_version()
+        self._data_version = repository.get_data_version()
+        self._stopped = threading.Event()
+        self._thread = None
+
+    @property
+    def version(self):
+        return self._version
+
+    def subscribe(self, kind: str, invalidate):
+        # invalidate(key) drops one key, invalidate(None) everything of that kind
+        self._subscribers.setdefault(kind, []).append(invalidate)
+
+    def unsubscribe(self, kind: str, invalidate):
+        self._subscribers[kind].remove(invalidate)
+
+    def _invalidate(self, kind, key):
+        for invalidate in self._subscribers.get(kind, ()):
+            invalidate(key)
+
+    def _invalidate_all(self):
+        for kind in self._subscribers:
+            self._invalidate(kind, None)
+
+    def poll(self) -> int:
+        with self._lock:
+            # data_version only moves when another connection commits, so an idle poll is one pragma
+            data_version = self._repository.get_data_version()
+            if data_version == self._data_version:
+                return 0
+            self._data_version = data_version
+
+            changes = self._repository.get_changes(self._version)
+            if not changes:
+                return 0
+            oldest = self._repository.get_oldest_version()
+            if oldest is not None and oldest > self._version + 1:
+                # the rows we missed were pruned, there is no telling which keys they touched
+                logger.warning("Change log was pruned past version %s, invalidating every cache", self._version)
+                self._invalidate_all()
+                self._version = self._repository.get_version()
+                return len(changes)
+
+            count = 0
+            while changes:
+                seen = set()
+                for change in changes:
+                    if (change.kind, change.key) not in seen:
+                        seen.add((change.kind, change.key))
+                        self._invalidate(change.kind, change.key)
+                count += len(changes)
+                self._version = changes[-1].version
+                changes = self._repository.get_changes(self._version)
+            return count
+
+    def _run(self, interval):
+        while not self._stopped.wait(interval):
+            try:
+                self.poll()
+            except Exception:
+                logger.exception("Failed to poll the change log")
+
+    def start(self, interval = 1.0):
+        if self._thread is not None:
+            return
+        self._stopped.clear()
+        self._thread = threading.Thread(target=self._run, args=(interval,), name="change-log-tailer", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stopped.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+    def prune(self, max_age = 86400) -> int:
+        return self._repository.prune(int(time.time()) - max_age)
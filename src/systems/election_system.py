@@ -0,0 +1,162 @@
+from array import array
+from typing import NamedTuple
+
+from exceptions import *
+from database import Database, Repository
+from utils.cache import Cache
+from utils.metrics import instrumented
+from utils.ranked_choice import ElectionResult, TallyRound, plurality, instant_runoff, single_transferable_vote
+from systems.interface.abstract_logic import ElectionInterface, EntryInterface, UserInterface
+from systems.entry_system import EntryHeader
+
+ELECTION_METHODS = ("plurality", "instant-runoff", "stv")
+
+class Election(NamedTuple):
+    entry_id: int
+    method: str
+    seats: int
+    candidates: tuple[int, ...]
+
+# ballots store candidate positions instead of user ids, one byte each for up to 256 candidates
+def _array_code(candidate_count):
+    return "B" if candidate_count <= 256 else "H"
+
+def encode_ranking(positions, candidate_count) -> bytes:
+    return array(_array_code(candidate_count), positions).tobytes()
+
+def decode_ranking(ranking: bytes, candidate_count) -> array:
+    decoded = array(_array_code(candidate_count))
+    decoded.frombytes(ranking)
+    return decoded
+
+class ElectionRepository(Repository):
+    def __init__(self, db: Database) -> None:
+        self._db = db
+
+    def get_election(self, id) -> Election:
+        election = self._db.read_query_once("SELECT method, seats FROM election_data WHERE entry_id = ?", id)
+        if election is None:
+            return None
+        candidates = self._db.read_query("SELECT candidate FROM election_candidates WHERE election = ? ORDER BY position", id)
+        return Election(id, *election, tuple(row[0] for row in candidates))
+
+    def create_election(self, id, method, seats, candidates):
+        with self._db.transaction():
+            self._db.insert("election_data", {"entry_id": id, "method": method, "seats": seats})
+            self._db.execute_many("INSERT INTO election_candidates (election, position, candidate) VALUES(?, ?, ?)",
+                                  [(id, position, candidate) for position, candidate in enumerate(candidates)])
+            self._db.log_change("election", id)
+
+    def set_ballot(self, id, elector_id, ranking: bytes):
+        self._db.execute("""INSERT INTO election_ballots (election, elector, ranking) VALUES(?, ?, ?)
+                         ON CONFLICT(election, elector) DO UPDATE SET ranking = excluded.ranking
+            """, id, elector_id, ranking)
+        self._db.commit()
+
+    def get_ballot(self, id, elector_id) -> bytes:
+        result = self._db.read_query_once("SELECT ranking FROM election_ballots WHERE election = ? AND elector = ?", id, elector_id)
+        return None if result is None else result[0]
+
+    def get_ballots(self, id) -> list[bytes]:
+        return [row[0] for row in self._db.read_query("SELECT ranking FROM election_ballots WHERE election = ?", id)]
+
+class ElectionLogic(ElectionInterface):
+    def __init__(self, repository: ElectionRepository, user_logic: UserInterface, entry_logic: EntryInterface, cache: Cache = None) -> None:
+        self._repository = repository
+        self._user_logic = user_logic
+        self._entry_logic = entry_logic
+        self._cache = cache if cache is not None else Cache(max_size=256, ttl=300, negative_ttl=30)
+        self._result_cache = Cache(max_size=256)
+
+    @instrumented
+    def get(self, id) -> Election:
+        load = lambda: self._repository.get_election(id)
+        election = load() if self._repository.in_transaction() else self._cache.get(id, load)
+        if election is None:
+            raise EntryNotFoundError(f"No election was set for the entry with id \"{id}\"")
+        return election
+
+    def get_election(self, election_id):
+        return self.get(election_id)
+
+    def invalidate(self, id = None):
+        self._cache.clear_cache(id)
+        self._result_cache.clear_cache(id)
+
+    @instrumented
+    def set_election(self, entry_id, candidates: list[int], method = "instant-runoff", seats = 1):
+        entry: EntryHeader = self._entry_logic.get_header(entry_id)
+        if entry.type != "election":
+            raise AmbassadorOperationNotSupportedError(f"Cannot set election to entry of type \"{entry.type}\"")
+        if method not in ELECTION_METHODS:
+            raise AmbassadorUnknownValueError(f"\"{method}\" is not a known election method")
+        if not candidates or len(set(candidates)) != len(candidates):
+            raise ElectionInvalidBallotError("An election needs at least one candidate and every candidate must be unique")
+        if method == "instant-runoff" and seats != 1:
+            raise AmbassadorOperationNotSupportedError("Instant-runoff elections fill exactly one seat, use stv for more")
+        if not 0 < seats <= len(candidates):
+            raise ElectionInvalidBallotError("The number of seats must be between 1 and the number of candidates")
+        self._repository.create_election(entry_id, method, seats, list(candidates))
+        self._repository.after_commit(lambda: self.invalidate(entry_id))
+
+    @instrumented
+    def elect(self, elector_id: int, election_id: int, ranking: list[int]):
+        if isinstance(ranking, int):
+            ranking = [ranking]
+        entry: EntryHeader = self._entry_logic.get_header(election_id)
+        if entry.is_completed():
+            raise VoteAlreadyDoneError("Couldn't cast ballot. The election was already completed")
+        if entry.is_cancelled():
+            raise VoteAlreadyDoneError("Couldn't cast ballot. The election was already cancelled")
+        if not entry.is_active():
+            raise VoteAlreadyDoneError("Couldn't cast ballot. The election is not active")
+
+        elector = self._user_logic.get_user(elector_id)
+        if not entry.has_user_permissions(elector.role):
+            raise UserNotEnoughPermissionsError("Couldn't cast ballot. The user does not have enough permissions")
+
+        election = self.get(election_id)
+        positions = {candidate: position for position, candidate in enumerate(election.candidates)}
+        if not ranking or len(set(ranking)) != len(ranking) or any(candidate not in positions for candidate in ranking):
+            raise ElectionInvalidBallotError("A ballot must rank at least one candidate of the election, each at most once")
+        if election.method == "plurality":
+            ranking = ranking[:1]
+        self._repository.set_ballot(election_id, elector_id, encode_ranking([positions[candidate] for candidate in ranking], len(election.candidates)))
+
+    def get_ballot(self, election_id, elector_id) -> list[int]:
+        election = self.get(election_id)
+        ranking = self._repository.get_ballot(election_id, elector_id)
+        if ranking is None:
+            return None
+        return [election.candidates[position] for position in decode_ranking(ranking, len(election.candidates))]
+
+    def is_election_done(self, election_id: int):
+        return self._entry_logic.get_header(election_id).is_completed()
+
+    def count(self, election_id) -> ElectionResult:
+        election = self.get(election_id)
+        candidate_count = len(election.candidates)
+        ballots = [decode_ranking(ranking, candidate_count) for ranking in self._repository.get_ballots(election_id)]
+        if election.method == "plurality":
+            result = plurality(ballots, candidate_count, election.seats)
+        elif election.method == "instant-runoff":
+            result = instant_runoff(ballots, candidate_count)
+        else:
+            result = single_transferable_vote(ballots, candidate_count, election.seats)
+        # counts stay aligned with election.candidates, everything else is mapped back to user ids
+        candidates = election.candidates
+        rounds = [TallyRound(tally_round.counts, tuple(candidates[position] for position in tally_round.elected),
+                             tuple(candidates[position] for position in tally_round.eliminated), tally_round.exhausted)
+                  for tally_round in result.rounds]
+        return ElectionResult(tuple(candidates[position] for position in result.winners), rounds)
+
+    @instrumented
+    def get_result(self, election_id) -> ElectionResult:
+        if not self.is_election_done(election_id):
+            raise ElectionNotDoneError("Couldn't get the result. The election was not completed")
+        # ballots cannot change once the election is completed, so the count is kept
+        load = lambda: self.count(election_id)
+        return load() if self._repository.in_transaction() else self._result_cache.get(election_id, load)
+
+    def get_winner(self, election_id: int):
+        return self.get_result(election_id).winners
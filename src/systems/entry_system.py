@@ -1,12 +1,14 @@
 from typing import NamedTuple
 import time
+import zlib
 
 from exceptions import *
-from database import Database
-from systems.interface.abstract_logic import EntryInterface, EntryTypeProvider
+from database import Database, Repository
+from systems.interface.abstract_logic import EntryInterface, EntryTypeProvider, Transactional
 from utils.cache import Cache
+from utils.metrics import instrumented
 
-class Entry(NamedTuple):
+class EntryHeader(NamedTuple):
     id: int
     type: str
     state: str
@@ -15,7 +17,6 @@ class Entry(NamedTuple):
     creation_date: int
     end_date: int
     title: str
-    content: str
 
     def is_past_due(self, current_time = None):
         current_time = current_time or time.time()
@@ -41,25 +42,242 @@ class Entry(NamedTuple):
     def is_author(self, user):
         return user == self.author
 
-class EntryRepository:
+class Entry(NamedTuple):
+    id: int
+    type: str
+    state: str
+    role: int
+    author: str
+    creation_date: int
+    end_date: int
+    title: str
+    content: str
+
+    is_past_due = EntryHeader.is_past_due
+    is_active = EntryHeader.is_active
+    is_cancelled = EntryHeader.is_cancelled
+    is_completed = EntryHeader.is_completed
+    is_approved = EntryHeader.is_approved
+    is_denied = EntryHeader.is_denied
+    is_proposed = EntryHeader.is_proposed
+    has_user_permissions = EntryHeader.has_user_permissions
+    is_author = EntryHeader.is_author
+
+    @property
+    def header(self) -> EntryHeader:
+        return EntryHeader(*self[:-1])
+
+class EntryPage(NamedTuple):
+    entries: list[EntryHeader]
+    next_cursor: tuple[int, int]
+
+class SearchResult(NamedTuple):
+    entry: EntryHeader
+    snippet: str
+    rank: float
+
+class SearchPage(NamedTuple):
+    results: list[SearchResult]
+    next_offset: int
+
+def to_match_query(text: str, prefix = False) -> str:
+    # every word is quoted so user input can never be parsed as fts5 query syntax
+    terms = ['"' + term.replace('"', '""') + '"' for term in text.split()]
+    if prefix and terms:
+        terms[-1] += "*"
+    return " ".join(terms)
+
+class EntryRepository(Repository):
     def __init__(self, db: Database) -> None:
         self._db = db
+        self._search_enabled = None
+        self._search_archive = None
 
     def _mark_state(self, id, state):
-        self._db.execute("""UPDATE entry_data
-                        SET state = (SELECT id FROM state_types WHERE state = ?)
-                        WHERE id = ?
-            """, state, id)
-        self._db.commit()
-
-    def get_entry(self, id) -> Entry:
-        entry = self._db.query_once("""SELECT a.id, b.type, c.state, a.role, a.author, a.creation_date, a.deadline, a.title, a.content
-                       FROM entry_data a
-                       JOIN entry_types b ON a.type = b.id
-                       JOIN state_types c ON a.state = c.id
-                       WHERE a.id = ?
-                       """, id)
-        return Entry(*entry)
+        with self._db.transaction():
+            state_id = self._db.enums.state_types.id_of(state)
+            result = self._db.execute("UPDATE entry_data SET state = ? WHERE id = ?", state_id, id)
+            if result.rowcount == 0 and self._db.has_archive:
+                # a completed entry can still be repealed after it was archived
+                self._db.execute("UPDATE archive.entry_data SET state = ? WHERE id = ?", state_id, id)
+            if state in ("completed", "completed early"):
+                self._enact(id)
+            elif state == "repealed":
+                self._db.execute("DELETE FROM laws_in_force WHERE entry_id = ?", id)
+            self._db.log_change("entry", id)
+            self._db.append_event("state_changed", id, {"state": state})
+
+    def _enact(self, id):
+        # a resolution that passed its vote becomes a law, repeals and failed votes never do
+        self._db.execute("""INSERT OR IGNORE INTO laws_in_force (entry_id, enacted)
+                         SELECT e.id, e.deadline FROM entry_data AS e JOIN vote_tally AS t ON t.entry = e.id
+                         WHERE e.id = ? AND e.type = ? AND t.approve > t.disapprove
+            """, id, self._db.enums.entry_types.id_of("resolution"))
+
+    def _to_entry(self, row) -> Entry:
+        enums = self._db.enums
+        return Entry(row[0], enums.entry_types.name_of(row[1]), enums.state_types.name_of(row[2]), *row[3:])
+
+    def _to_archived_entry(self, row) -> Entry:
+        return self._to_entry((*row[:8], self._decompress(row[8])))
+
+    def _decompress(self, content: bytes) -> str:
+        return None if content is None else zlib.decompress(content).decode()
+
+    def _to_header(self, row) -> EntryHeader:
+        enums = self._db.enums
+        return EntryHeader(row[0], enums.entry_types.name_of(row[1]), enums.state_types.name_of(row[2]), *row[3:])
+
+    def _in_filter(self, column, values, enum_map = None):
+        if isinstance(values, (str, int)):
+            values = (values,)
+        values = [enum_map.id_of(value) for value in values] if enum_map is not None else list(values)
+        return f"{column} IN ({', '.join(['?'] * len(values))})", values
+
+    def list_entries(self, *, state = None, type = None, author = None, deadline_from = None, deadline_to = None,
+                     after: tuple[int, int] = None, limit = 50, max_staleness = None) -> list[EntryHeader]:
+        enums = self._db.enums
+        conditions = []
+        params = []
+        for column, values, enum_map in (("state", state, enums.state_types), ("type", type, enums.entry_types), ("author", author, None)):
+            if values is not None:
+                condition, values = self._in_filter(column, values, enum_map)
+                conditions.append(condition)
+                params.extend(values)
+        if deadline_from is not None:
+            conditions.append("deadline >= ?")
+            params.append(deadline_from)
+        if deadline_to is not None:
+            conditions.append("deadline < ?")
+            params.append(deadline_to)
+        if after is not None and after[0] is None:
+            # entries without a deadline sort first, a page ending among them continues with the rest of them
+            conditions.append("((deadline IS NULL AND id > ?) OR deadline IS NOT NULL)")
+            params.append(after[1])
+        elif after is not None:
+            conditions.append("(deadline, id) > (?, ?)")
+            params.extend(after)
+        where = f"WHERE {' AND '.join(conditions)}" if conditions else ""
+        result = self._db.read_query(f"""SELECT id, type, state, role, author, creation_date, deadline, title
+                                     FROM entry_data
+                                     {where}
+                                     ORDER BY deadline, id
+                                     LIMIT ?
+            """, *params, limit, max_staleness=max_staleness)
+        return [self._to_header(row) for row in result]
+
+    def get_entry(self, id, max_staleness = None) -> Entry:
+        entry = self._db.read_query_once("""SELECT id, type, state, role, author, creation_date, deadline, title, content
+                       FROM entry_data
+                       WHERE id = ?
+                       """, id, max_staleness=max_staleness)
+        if entry is not None:
+            return self._to_entry(entry)
+        if not self._db.has_archive:
+            return None
+        entry = self._db.read_query_once("""SELECT id, type, state, role, author, creation_date, deadline, title, content
+                       FROM archive.entry_data
+                       WHERE id = ?
+                       """, id, max_staleness=max_staleness)
+        return None if entry is None else self._to_archived_entry(entry)
+
+    def get_entries(self, ids, max_staleness = None) -> dict[int, Entry]:
+        result = self._db.read_query_many("""SELECT id, type, state, role, author, creation_date, deadline, title, content
+                       FROM entry_data
+                       WHERE id IN ({keys})
+                       """, ids, max_staleness=max_staleness)
+        entries = {row[0]: self._to_entry(row) for row in result}
+        missing = [id for id in ids if id not in entries]
+        if missing and self._db.has_archive:
+            result = self._db.read_query_many("""SELECT id, type, state, role, author, creation_date, deadline, title, content
+                           FROM archive.entry_data
+                           WHERE id IN ({keys})
+                           """, missing, max_staleness=max_staleness)
+            entries.update((row[0], self._to_archived_entry(row)) for row in result)
+        return entries
+
+    def get_header(self, id, max_staleness = None) -> EntryHeader:
+        header = self._db.read_query_once("SELECT id, type, state, role, author, creation_date, deadline, title FROM entry_data WHERE id = ?",
+                                          id, max_staleness=max_staleness)
+        if header is None and self._db.has_archive:
+            header = self._db.read_query_once("""SELECT id, type, state, role, author, creation_date, deadline, title
+                                              FROM archive.entry_data WHERE id = ?
+                """, id, max_staleness=max_staleness)
+        return None if header is None else self._to_header(header)
+
+    def get_headers(self, ids, max_staleness = None) -> dict[int, EntryHeader]:
+        result = self._db.read_query_many("""SELECT id, type, state, role, author, creation_date, deadline, title
+                                          FROM entry_data WHERE id IN ({keys})
+            """, ids, max_staleness=max_staleness)
+        headers = {row[0]: self._to_header(row) for row in result}
+        missing = [id for id in ids if id not in headers]
+        if missing and self._db.has_archive:
+            result = self._db.read_query_many("""SELECT id, type, state, role, author, creation_date, deadline, title
+                                              FROM archive.entry_data WHERE id IN ({keys})
+                """, missing, max_staleness=max_staleness)
+            headers.update((row[0], self._to_header(row)) for row in result)
+        return headers
+
+    def get_content(self, id, max_staleness = None) -> str:
+        result = self._db.read_query_once("SELECT content FROM entry_data WHERE id = ?", id, max_staleness=max_staleness)
+        if result is not None:
+            return result[0]
+        if self._db.has_archive:
+            result = self._db.read_query_once("SELECT content FROM archive.entry_data WHERE id = ?", id, max_staleness=max_staleness)
+            if result is not None:
+                return self._decompress(result[0])
+        return None
+
+    def get_contents(self, ids, max_staleness = None) -> dict[int, str]:
+        contents = dict(self._db.read_query_many("SELECT id, content FROM entry_data WHERE id IN ({keys})", ids, max_staleness=max_staleness))
+        missing = [id for id in ids if id not in contents]
+        if missing and self._db.has_archive:
+            result = self._db.read_query_many("SELECT id, content FROM archive.entry_data WHERE id IN ({keys})", missing,
+                                              max_staleness=max_staleness)
+            contents.update((id, self._decompress(content)) for id, content in result)
+        return contents
+
+    def search_entries(self, match_query: str, *, state = None, type = None, limit = 20, offset = 0,
+                       highlight = ("**", "**"), max_staleness = None) -> list[SearchResult]:
+        if self._search_enabled is None:
+            self._search_enabled = self._db.table_exists("entry_search")
+        if not self._search_enabled:
+            raise AmbassadorOperationNotSupportedError("Full-text search is not available, sqlite was built without fts5")
+        if self._search_archive is None:
+            self._search_archive = self._db.has_archive and self._db.table_exists("entry_search", "archive")
+        enums = self._db.enums
+        conditions = ["entry_search MATCH ?"]
+        params = [match_query]
+        for column, values, enum_map in (("e.state", state, enums.state_types), ("e.type", type, enums.entry_types)):
+            if values is not None:
+                condition, values = self._in_filter(column, values, enum_map)
+                conditions.append(condition)
+                params.extend(values)
+        # bm25 depends on the statistics of its own index, so each source is scaled by its best match before the two are merged
+        search = f"""SELECT *, COALESCE(score / NULLIF(MIN(score) OVER (), 0), 1) AS relevance FROM (
+                   SELECT e.id, e.type, e.state, e.role, e.author, e.creation_date, e.deadline, e.title,
+                   snippet(entry_search, -1, ?, ?, '…', 24), bm25(entry_search, 5.0, 1.0) AS score
+                   FROM {{schema}}entry_search
+                   JOIN {{schema}}entry_data e ON e.id = entry_search.rowid
+                   WHERE {' AND '.join(conditions)}{{exclude}})"""
+        statement = search.format(schema="", exclude="")
+        arguments = [*highlight, *params]
+        if self._search_archive:
+            # past resolutions are found in the archive's own index, an entry not yet removed from the main database is listed once
+            statement += " UNION ALL " + search.format(schema="archive.", exclude=" AND e.id NOT IN (SELECT id FROM entry_data)")
+            arguments += [*highlight, *params]
+        result = self._db.read_query(f"{statement} ORDER BY relevance DESC, score LIMIT ? OFFSET ?", *arguments, limit, offset,
+                                     max_staleness=max_staleness)
+        return [SearchResult(self._to_header(row[:8]), row[8], row[9]) for row in result]
+
+    def get_deadlines(self, state = "active", until = None) -> list[tuple[int, int]]:
+        state_id = self._db.enums.state_types.id_of(state)
+        if until is None:
+            return self._db.read_query("SELECT id, deadline FROM entry_data WHERE state = ? ORDER BY deadline", state_id)
+        return self._db.read_query("""SELECT id, deadline FROM entry_data
+                                  WHERE state = ? AND deadline <= ?
+                                  ORDER BY deadline
+            """, state_id, until)
 
     def mark_as_completed(self, id, early = False):
         if early:
@@ -81,34 +299,131 @@ class EntryRepository:
 
     def create_entry(self, title, content,type, author, role, end_date, creation_date = None, state = "proposed"):
         creation_date = creation_date or time.time()
-        result = self._db.execute("""INSERT INTO entry_data (
-                                  type, state, role, author, creation_date, deadline, title, content) 
-                                  VALUES(
-                                  (SELECT id FROM entry_types WHERE type = ?),
-                                  (SELECT id FROM state_types WHERE state = ?),
-                                  (SELECT id FROM roles WHERE role = ?),
-                                  ?, ?, ?, ?, ?
-                                  )
-                                  """, type, state, role, author, creation_date, end_date, title, content)
-        self._db.commit()
+        enums = self._db.enums
+        with self._db.transaction():
+            id = None
+            if self._db.has_archive:
+                # sqlite would hand out the ids of archived entries again once they were the newest
+                id = self._db.query_once("""SELECT COALESCE(MAX(id), 0) + 1 FROM (
+                                         SELECT MAX(id) AS id FROM entry_data UNION ALL SELECT MAX(id) FROM archive.entry_data)
+                                         """)[0]
+            result = self._db.execute("""INSERT INTO entry_data (
+                                      id, type, state, role, author, creation_date, deadline, title, content) 
+                                      VALUES(?, ?, ?, ?, ?, ?, ?, ?, ?)
+                                      """, id, enums.entry_types.id_of(type), enums.state_types.id_of(state), enums.roles.id_of(role),
+                                      author, creation_date, end_date, title, content)
+            self._db.log_change("entry", result.lastrowid)
         return result.lastrowid
 
-class EntryLogic(EntryInterface, EntryTypeProvider):
-    def __init__(self, repository: EntryRepository) -> None:
+class EntryLogic(EntryInterface, EntryTypeProvider, Transactional):
+    def __init__(self, repository: EntryRepository, cache: Cache = None, content_cache: Cache = None) -> None:
         self._repository = repository
-        self._cache = Cache()
+        # headers are small and read on every dispatch, bodies can be large and are only read for display
+        self._cache = cache if cache is not None else Cache(max_size=4096, ttl=300, negative_ttl=30)
+        self._content_cache = content_cache if content_cache is not None else Cache(max_size=128, ttl=300)
+        self._listeners = []
+
+    @instrumented
+    def get_header(self, id) -> EntryHeader:
+        load = lambda: self._repository.get_header(id)
+        # inside a transaction the shared cache is neither read nor filled with uncommitted rows
+        header = load() if self._repository.in_transaction() else self._cache.get(id, load)
+        if header is None:
+            raise EntryNotFoundError(f"No entry with id \"{id}\" was found")
+        return header
+
+    @instrumented
+    def get_headers(self, ids) -> dict[int, EntryHeader]:
+        if self._repository.in_transaction():
+            headers = self._repository.get_headers(ids)
+        else:
+            headers = self._cache.get_many(ids, self._repository.get_headers)
+        return {id: header for id, header in headers.items() if header is not None}
 
+    def _get_content(self, id) -> str:
+        load = lambda: self._repository.get_content(id)
+        return load() if self._repository.in_transaction() else self._content_cache.get(id, load)
+
+    @instrumented
+    def get_content(self, id) -> str:
+        self.get_header(id)
+        return self._get_content(id)
+
+    @instrumented
     def get(self, id) -> Entry:
-        return self._cache.get(id, lambda: self._repository.get_entry(id))
+        return Entry(*self.get_header(id), self._get_content(id))
     
     def get_entry(self, id):
         return self.get(id)
+
+    @instrumented
+    def get_entries(self, ids) -> dict[int, Entry]:
+        headers = self.get_headers(ids)
+        if self._repository.in_transaction():
+            contents = self._repository.get_contents(list(headers))
+        else:
+            contents = self._content_cache.get_many(list(headers), self._repository.get_contents)
+        return {id: Entry(*header, contents.get(id)) for id, header in headers.items()}
     
     def get_type(self, id):
-        return self.get(id).type
+        return self.get_header(id).type
+
+    @instrumented
+    def list_entries(self, *, state = None, type = None, author = None, deadline_from = None, deadline_to = None,
+                     after: tuple[int, int] = None, limit = 50, max_staleness = None) -> EntryPage:
+        if limit <= 0:
+            raise ValueError("limit must be positive")
+        headers = self._repository.list_entries(state=state, type=type, author=author, deadline_from=deadline_from,
+                                                deadline_to=deadline_to, after=after, limit=limit + 1, max_staleness=max_staleness)
+        if len(headers) <= limit:
+            return EntryPage(headers, None)
+        last = headers[limit - 1]
+        return EntryPage(headers[:limit], (last.end_date, last.id))
+
+    @instrumented
+    def search_entries(self, text: str, *, state = None, type = None, limit = 20, offset = 0, prefix = False, raw = False,
+                       max_staleness = None) -> SearchPage:
+        if limit <= 0:
+            raise ValueError("limit must be positive")
+        match_query = text if raw else to_match_query(text, prefix)
+        if not match_query:
+            return SearchPage([], None)
+        results = self._repository.search_entries(match_query, state=state, type=type, limit=limit + 1, offset=offset,
+                                                  max_staleness=max_staleness)
+        if len(results) <= limit:
+            return SearchPage(results, None)
+        return SearchPage(results[:limit], offset + limit)
+
+    def get_active_deadlines(self) -> list[tuple[int, int]]:
+        return self._repository.get_deadlines("active")
+
+    def get_due_entries(self, until) -> list[tuple[int, int]]:
+        return self._repository.get_deadlines("active", until)
+
+    def add_listener(self, listener):
+        self._listeners.append(listener)
+
+    def remove_listener(self, listener):
+        self._listeners.remove(listener)
+
+    def _notify(self, id, state):
+        for listener in self._listeners:
+            listener(id, state)
+
+    def invalidate(self, id = None):
+        self._cache.clear_cache(id)
+        self._content_cache.clear_cache(id)
+
+    def _changed(self, id, state):
+        self._cache.clear_cache(id)
+        self._notify(id, state)
+
+    def transaction(self):
+        return self._repository.transaction()
     
+    @instrumented
     def complete_entry(self, id, forced = False):
-        entry = self.get(id)
+        entry = self.get_header(id)
 
         if entry.is_completed():
             return False
@@ -119,14 +434,17 @@ class EntryLogic(EntryInterface, EntryTypeProvider):
             if not forced:
                 raise EntryDeadlineNotReachedError("This entry did not reach its deadline yet")
             self._repository.mark_as_completed(id, early=True)
+            state = "completed early"
         else:
             self._repository.mark_as_completed(id, early=False)
+            state = "completed"
         
-        self._cache.clear_cache(id)
+        self._repository.after_commit(lambda: self._changed(id, state))
         return True
 
+    @instrumented
     def cancel_entry(self, id):
-        entry = self.get(id)
+        entry = self.get_header(id)
 
         if entry.is_cancelled():
             return False
@@ -134,23 +452,25 @@ class EntryLogic(EntryInterface, EntryTypeProvider):
             raise EntryAlreadyCompletedError("This entry was already completed and cannot be cancelled")
         
         self._repository.mark_as_cancelled(id)
-        self._cache.clear_cache(id)
+        self._repository.after_commit(lambda: self._changed(id, "cancelled"))
         return True
 
+    @instrumented
     def approve_entry(self, id):
-        entry = self.get(id)
+        entry = self.get_header(id)
 
         if entry.is_approved():
-            raise False
+            raise EntryAlreadyApprovedError("This entry was already approved")
         if entry.is_denied():
             raise EntryDeniedError("This entry was already denied and cannot be approved")
         
         self._repository.mark_as_active(id)
-        self._cache.clear_cache(id)
+        self._repository.after_commit(lambda: self._changed(id, "active"))
         return True
     
+    @instrumented
     def deny_entry(self, id):
-        entry = self.get(id)
+        entry = self.get_header(id)
 
         if entry.is_denied():
             return False
@@ -158,19 +478,23 @@ class EntryLogic(EntryInterface, EntryTypeProvider):
             raise EntryAlreadyApprovedError("This entry was already approved and cannot be denied")
         
         self._repository.mark_as_cancelled(id)
-        self._cache.clear_cache(id)
+        self._repository.after_commit(lambda: self._changed(id, "cancelled"))
         return True
     
+    @instrumented
     def repeal_entry(self, id):
-        entry: Entry = self.get(id)
+        entry = self.get_header(id)
         if entry.state == "repealed":
             return False
         if not entry.is_completed():
             raise AmbassadorInvalidStateError(f"An entry with state \"{entry.state}\" cannot be repealed")
         
         self._repository.mark_as_repealed(id)
-        self._cache.clear_cache(id)
+        self._repository.after_commit(lambda: self._changed(id, "repealed"))
         return True
     
+    @instrumented
     def register_entry(self, title, content, type, author, role, deadline):
-        return self._repository.create_entry(title, content, type, author, role, deadline)
+        entry_id = self._repository.create_entry(title, content, type, author, role, deadline)
+        self._repository.after_commit(lambda: self.invalidate(entry_id))
+        return entry_id
@@ -0,0 +1,40 @@
+from typing import NamedTuple
+import json
+
+from database import Database, Repository
+
+EVENT_KINDS = ("state_changed", "vote_cast")
+
+class Event(NamedTuple):
+    id: int
+    kind: str
+    entry_id: int
+    payload: dict
+    created: int
+
+class EventRepository(Repository):
+    def __init__(self, db: Database) -> None:
+        self._db = db
+
+    def get_events(self, after, limit = 100) -> list[Event]:
+        result = self._db.read_query("""SELECT id, kind, entry, payload, created FROM event_outbox
+                                     WHERE id > ? ORDER BY id LIMIT ?
+            """, after, limit)
+        return [Event(id, kind, entry, None if payload is None else json.loads(payload), created)
+                for id, kind, entry, payload, created in result]
+
+    def get_cursor(self, consumer) -> int:
+        result = self._db.read_query_once("SELECT position FROM event_cursor WHERE consumer = ?", consumer)
+        return 0 if result is None else result[0]
+
+    def set_cursor(self, consumer, position):
+        self._db.execute("""INSERT INTO event_cursor (consumer, position) VALUES(?, ?)
+                         ON CONFLICT(consumer) DO UPDATE SET position = MAX(position, excluded.position)
+            """, consumer, position)
+        self._db.commit()
+
+    def prune(self) -> int:
+        # only events every known consumer has already processed
+        result = self._db.execute("DELETE FROM event_outbox WHERE id <= (SELECT MIN(position) FROM event_cursor)")
+        self._db.commit()
+        return result.rowcount
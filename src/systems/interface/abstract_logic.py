@@ -10,6 +10,11 @@ class EntryTypeProvider(ABC):
     def get_type(self, id: int) -> str:
         pass
 
+class Transactional(ABC):
+    @abstractmethod
+    def transaction(self):
+        pass
+
 class Deletable(ABC):
     @abstractmethod
     def delete(self, id: int):
@@ -20,6 +25,10 @@ class UserInterface(LogicInterface, Deletable):
     def get_user(self, id):
         pass
 
+    @abstractmethod
+    def get_users(self, ids) -> dict:
+        pass
+
     @abstractmethod
     def change_role(self, source_id, target_id, role):
         pass
@@ -45,11 +54,45 @@ class RepealInterface(LogicInterface):
     def set_repeal(self, entry_id, repealed_id):
         pass
 
+    @abstractmethod
+    def is_in_force(self, entry_id) -> bool:
+        pass
+
+    @abstractmethod
+    def laws_in_force(self) -> list:
+        pass
+
+    @abstractmethod
+    def repealed_by(self, entry_id) -> list[int]:
+        pass
+
 class EntryInterface(LogicInterface):
     @abstractmethod
     def get_entry(self, id):
         pass
 
+    @abstractmethod
+    def get_header(self, id):
+        pass
+
+    @abstractmethod
+    def get_content(self, id) -> str:
+        pass
+
+    @abstractmethod
+    def get_entries(self, ids) -> dict:
+        pass
+
+    @abstractmethod
+    def list_entries(self, *, state = None, type = None, author = None, deadline_from = None, deadline_to = None, after = None, limit = 50,
+                     max_staleness = None):
+        pass
+
+    @abstractmethod
+    def search_entries(self, text: str, *, state = None, type = None, limit = 20, offset = 0, prefix = False, raw = False,
+                       max_staleness = None):
+        pass
+
     @abstractmethod
     def complete_entry(self, id, forced = False):
         pass
@@ -74,6 +117,14 @@ class EntryInterface(LogicInterface):
     def register_entry(self, title, content, type, author, role, deadline) -> int:
         pass
 
+    @abstractmethod
+    def add_listener(self, listener):
+        pass
+
+    @abstractmethod
+    def remove_listener(self, listener):
+        pass
+
 class VotingInterface(LogicInterface):
     @abstractmethod
     def get_vote(self, voted_id: int):
@@ -91,13 +142,25 @@ class VotingInterface(LogicInterface):
     def get_verdict(self, voted_id: int):
         pass
 
+    @abstractmethod
+    def get_tally(self, voted_id: int):
+        pass
+
+    @abstractmethod
+    def subscribe(self, voted_id: int, callback, interval = None):
+        pass
+
+    @abstractmethod
+    def unsubscribe(self, subscription):
+        pass
+
 class ElectionInterface(LogicInterface):
     @abstractmethod
     def get_election(self, election_id: int):
         pass
 
     @abstractmethod
-    def elect(self, elector_id: int, elected_id: int):
+    def elect(self, elector_id: int, election_id: int, ranking: list[int]):
         pass
 
     @abstractmethod
@@ -0,0 +1,172 @@
+from typing import NamedTuple
+import asyncio
+import heapq
+import itertools
+import logging
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+class TallyUpdate(NamedTuple):
+    entry_id: int
+    tally: NamedTuple
+    delta: NamedTuple
+    final: bool
+
+class Subscription:
+    def __init__(self, entry_id, callback, interval, loop) -> None:
+        self.entry_id = entry_id
+        self.callback = callback
+        self.interval = interval
+        self.loop = loop
+        self.last = None
+        self.last_emit = None
+        self.due = None
+        self.final = False
+        self.cancelled = False
+
+class TallyStream:
+    def __init__(self, get_tally, *, interval = 2.0, clock = time.monotonic, background = True) -> None:
+        self._get_tally = get_tally
+        self._interval = interval
+        self._clock = clock
+        # without the background thread nothing is emitted until run_pending is called
+        self._background = background
+        self._subscriptions = {}
+        self._heap = []
+        self._order = itertools.count()
+        self._condition = threading.Condition()
+        self._thread = None
+        self._running = False
+
+    def subscribe(self, entry_id, callback, interval = None, loop = None) -> Subscription:
+        # callbacks of subscribers on an event loop run on that loop, coroutine functions are scheduled as tasks
+        if loop is None:
+            try:
+                loop = asyncio.get_running_loop()
+            except RuntimeError:
+                loop = None
+        subscription = Subscription(entry_id, callback, self._interval if interval is None else interval, loop)
+        with self._condition:
+            self._subscriptions.setdefault(entry_id, []).append(subscription)
+            # the first update carries the current tally
+            self._schedule(subscription, self._clock())
+            self._start()
+        return subscription
+
+    def unsubscribe(self, subscription: Subscription):
+        with self._condition:
+            subscription.cancelled = True
+            self._remove(subscription)
+
+    def _remove(self, subscription):
+        subscriptions = self._subscriptions.get(subscription.entry_id)
+        if subscriptions is not None and subscription in subscriptions:
+            subscriptions.remove(subscription)
+            if not subscriptions:
+                del self._subscriptions[subscription.entry_id]
+
+    def is_streaming(self, entry_id):
+        return entry_id in self._subscriptions
+
+    def publish(self, entry_id):
+        with self._condition:
+            for subscription in self._subscriptions.get(entry_id, ()):
+                # bursts collapse into the one update already scheduled for the end of the interval
+                earliest = self._clock() if subscription.last_emit is None else subscription.last_emit + subscription.interval
+                self._schedule(subscription, max(self._clock(), earliest))
+
+    def finish(self, entry_id):
+        with self._condition:
+            for subscription in self._subscriptions.pop(entry_id, ()):
+                subscription.final = True
+                self._schedule(subscription, self._clock(), force=True)
+
+    def _schedule(self, subscription: Subscription, due, force = False):
+        if subscription.due is not None and subscription.due <= due and not force:
+            return
+        subscription.due = due
+        heapq.heappush(self._heap, (due, next(self._order), subscription))
+        self._condition.notify_all()
+
+    def _take_due(self):
+        while self._heap and (self._heap[0][2].due != self._heap[0][0] or self._heap[0][2].cancelled):
+            heapq.heappop(self._heap)
+        if not self._heap or self._heap[0][0] > self._clock():
+            return None
+        subscription = heapq.heappop(self._heap)[2]
+        subscription.due = None
+        subscription.last_emit = self._clock()
+        return subscription
+
+    def _pop_due(self):
+        with self._condition:
+            while self._running:
+                subscription = self._take_due()
+                if subscription is not None:
+                    return subscription
+                if not self._heap:
+                    self._condition.wait()
+                else:
+                    self._condition.wait(self._heap[0][0] - self._clock())
+            return None
+
+    def run_pending(self) -> int:
+        delivered = 0
+        while True:
+            with self._condition:
+                subscription = self._take_due()
+            if subscription is None:
+                return delivered
+            delivered += self._send(subscription)
+
+    def _emit(self, subscription: Subscription) -> bool:
+        tally = self._get_tally(subscription.entry_id)
+        last = subscription.last
+        if last == tally and not subscription.final:
+            return False
+        # the delta is a Tally holding the change since the previous update
+        delta = tally if last is None else tally._replace(approve=tally.approve - last.approve, disapprove=tally.disapprove - last.disapprove,
+                                                          abstain=tally.abstain - last.abstain)
+        subscription.last = tally
+        self._deliver(subscription, TallyUpdate(subscription.entry_id, tally, delta, subscription.final))
+        return True
+
+    def _deliver(self, subscription: Subscription, update: TallyUpdate):
+        callback, loop = subscription.callback, subscription.loop
+        if loop is None:
+            callback(update)
+        elif asyncio.iscoroutinefunction(callback):
+            asyncio.run_coroutine_threadsafe(callback(update), loop)
+        else:
+            loop.call_soon_threadsafe(callback, update)
+
+    def _run(self):
+        while True:
+            subscription = self._pop_due()
+            if subscription is None:
+                return
+            self._send(subscription)
+
+    def _send(self, subscription: Subscription) -> bool:
+        try:
+            return self._emit(subscription)
+        except Exception:
+            logger.exception("Failed to stream the tally of entry %s", subscription.entry_id)
+            return False
+
+    def _start(self):
+        if self._running or not self._background:
+            return
+        self._running = True
+        self._thread = threading.Thread(target=self._run, name="tally-stream", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        with self._condition:
+            self._running = False
+            self._condition.notify_all()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
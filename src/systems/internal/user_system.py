@@ -2,9 +2,10 @@ from typing import NamedTuple
 
 from dataclasses import dataclass
 from exceptions import *
-from database import Database
+from database import Database, Repository
 from systems.interface.abstract_logic import UserInterface
 from utils.cache import Cache
+from utils.metrics import instrumented
 
 def can_change_role(source_role, target_role):
     pass 
@@ -16,69 +17,101 @@ class User(NamedTuple):
     display_name: str
     role: str
 
-class UserRepository:
+class UserRepository(Repository):
     def __init__(self, db: Database) -> None:
         self._db = db
 
-    def get_user(self, id) -> User:
-        entry = self._db.query_once("""SELECT a.id, a.discord_id, a.discord_username, a.display_name, b.role
-                       FROM user a
-                       JOIN roles b ON a.role = b.id
-                       WHERE a.id = ?
-                       """, id)
-        return User(*entry)
+    def _to_user(self, row) -> User:
+        return User(*row[:4], self._db.enums.roles.name_of(row[4]))
+
+    def get_user(self, id, max_staleness = None) -> User:
+        entry = self._db.read_query_once("SELECT id, discord_id, discord_username, display_name, role FROM user WHERE id = ?",
+                                         id, max_staleness=max_staleness)
+        if entry is None:
+            return None
+        return self._to_user(entry)
+
+    def get_users(self, ids, max_staleness = None) -> dict[int, User]:
+        result = self._db.read_query_many("SELECT id, discord_id, discord_username, display_name, role FROM user WHERE id IN ({keys})",
+                                          ids, max_staleness=max_staleness)
+        return {row[0]: self._to_user(row) for row in result}
 
     def set_role(self, id, role):
-        self._db.execute("UPDATE user SET role = (SELECT id FROM roles WHERE role = ?) WHERE id = ?", role, id)
-        self._db.commit()
+        with self._db.transaction():
+            self._db.execute("UPDATE user SET role = ? WHERE id = ?", self._db.enums.roles.id_of(role), id)
+            self._db.log_change("user", id)
 
     def update_username(self, id, username):
-        self._db.execute("UPDATE user SET discord_username = ? WHERE id = ?", username, id)
-        self._db.commit()
+        with self._db.transaction():
+            self._db.execute("UPDATE user SET discord_username = ? WHERE id = ?", username, id)
+            self._db.log_change("user", id)
 
     def update_display_name(self, id, display_name):
-        self._db.execute("UPDATE user SET display_name = ? WHERE id = ?", display_name, id)
-        self._db.commit()
+        with self._db.transaction():
+            self._db.execute("UPDATE user SET display_name = ? WHERE id = ?", display_name, id)
+            self._db.log_change("user", id)
 
     def create_user(self, discord_id, display_name, username, role = "everyone"):
-        result = self._db.execute("""INSERT INTO user (discord_id, discord_username, display_name, role) VALUES(
-                         ?, ?, ?,
-                         (SELECT id FROM roles WHERE role = ?)
-                         )
-                         """, discord_id, username, display_name, role)
-        self._db.commit()
+        with self._db.transaction():
+            result = self._db.execute("INSERT INTO user (discord_id, discord_username, display_name, role) VALUES(?, ?, ?, ?)",
+                                      discord_id, username, display_name, self._db.enums.roles.id_of(role))
+            self._db.log_change("user", result.lastrowid)
         return result.lastrowid
 
     def delete_user(self, id):
         pass
 
 class UserLogic(UserInterface):
-    def __init__(self, repository: UserRepository) -> None:
+    def __init__(self, repository: UserRepository, cache: Cache = None) -> None:
         self._repository = repository
-        self._cache = Cache()
+        self._cache = cache if cache is not None else Cache(max_size=4096, ttl=300, negative_ttl=30)
 
+    @instrumented
     def get(self, id) -> User:
-        return self._cache.get(id, lambda: self._repository.get_user(id))
+        load = lambda: self._repository.get_user(id)
+        user = load() if self._repository.in_transaction() else self._cache.get(id, load)
+        if user is None:
+            raise UserNotFoundError(f"No user with id \"{id}\" was found")
+        return user
     
     def get_user(self, id):
         return self.get(id)
+
+    @instrumented
+    def get_users(self, ids) -> dict[int, User]:
+        if self._repository.in_transaction():
+            users = self._repository.get_users(ids)
+        else:
+            users = self._cache.get_many(ids, self._repository.get_users)
+        return {id: user for id, user in users.items() if user is not None}
     
+    @instrumented
     def change_role(self, source_id, target_id, role):
         source_user = self.get(source_id)
         target_user = self.get(target_id)
         if not can_change_role(source_user.role, target_user.role):
             raise UserNotEnoughPermissionsError("Couldn't change role due to lack of permissions")
         self._repository.set_role(target_id, role)
-        self._cache.clear_cache(target_id)
+        self._repository.after_commit(lambda: self.invalidate(target_id))
 
+    @instrumented
     def change_username(self, id, username):
         self._repository.update_username(id, username)
+        self._repository.after_commit(lambda: self.invalidate(id))
         
+    @instrumented
     def change_display_name(self, id, display_name):
         self._repository.update_display_name(id, display_name)
+        self._repository.after_commit(lambda: self.invalidate(id))
 
     def delete(self, id):
         self._repository.delete_user(id)
+
+    def invalidate(self, id = None):
+        self._cache.clear_cache(id)
     
+    @instrumented
     def register_user(self, discord_id, display_name, username) -> int:
-        return self._repository.create_user(discord_id, display_name, username)
\ No newline at end of file
+        user_id = self._repository.create_user(discord_id, display_name, username)
+        self._repository.after_commit(lambda: self.invalidate(user_id))
+        return user_id
\ No newline at end of file
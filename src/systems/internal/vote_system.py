@@ -1,10 +1,23 @@
 from typing import Literal, NamedTuple
 
 from exceptions import *
-from database import Database
+from database import Database, Repository, TALLY_QUERY
 from utils.cache import Cache
+from utils.metrics import instrumented
 from systems.interface.abstract_logic import VotingInterface, EntryInterface, UserInterface
-from systems.entry_system import Entry
+from systems.entry_system import EntryHeader
+from systems.internal.tally_stream import Subscription, TallyStream
+
+VOTE_OPTIONS = ("approve", "disapprove", "abstain")
+# vote_store keeps the position in VOTE_OPTIONS instead of the name
+VOTE_CODES = {option: code for code, option in enumerate(VOTE_OPTIONS)}
+
+def get_verdict(approve_count, deny_count):
+    if approve_count == deny_count:
+        return "tie"
+    elif approve_count > deny_count:
+        return "approved"
+    return "denied"
 
 class Vote(NamedTuple):
     entry_id: int
@@ -18,66 +31,210 @@ class Vote(NamedTuple):
                 approve_count += 1
             elif vote == "disapprove":
                 deny_count += 1
-        if approve_count == deny_count:
-            return "tie"
-        elif approve_count > deny_count:
-            return "approved"
-        return "denied"
+        return get_verdict(approve_count, deny_count)
+
+class Tally(NamedTuple):
+    entry_id: int
+    approve: int
+    disapprove: int
+    abstain: int
+
+    @property
+    def total(self):
+        return self.approve + self.disapprove + self.abstain
+
+    def get_current_verdict(self):
+        return get_verdict(self.approve, self.disapprove)
     
-class VoteRepository:
+class VoteRepository(Repository):
     def __init__(self, db: Database) -> None:
         self._db = db
 
-    def get_vote(self, id) -> Vote:
-        result = self._db.query("SELECT caster, vote FROM vote_store WHERE entry = ?", id)
-        vote_dict = {}
-        for caster, vote in result:
-            vote_dict[caster] = vote
-        return Vote(id, vote_dict)
+    def get_tally(self, id, max_staleness = None) -> Tally:
+        result = self._db.read_query_once("SELECT approve, disapprove, abstain FROM vote_tally WHERE entry = ?", id, max_staleness=max_staleness)
+        if result is None and self._db.has_archive:
+            result = self._db.read_query_once("SELECT approve, disapprove, abstain FROM archive.vote_tally WHERE entry = ?",
+                                              id, max_staleness=max_staleness)
+        if result is None:
+            return Tally(id, 0, 0, 0)
+        return Tally(id, *result)
+
+    def get_votes(self, ids, max_staleness = None) -> dict[int, Vote]:
+        votes = {id: Vote(id, {}) for id in ids}
+        result = self._db.read_query_many("SELECT entry, caster, vote FROM vote_store WHERE entry IN ({keys})", votes, max_staleness=max_staleness)
+        for entry, caster, vote in result:
+            votes[entry].votes[caster] = VOTE_OPTIONS[vote]
+        missing = [id for id, vote in votes.items() if not vote.votes]
+        if missing and self._db.has_archive:
+            result = self._db.read_query_many("SELECT entry, caster, vote FROM archive.vote_store WHERE entry IN ({keys})",
+                                              missing, max_staleness=max_staleness)
+            for entry, caster, vote in result:
+                votes[entry].votes[caster] = VOTE_OPTIONS[vote]
+        return votes
+
+    def get_tallies(self, ids, max_staleness = None) -> dict[int, Tally]:
+        tallies = {id: Tally(id, 0, 0, 0) for id in ids}
+        result = self._db.read_query_many("SELECT entry, approve, disapprove, abstain FROM vote_tally WHERE entry IN ({keys})",
+                                          tallies, max_staleness=max_staleness)
+        found = set()
+        for row in result:
+            tallies[row[0]] = Tally(*row)
+            found.add(row[0])
+        missing = [id for id in tallies if id not in found]
+        if missing and self._db.has_archive:
+            result = self._db.read_query_many("SELECT entry, approve, disapprove, abstain FROM archive.vote_tally WHERE entry IN ({keys})",
+                                              missing, max_staleness=max_staleness)
+            for row in result:
+                tallies[row[0]] = Tally(*row)
+        return tallies
+
+    def get_all_tallies(self) -> dict[int, Tally]:
+        result = self._db.query("SELECT entry, approve, disapprove, abstain FROM vote_tally")
+        return {row[0]: Tally(*row) for row in result}
+
+    def rebuild_tallies(self):
+        with self._db.transaction():
+            self._db.rebuild_tallies()
+            self._db.log_change("vote")
+
+    def verify_tallies(self) -> list[int]:
+        stored = self.get_all_tallies()
+        result = self._db.query(TALLY_QUERY)
+        expected = {row[0]: Tally(*row) for row in result}
+        mismatched = []
+        for entry_id in stored.keys() | expected.keys():
+            if stored.get(entry_id, Tally(entry_id, 0, 0, 0)) != expected.get(entry_id, Tally(entry_id, 0, 0, 0)):
+                mismatched.append(entry_id)
+        return sorted(mismatched)
+
+    def get_vote(self, id, max_staleness = None) -> Vote:
+        result = self._db.read_query("SELECT caster, vote FROM vote_store WHERE entry = ?", id, max_staleness=max_staleness)
+        if not result and self._db.has_archive:
+            result = self._db.read_query("SELECT caster, vote FROM archive.vote_store WHERE entry = ?", id, max_staleness=max_staleness)
+        return Vote(id, {caster: VOTE_OPTIONS[vote] for caster, vote in result})
 
     def cast_vote(self, entry_id: int, user_id: str, vote):
-        self._db.insert("vote_store", {"caster": user_id, "entry": entry_id, "vote": vote})
-        self._db.commit()
+        # the previous vote is read under the write lock, so two re-votes of one caster cannot both count it
+        with self._db.transaction():
+            previous = self._db.query_once("SELECT vote FROM vote_store WHERE entry = ? AND caster = ?", entry_id, user_id)
+            previous = None if previous is None else VOTE_OPTIONS[previous[0]]
+            if previous == vote:
+                return
+            self._db.execute("""INSERT INTO vote_store (entry, caster, vote) VALUES(?, ?, ?)
+                             ON CONFLICT(entry, caster) DO UPDATE SET vote = excluded.vote
+                """, entry_id, user_id, VOTE_CODES[vote])
+            self._db.log_change("vote", entry_id)
+            self._db.append_event("vote_cast", entry_id, {"caster": user_id, "vote": vote, "previous": previous})
+            self._db.execute("INSERT OR IGNORE INTO vote_tally (entry) VALUES(?)", entry_id)
+            if previous is None:
+                self._db.execute(f"UPDATE vote_tally SET {vote} = {vote} + 1 WHERE entry = ?", entry_id)
+            else:
+                self._db.execute(f"UPDATE vote_tally SET {vote} = {vote} + 1, {previous} = {previous} - 1 WHERE entry = ?", entry_id)
 
 class VoteLogic(VotingInterface):
-    def __init__(self, repository: VoteRepository, user_logic: UserInterface, entry_logic: EntryInterface) -> None:
+    def __init__(self, repository: VoteRepository, user_logic: UserInterface, entry_logic: EntryInterface, cache: Cache = None) -> None:
         self._repository = repository
         self._user_logic = user_logic
         self._entry_logic = entry_logic
-        self._cache = Cache()
+        self._cache = cache if cache is not None else Cache(max_size=256, ttl=60)
+        self._tally_cache = Cache(max_size=1024, ttl=60)
+        self._stream = TallyStream(self.get_tally)
+        entry_logic.add_listener(self._on_state_change)
 
     def get(self, id):
         return self.get_vote(id)
 
+    @instrumented
     def get_vote(self, id) -> Vote:
-        return self._cache.get(id, lambda: self._repository.get_vote(id))
+        load = lambda: self._repository.get_vote(id)
+        return load() if self._repository.in_transaction() else self._cache.get(id, load)
+
+    @instrumented
+    def get_votes(self, ids) -> dict[int, Vote]:
+        # like get_vote, a transaction reads past the shared cache and leaves it as it was
+        if self._repository.in_transaction():
+            votes = self._repository.get_votes(ids)
+            return {id: votes.get(id) for id in ids}
+        return self._cache.get_many(ids, self._repository.get_votes)
+
+    @instrumented
+    def get_tally(self, id) -> Tally:
+        load = lambda: self._repository.get_tally(id)
+        return load() if self._repository.in_transaction() else self._tally_cache.get(id, load)
+
+    @instrumented
+    def get_tallies(self, ids) -> dict[int, Tally]:
+        if self._repository.in_transaction():
+            tallies = self._repository.get_tallies(ids)
+            return {id: tallies.get(id) for id in ids}
+        return self._tally_cache.get_many(ids, self._repository.get_tallies)
     
+    @instrumented
     def cast_vote(self, caster_id: str, entry_id: int, vote: Literal["approve", "disapprove", "abstain"]):
-        entry: Entry = self._entry_logic.get_entry(entry_id)
-        if entry.is_completed():
-            raise VoteAlreadyDoneError("Couldn't cast vote. The vote was already completed")
-        if entry.is_cancelled():
-            raise VoteAlreadyDoneError("Couldn't cast vote. The vote was already cancelled")
-        if not entry.is_active():
-            raise VoteAlreadyDoneError("Couldn't cast vote. The vote is not active")
-        
+        if vote not in VOTE_OPTIONS:
+            raise VoteInvalidError(f"Couldn't cast vote. \"{vote}\" is not a valid vote")
         caster = self._user_logic.get_user(caster_id)
-        if not entry.has_user_permissions(caster.role):
-            raise UserNotEnoughPermissionsError("Couldn't cast vote. The user does not have enough permissions")
+        # the state is read under the write lock, so the entry cannot be completed between the check and the vote
+        with self._repository.transaction():
+            entry: EntryHeader = self._entry_logic.get_header(entry_id)
+            if entry.is_completed():
+                raise VoteAlreadyDoneError("Couldn't cast vote. The vote was already completed")
+            if entry.is_cancelled():
+                raise VoteAlreadyDoneError("Couldn't cast vote. The vote was already cancelled")
+            if not entry.is_active():
+                raise VoteAlreadyDoneError("Couldn't cast vote. The vote is not active")
+
+            if not entry.has_user_permissions(caster.role):
+                raise UserNotEnoughPermissionsError("Couldn't cast vote. The user does not have enough permissions")
+
+            self._repository.cast_vote(entry_id, caster_id, vote)
+            self._repository.after_commit(lambda: self._voted(entry_id))
 
-        self._repository.cast_vote(entry_id, caster_id, vote)
-        self._cache.clear_cache(caster_id)
+    def _voted(self, entry_id):
+        self.invalidate(entry_id)
+        self._stream.publish(entry_id)
+
+    def _on_state_change(self, id, state):
+        # once the vote is over every subscriber gets the final tally right away
+        if state != "active":
+            self._stream.finish(id)
+
+    def subscribe(self, entry_id, callback, interval = None) -> Subscription:
+        subscription = self._stream.subscribe(entry_id, callback, interval)
+        # checked after subscribing, an entry that closes in between is finished either here or by its state change
+        try:
+            entry = self._entry_logic.get_header(entry_id)
+        except EntryNotFoundError:
+            self._stream.unsubscribe(subscription)
+            raise
+        if not (entry.is_active() or entry.is_proposed()):
+            self._stream.finish(entry_id)
+        return subscription
+
+    def unsubscribe(self, subscription: Subscription):
+        self._stream.unsubscribe(subscription)
 
     def is_voting_done(self, voted_id: int):
         pass
 
+    @instrumented
     def get_verdict(self, entry_id):
-        entry: Entry = self._entry_logic.get_entry(entry_id)
+        entry: EntryHeader = self._entry_logic.get_header(entry_id)
         if entry.is_active():
             raise VoteNotDoneError("Couldn't get verdict. The vote was not completed")
         if entry.is_cancelled():
             raise EntryCancelledError("Couldn't get verdict. The vote was cancelled")
         if not entry.is_completed():
             raise VoteNotDoneError("Couldn't get verdict. There is no vote happening") # aa i want to use a differenttt thingy for this
-        vote = self._repository.get_vote(entry_id)
-        return vote.get_current_verdict()
\ No newline at end of file
+        return self.get_tally(entry_id).get_current_verdict()
+
+    def rebuild_tallies(self):
+        self._repository.rebuild_tallies()
+        self._tally_cache.clear_cache()
+
+    def verify_tallies(self) -> list[int]:
+        return self._repository.verify_tallies()
+
+    def invalidate(self, id = None):
+        self._cache.clear_cache(id)
+        self._tally_cache.clear_cache(id)
\ No newline at end of file
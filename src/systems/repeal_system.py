@@ -1,44 +1,82 @@
 from typing import NamedTuple
 
 from exceptions import *
-from database import Database
+from database import Database, Repository
 from utils.cache import Cache
+from utils.metrics import instrumented
 from systems.interface.abstract_logic import VotingInterface, EntryInterface, RepealInterface
-from systems.entry_system import Entry
+from systems.entry_system import EntryHeader
 
 class Repeal(NamedTuple):
     entry_id: int
     repealed_id: int
     
-class RepealRepository:
+class RepealRepository(Repository):
     def __init__(self, db: Database) -> None:
         self._db = db
 
     def get_repeal(self, id) -> Repeal:
         result = self._db.query_once("SELECT * FROM repeal_store WHERE entry_id = ?", id)
+        if result is None and self._db.has_archive:
+            result = self._db.query_once("SELECT * FROM archive.repeal_store WHERE entry_id = ?", id)
+        if result is None:
+            return None
         return Repeal(*result)
 
     def set_repeal(self, id, repealed_id):
-        self._db.insert("repeal_store", {"entry_id": id, "repealed_id": repealed_id})
+        with self._db.transaction():
+            self._db.insert("repeal_store", {"entry_id": id, "repealed_id": repealed_id})
+            self._db.log_change("repeal", id)
+
+    def get_repeals_of(self, repealed_id) -> list[int]:
+        result = self._db.read_query("SELECT entry_id FROM repeal_store WHERE repealed_id = ?", repealed_id)
+        if self._db.has_archive:
+            result += self._db.read_query("SELECT entry_id FROM archive.repeal_store WHERE repealed_id = ?", repealed_id)
+        return sorted(row[0] for row in result)
+
+    def is_in_force(self, id) -> bool:
+        return self._db.read_query_once("SELECT 1 FROM laws_in_force WHERE entry_id = ?", id) is not None
+
+    def get_in_force(self, ids) -> set[int]:
+        result = self._db.read_query_many("SELECT entry_id FROM laws_in_force WHERE entry_id IN ({keys})", ids)
+        return {row[0] for row in result}
+
+    def get_laws_in_force(self) -> list[int]:
+        return [row[0] for row in self._db.read_query("SELECT entry_id FROM laws_in_force ORDER BY enacted, entry_id")]
+
+    def rebuild_laws(self):
+        with self._db.transaction():
+            self._db.rebuild_laws()
+            self._db.log_change("entry")
 
 class RepealLogic(RepealInterface, VotingInterface):
-    def __init__(self, repository: RepealRepository, vote_logic: VotingInterface, entry_logic: EntryInterface) -> None:
+    def __init__(self, repository: RepealRepository, vote_logic: VotingInterface, entry_logic: EntryInterface, cache: Cache = None) -> None:
         self._repository = repository
         self._vote_logic = vote_logic
         self._entry_logic = entry_logic
-        self._cache = Cache()
+        self._cache = cache if cache is not None else Cache(max_size=1024, ttl=300, negative_ttl=30)
 
+    @instrumented
     def get(self, id) -> Repeal:
-        return self._cache.get(id, lambda: self._repository.get_repeal(id))
+        load = lambda: self._repository.get_repeal(id)
+        repeal = load() if self._repository.in_transaction() else self._cache.get(id, load)
+        if repeal is None:
+            raise EntryNotFoundError(f"No repeal was set for the entry with id \"{id}\"")
+        return repeal
     
     def get_repeal(self, entry_id):
         return self.get(entry_id)
 
+    def invalidate(self, id = None):
+        self._cache.clear_cache(id)
+
+    @instrumented
     def set_repeal(self, entry_id, repealed_id):
-        entry: Entry = self._entry_logic.get(entry_id)
+        entry: EntryHeader = self._entry_logic.get_header(entry_id)
         if entry.type != "repeal":
             raise AmbassadorOperationNotSupportedError(f"Cannot set repeal to entry of type \"{entry.type}\"")
         self._repository.set_repeal(entry_id, repealed_id)
+        self._repository.after_commit(lambda: self.invalidate(entry_id))
     
     def get_vote(self, id):
         return self._vote_logic.get_vote(id)
@@ -46,13 +84,49 @@ class RepealLogic(RepealInterface, VotingInterface):
     def cast_vote(self, caster_id, entry_id, vote):
         self._vote_logic.cast_vote(caster_id, entry_id, vote)
 
+    def get_tally(self, id):
+        return self._vote_logic.get_tally(id)
+
+    def subscribe(self, entry_id, callback, interval = None):
+        return self._vote_logic.subscribe(entry_id, callback, interval)
+
+    def unsubscribe(self, subscription):
+        self._vote_logic.unsubscribe(subscription)
+
+    def is_in_force(self, entry_id) -> bool:
+        return self._repository.is_in_force(entry_id)
+
+    def get_in_force(self, entry_ids) -> set[int]:
+        entry_ids = list(set(entry_ids))
+        return self._repository.get_in_force(entry_ids) if entry_ids else set()
+
+    @instrumented
+    def laws_in_force(self) -> list[EntryHeader]:
+        ids = self._repository.get_laws_in_force()
+        headers = self._entry_logic.get_headers(ids)
+        return [headers[id] for id in ids if id in headers]
+
+    def repealed_by(self, entry_id) -> list[int]:
+        return self._repository.get_repeals_of(entry_id)
+
+    def rebuild_laws(self):
+        self._repository.rebuild_laws()
+
     def is_voting_done(self, voted_id: int):
         return self._vote_logic.is_voting_done(voted_id)
 
+    @instrumented
     def get_verdict(self, entry_id):
         verdict = self._vote_logic.get_verdict(entry_id)
         if verdict == "denied":
             return verdict
         repeal_id = self.get(entry_id).repealed_id
-        self._entry_logic.repeal_entry(repeal_id)
-        return verdict
\ No newline at end of file
+        # polling a verdict whose repeal already went through only reads
+        if self._entry_logic.get_header(repeal_id).state == "repealed":
+            return verdict
+        # the verdict and the repeal it causes are read again and written in one transaction
+        with self._repository.transaction():
+            verdict = self._vote_logic.get_verdict(entry_id)
+            if verdict != "denied":
+                self._entry_logic.repeal_entry(repeal_id)
+            return verdict
\ No newline at end of file
@@ -0,0 +1,158 @@
+import heapq
+import logging
+import threading
+import time
+
+from exceptions import *
+from systems.entry_system import EntryLogic
+
+logger = logging.getLogger(__name__)
+
+class DeadlineScheduler:
+    def __init__(self, entry_logic: EntryLogic, *, clock = time.time, retry_delay = 30, max_retry_delay = 3600) -> None:
+        self._entry_logic = entry_logic
+        self._clock = clock
+        self._retry_delay = retry_delay
+        self._max_retry_delay = max_retry_delay
+        self._heap = []
+        self._deadlines = {}
+        self._failures = {}
+        self._condition = threading.Condition()
+        self._thread = None
+        self._running = False
+        entry_logic.add_listener(self._on_state_change)
+
+    def _on_state_change(self, id, state):
+        if state == "active":
+            self.schedule(id, self._entry_logic.get_header(id).end_date)
+        else:
+            self.unschedule(id)
+
+    def load(self):
+        for id, deadline in self._entry_logic.get_active_deadlines():
+            self.schedule(id, deadline)
+
+    def schedule(self, id, deadline):
+        if deadline is None:
+            # an entry without a deadline never becomes due, and None cannot be ordered against the others
+            logger.warning("Not scheduling entry %s, it has no deadline", id)
+            return
+        with self._condition:
+            if self._deadlines.get(id) == deadline:
+                return
+            self._deadlines[id] = deadline
+            heapq.heappush(self._heap, (deadline, id))
+            if self._heap[0] == (deadline, id):
+                self._condition.notify_all()
+
+    def unschedule(self, id):
+        with self._condition:
+            # the heap item is left behind and skipped once it reaches the top
+            self._deadlines.pop(id, None)
+            self._failures.pop(id, None)
+
+    def is_scheduled(self, id):
+        return id in self._deadlines
+
+    def _is_current(self, item):
+        deadline, id = item
+        return self._deadlines.get(id) == deadline
+
+    def _discard_stale(self):
+        while self._heap and not self._is_current(self._heap[0]):
+            heapq.heappop(self._heap)
+
+    def next_deadline(self):
+        with self._condition:
+            self._discard_stale()
+            return self._heap[0] if self._heap else None
+
+    def due_within(self, seconds, now = None) -> list[tuple[int, int]]:
+        limit = (now if now is not None else self._clock()) + seconds
+        due = []
+        with self._condition:
+            if not self._heap:
+                return due
+            # walk the heap in order, only visiting nodes that can still be inside the window
+            frontier = [(self._heap[0], 0)]
+            while frontier:
+                item, index = heapq.heappop(frontier)
+                if item[0] > limit:
+                    break
+                if self._is_current(item):
+                    due.append((item[1], item[0]))
+                for child in (2 * index + 1, 2 * index + 2):
+                    if child < len(self._heap):
+                        heapq.heappush(frontier, (self._heap[child], child))
+        return due
+
+    def _pop_due(self, now):
+        due = []
+        with self._condition:
+            self._discard_stale()
+            while self._heap and self._heap[0][0] < now:
+                # the entry stays in _deadlines until it was completed, so a failed attempt can be retried
+                deadline, id = heapq.heappop(self._heap)
+                if self._deadlines.get(id) == deadline:
+                    due.append(id)
+                self._discard_stale()
+        return due
+
+    def _retry(self, id, now):
+        with self._condition:
+            if id not in self._deadlines:
+                return
+            failures = self._failures[id] = self._failures.get(id, 0) + 1
+            retry_at = now + min(self._retry_delay * 2 ** (failures - 1), self._max_retry_delay)
+            self._deadlines[id] = retry_at
+            heapq.heappush(self._heap, (retry_at, id))
+            self._condition.notify_all()
+
+    def run_pending(self, now = None) -> list[int]:
+        now = now if now is not None else self._clock()
+        completed = []
+        for id in self._pop_due(now):
+            try:
+                if self._entry_logic.complete_entry(id):
+                    completed.append(id)
+            except AmbassadorError as error:
+                logger.info("Skipped completing entry %s: %s", id, error)
+            except Exception:
+                logger.exception("Failed to complete entry %s, retrying later", id)
+                self._retry(id, now)
+                continue
+            self.unschedule(id)
+        return completed
+
+    def _run(self):
+        while True:
+            with self._condition:
+                while self._running:
+                    self._discard_stale()
+                    if not self._heap:
+                        self._condition.wait()
+                        continue
+                    delay = self._heap[0][0] - self._clock()
+                    if delay < 0:
+                        break
+                    # complete_entry requires the current time to be strictly past the deadline
+                    self._condition.wait(delay + 0.001)
+                if not self._running:
+                    return
+            self.run_pending()
+
+    def start(self):
+        with self._condition:
+            if self._running:
+                return
+            self._running = True
+        self._thread = threading.Thread(target=self._run, name="deadline-scheduler", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        with self._condition:
+            self._running = False
+            self._condition.notify_all()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
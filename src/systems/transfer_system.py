@@ -0,0 +1,175 @@
+from contextlib import nullcontext
+from itertools import islice
+import csv
+import json
+import zlib
+
+from exceptions import *
+from database import Database, Repository
+from systems.internal.vote_system import VOTE_OPTIONS, VOTE_CODES
+
+# the columns of each kind of record, in the order they are written to csv
+COLUMNS = {
+    "users": ("id", "discord_id", "discord_username", "display_name", "role"),
+    "entries": ("id", "type", "state", "role", "author", "creation_date", "deadline", "title", "content"),
+    "votes": ("entry", "caster", "vote"),
+    "repeals": ("entry_id", "repealed_id"),
+}
+
+TABLES = {"users": "user", "entries": "entry_data", "votes": "vote_store", "repeals": "repeal_store"}
+
+CHANGE_KINDS = {"users": "user", "entries": "entry", "votes": "vote", "repeals": "repeal"}
+
+UPSERTS = {
+    "users": """INSERT INTO user (id, discord_id, discord_username, display_name, role) VALUES(?, ?, ?, ?, ?)
+             ON CONFLICT(id) DO UPDATE SET discord_id = excluded.discord_id, discord_username = excluded.discord_username,
+             display_name = excluded.display_name, role = excluded.role""",
+    "entries": """INSERT INTO entry_data (id, type, state, role, author, creation_date, deadline, title, content)
+               VALUES(?, ?, ?, ?, ?, ?, ?, ?, ?)
+               ON CONFLICT(id) DO UPDATE SET type = excluded.type, state = excluded.state, role = excluded.role,
+               author = excluded.author, creation_date = excluded.creation_date, deadline = excluded.deadline,
+               title = excluded.title, content = excluded.content""",
+    "votes": """INSERT INTO vote_store (entry, caster, vote) VALUES(?, ?, ?)
+             ON CONFLICT(entry, caster) DO UPDATE SET vote = excluded.vote""",
+    "repeals": """INSERT INTO repeal_store (entry_id, repealed_id) VALUES(?, ?)
+               ON CONFLICT(entry_id) DO UPDATE SET repealed_id = excluded.repealed_id""",
+}
+
+def read_jsonl(stream):
+    for line in stream:
+        if line.strip():
+            yield json.loads(line)
+
+def read_csv(stream):
+    # csv has no null, an empty field is read as one
+    for record in csv.DictReader(stream):
+        yield {key: None if value == "" else value for key, value in record.items()}
+
+def write_jsonl(stream, columns, rows) -> int:
+    count = 0
+    for row in rows:
+        stream.write(json.dumps(dict(zip(columns, row)), ensure_ascii=False))
+        stream.write("\n")
+        count += 1
+    return count
+
+def write_csv(stream, columns, rows) -> int:
+    writer = csv.writer(stream)
+    writer.writerow(columns)
+    count = 0
+    for row in rows:
+        writer.writerow(row)
+        count += 1
+    return count
+
+class TransferRepository(Repository):
+    def __init__(self, db: Database) -> None:
+        self._db = db
+
+    def get_resolvers(self, kind):
+        # names are resolved through the enum maps loaded once, not with a lookup per row
+        enums = self._db.enums
+        if kind == "users":
+            return {"role": enums.roles.id_of}
+        if kind == "entries":
+            return {"type": enums.entry_types.id_of, "state": enums.state_types.id_of, "role": enums.roles.id_of}
+        if kind == "votes":
+            return {"vote": _vote_code}
+        return {}
+
+    def write_rows(self, kind, rows):
+        self._db.execute_many(UPSERTS[kind], rows)
+        self._db.commit()
+
+    def deferred_indexes(self, kind):
+        return self._db.deferred_indexes([TABLES[kind]])
+
+    def finish_import(self, kinds):
+        # bulk writes skip the per-row bookkeeping, so everything derived from them is rebuilt once
+        if "votes" in kinds:
+            self._db.rebuild_tallies()
+        if "entries" in kinds or "votes" in kinds:
+            self._db.rebuild_laws()
+        for kind in kinds:
+            self._db.log_change(CHANGE_KINDS[kind])
+        self._db.commit()
+
+    def iter_rows(self, kind, batch_size):
+        enums = self._db.enums
+        if kind == "users":
+            for row in self._db.iter_query("SELECT id, discord_id, discord_username, display_name, role FROM user ORDER BY id",
+                                           batch_size=batch_size):
+                yield (*row[:4], enums.roles.name_of(row[4]))
+        elif kind == "entries":
+            for table in self._tables("entry_data"):
+                # archived content is stored compressed
+                compressed = table.startswith("archive.")
+                for row in self._db.iter_query(f"""SELECT id, type, state, role, author, creation_date, deadline, title, content
+                                               FROM {table} ORDER BY id
+                    """, batch_size=batch_size):
+                    content = _decompress(row[8]) if compressed and row[8] is not None else row[8]
+                    yield (row[0], enums.entry_types.name_of(row[1]), enums.state_types.name_of(row[2]),
+                           enums.roles.name_of(row[3]), *row[4:8], content)
+        elif kind == "votes":
+            for table in self._tables("vote_store"):
+                for entry, caster, vote in self._db.iter_query(f"SELECT entry, caster, vote FROM {table} ORDER BY entry, caster",
+                                                               batch_size=batch_size):
+                    yield entry, caster, VOTE_OPTIONS[vote]
+        else:
+            for table in self._tables("repeal_store"):
+                yield from self._db.iter_query(f"SELECT entry_id, repealed_id FROM {table} ORDER BY entry_id", batch_size=batch_size)
+
+    def _tables(self, table):
+        # an entry copied to the archive but not yet removed from the main database is exported once
+        yield table
+        if self._db.has_archive:
+            key = {"entry_data": "id", "vote_store": "entry"}.get(table, "entry_id")
+            yield f"archive.{table} WHERE {key} NOT IN (SELECT {key} FROM {table})"
+
+def _vote_code(vote) -> int:
+    try:
+        return VOTE_CODES[vote]
+    except KeyError:
+        raise VoteInvalidError(f"\"{vote}\" is not a valid vote") from None
+
+def _decompress(content: bytes) -> str:
+    return zlib.decompress(content).decode()
+
+class TransferLogic:
+    def __init__(self, repository: TransferRepository) -> None:
+        self._repository = repository
+
+    def _to_rows(self, kind, records):
+        columns = COLUMNS[kind]
+        resolvers = self._repository.get_resolvers(kind)
+        for number, record in enumerate(records, 1):
+            try:
+                row = [record.get(column) for column in columns]
+                for index, column in enumerate(columns):
+                    resolve = resolvers.get(column)
+                    if resolve is not None and row[index] is not None:
+                        row[index] = resolve(row[index])
+            except AmbassadorError as error:
+                raise type(error)(f"Record {number}: {error}") from None
+            yield row
+
+    def import_records(self, kind, records, *, batch_size = 10000, defer_indexes = False) -> int:
+        # records are consumed batch_size at a time, so memory does not grow with the size of the import
+        if kind not in COLUMNS:
+            raise AmbassadorUnknownValueError(f"\"{kind}\" is not a kind of record that can be imported")
+        rows = self._to_rows(kind, records)
+        imported = 0
+        with self._repository.deferred_indexes(kind) if defer_indexes else nullcontext():
+            while batch := list(islice(rows, batch_size)):
+                # one transaction per batch instead of one commit per row
+                with self._repository.transaction():
+                    self._repository.write_rows(kind, batch)
+                imported += len(batch)
+        with self._repository.transaction():
+            self._repository.finish_import([kind])
+        return imported
+
+    def export_records(self, kind, *, batch_size = 1000):
+        if kind not in COLUMNS:
+            raise AmbassadorUnknownValueError(f"\"{kind}\" is not a kind of record that can be exported")
+        return self._repository.iter_rows(kind, batch_size)
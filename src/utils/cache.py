@@ -1,17 +1,186 @@
-class Cache:
+from collections import OrderedDict
+from typing import NamedTuple
+import threading
+import time
+
+_MISSING = object()
+
+class CacheStats(NamedTuple):
+    hits: int
+    misses: int
+    evictions: int
+    expirations: int
+    size: int
+
+    @property
+    def hit_rate(self):
+        total = self.hits + self.misses
+        return self.hits / total if total else 0.0
+
+class _Load:
     def __init__(self) -> None:
-        self._cache = {}
-        pass
+        self.done = threading.Event()
+        self.invalidated = False
+        self.value = None
+        self.error = None
+
+    def wait(self):
+        self.done.wait()
+        if self.error is not None:
+            raise self.error
+        return self.value
+
+class Cache:
+    def __init__(self, max_size: int = None, ttl: float = None, *, negative_ttl: float = None, clock = time.monotonic) -> None:
+        self._cache = OrderedDict()
+        self._max_size = max_size
+        self._ttl = ttl
+        self._negative_ttl = ttl if negative_ttl is None else negative_ttl
+        self._clock = clock
+        self._lock = threading.Lock()
+        self._loading = {}
+        self._hits = 0
+        self._misses = 0
+        self._evictions = 0
+        self._expirations = 0
+
+    def _lookup(self, arg):
+        item = self._cache.get(arg, _MISSING)
+        if item is _MISSING:
+            return _MISSING
+        value, expires = item
+        if expires is not None and self._clock() >= expires:
+            del self._cache[arg]
+            self._expirations += 1
+            return _MISSING
+        self._cache.move_to_end(arg)
+        return value
+
+    def _store(self, arg, value):
+        ttl = self._negative_ttl if value is None else self._ttl
+        if ttl is not None and ttl <= 0:
+            return
+        expires = None if ttl is None else self._clock() + ttl
+        self._cache[arg] = (value, expires)
+        self._cache.move_to_end(arg)
+        if self._max_size is not None:
+            while len(self._cache) > self._max_size:
+                self._cache.popitem(last=False)
+                self._evictions += 1
 
     def get(self, arg, fallback = None):
-        if arg not in self._cache:
+        with self._lock:
+            value = self._lookup(arg)
+            if value is not _MISSING:
+                self._hits += 1
+                return value
+            self._misses += 1
             if fallback is None:
                 return None
-            self._cache[arg] = fallback()
-        return self._cache[arg]
-        
+            load = self._loading.get(arg)
+            if load is not None:
+                owner = False
+            else:
+                load = self._loading[arg] = _Load()
+                owner = True
+
+        if not owner:
+            return load.wait()
+
+        try:
+            value = fallback()
+        except BaseException as error:
+            load.error = error
+            raise
+        else:
+            load.value = value
+            return value
+        finally:
+            with self._lock:
+                del self._loading[arg]
+                if load.error is None and not load.invalidated:
+                    self._store(arg, value)
+            load.done.set()
+
+    def get_many(self, args, fallback = None) -> dict:
+        results = {}
+        owned = {}
+        waiting = {}
+        with self._lock:
+            for arg in args:
+                if arg in results or arg in owned or arg in waiting:
+                    continue
+                value = self._lookup(arg)
+                if value is not _MISSING:
+                    self._hits += 1
+                    results[arg] = value
+                    continue
+                self._misses += 1
+                if fallback is None:
+                    results[arg] = None
+                    continue
+                load = self._loading.get(arg)
+                if load is not None:
+                    waiting[arg] = load
+                else:
+                    owned[arg] = self._loading[arg] = _Load()
+
+        if owned:
+            loaded = None
+            try:
+                loaded = fallback(list(owned))
+            except BaseException as error:
+                for load in owned.values():
+                    load.error = error
+                raise
+            finally:
+                with self._lock:
+                    for arg, load in owned.items():
+                        del self._loading[arg]
+                        if load.error is None:
+                            # keys the fallback did not return are cached as not found
+                            load.value = loaded.get(arg)
+                            if not load.invalidated:
+                                self._store(arg, load.value)
+                for load in owned.values():
+                    load.done.set()
+            for arg, load in owned.items():
+                results[arg] = load.value
+
+        for arg, load in waiting.items():
+            results[arg] = load.wait()
+        return results
+
+    def set(self, arg, value):
+        with self._lock:
+            load = self._loading.get(arg)
+            if load is not None:
+                load.invalidated = True
+            self._store(arg, value)
+
     def clear_cache(self, arg = None):
-        if arg is None:
-            self._cache.clear()
-        elif arg in self._cache:
-            del self._cache[arg]
\ No newline at end of file
+        with self._lock:
+            if arg is None:
+                self._cache.clear()
+                for load in self._loading.values():
+                    load.invalidated = True
+                return
+            self._cache.pop(arg, None)
+            load = self._loading.get(arg)
+            if load is not None:
+                load.invalidated = True
+
+    def stats(self) -> CacheStats:
+        with self._lock:
+            return CacheStats(self._hits, self._misses, self._evictions, self._expirations, len(self._cache))
+
+    def reset_stats(self):
+        with self._lock:
+            self._hits = 0
+            self._misses = 0
+            self._evictions = 0
+            self._expirations = 0
+
+    def __contains__(self, arg):
+        with self._lock:
+            return self._lookup(arg) is not _MISSING
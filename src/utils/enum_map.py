@@ -0,0 +1,37 @@
+from typing import NamedTuple
+
+from exceptions import AmbassadorUnknownValueError
+
+class EnumMap:
+    def __init__(self, table: str, rows) -> None:
+        self._table = table
+        self._names = {}
+        self._ids = {}
+        for id, name in rows:
+            self._names[id] = name
+            self._ids[name] = id
+
+    def id_of(self, name) -> int:
+        try:
+            return self._ids[name]
+        except KeyError:
+            raise AmbassadorUnknownValueError(f"\"{name}\" is not a known value of {self._table}") from None
+
+    def name_of(self, id) -> str:
+        if id is None:
+            return None
+        try:
+            return self._names[id]
+        except KeyError:
+            raise AmbassadorUnknownValueError(f"{id} is not a known id of {self._table}") from None
+
+    def names(self):
+        return list(self._ids)
+
+    def __contains__(self, name):
+        return name in self._ids
+
+class Enums(NamedTuple):
+    roles: EnumMap
+    entry_types: EnumMap
+    state_types: EnumMap
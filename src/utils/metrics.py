@@ -0,0 +1,173 @@
+from functools import lru_cache, wraps
+import bisect
+import logging
+import re
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+# upper bounds in seconds, 10us doubling up to ~20s
+DEFAULT_BUCKETS = tuple(0.00001 * 2 ** exponent for exponent in range(22))
+
+_WHITESPACE = re.compile(r"\s+")
+_PLACEHOLDER_LIST = re.compile(r"\((?:\s*\?\s*,)*\s*\?\s*\)")
+_STRING_LITERAL = re.compile(r"'(?:[^']|'')*'")
+_NUMBER_LITERAL = re.compile(r"(?<![\w?])-?\d+(?:\.\d+)?\b")
+
+@lru_cache(maxsize=1024)
+def normalize_sql(statement: str) -> str:
+    statement = _WHITESPACE.sub(" ", statement).strip()
+    statement = _STRING_LITERAL.sub("?", statement)
+    statement = _NUMBER_LITERAL.sub("?", statement)
+    return _PLACEHOLDER_LIST.sub("(?, ...)", statement)
+
+class Histogram:
+    def __init__(self, buckets = DEFAULT_BUCKETS) -> None:
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.count = 0
+        self.sum = 0.0
+        self.max = 0.0
+
+    def observe(self, value):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.count += 1
+        self.sum += value
+        if value > self.max:
+            self.max = value
+
+    def percentile(self, fraction):
+        if not self.count:
+            return 0.0
+        rank = fraction * self.count
+        seen = 0
+        for index, count in enumerate(self.counts):
+            if seen + count >= rank and count:
+                # interpolate inside the bucket, the last bucket is capped by the largest value seen
+                lower = self.buckets[index - 1] if index > 0 else 0.0
+                upper = self.buckets[index] if index < len(self.buckets) else self.max
+                return min(lower + (upper - lower) * (rank - seen) / count, self.max)
+            seen += count
+        return self.max
+
+    def snapshot(self):
+        return {
+            "count": self.count,
+            "sum": self.sum,
+            "mean": self.sum / self.count if self.count else 0.0,
+            "max": self.max,
+            "p50": self.percentile(0.50),
+            "p95": self.percentile(0.95),
+            "p99": self.percentile(0.99),
+        }
+
+def _label(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\"", "\\\"").replace("\n", "\\n")
+
+class Metrics:
+    def __init__(self, *, enabled = True, slow_threshold = 0.1, buckets = DEFAULT_BUCKETS) -> None:
+        self.enabled = enabled
+        self.slow_threshold = slow_threshold
+        self._buckets = buckets
+        self._lock = threading.Lock()
+        self._queries = {}
+        self._query_rows = {}
+        self._calls = {}
+        self._commits = Histogram(buckets)
+
+    def _histogram(self, histograms, key):
+        histogram = histograms.get(key)
+        if histogram is None:
+            histogram = histograms[key] = Histogram(self._buckets)
+        return histogram
+
+    def observe_query(self, statement: str, seconds, rows = 0):
+        if not self.enabled:
+            return
+        normalized = normalize_sql(statement)
+        with self._lock:
+            self._histogram(self._queries, normalized).observe(seconds)
+            self._query_rows[normalized] = self._query_rows.get(normalized, 0) + rows
+        if seconds >= self.slow_threshold:
+            logger.warning("Slow query (%.1f ms, %d rows): %s", seconds * 1000, rows, normalized)
+
+    def observe_commit(self, seconds):
+        if not self.enabled:
+            return
+        with self._lock:
+            self._commits.observe(seconds)
+        if seconds >= self.slow_threshold:
+            logger.warning("Slow commit (%.1f ms)", seconds * 1000)
+
+    def observe_call(self, name: str, seconds):
+        if not self.enabled:
+            return
+        with self._lock:
+            self._histogram(self._calls, name).observe(seconds)
+        if seconds >= self.slow_threshold:
+            logger.warning("Slow call (%.1f ms): %s", seconds * 1000, name)
+
+    def reset(self):
+        with self._lock:
+            self._queries.clear()
+            self._query_rows.clear()
+            self._calls.clear()
+            self._commits = Histogram(self._buckets)
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            return {
+                "queries": {statement: dict(histogram.snapshot(), rows=self._query_rows.get(statement, 0))
+                            for statement, histogram in self._queries.items()},
+                "commits": self._commits.snapshot(),
+                "calls": {name: histogram.snapshot() for name, histogram in self._calls.items()},
+            }
+
+    def _prometheus_histogram(self, lines, metric, histogram: Histogram, labels = ""):
+        separator = "," if labels else ""
+        cumulative = 0
+        for bound, count in zip(self._buckets, histogram.counts):
+            cumulative += count
+            lines.append(f"{metric}_bucket{{{labels}{separator}le=\"{bound:g}\"}} {cumulative}")
+        lines.append(f"{metric}_bucket{{{labels}{separator}le=\"+Inf\"}} {histogram.count}")
+        suffix = f"{{{labels}}}" if labels else ""
+        lines.append(f"{metric}_sum{suffix} {histogram.sum!r}")
+        lines.append(f"{metric}_count{suffix} {histogram.count}")
+
+    def to_prometheus(self, prefix = "ambassador") -> str:
+        lines = []
+        with self._lock:
+            lines.append(f"# HELP {prefix}_query_duration_seconds Latency of SQL statements, grouped by normalized statement")
+            lines.append(f"# TYPE {prefix}_query_duration_seconds histogram")
+            for statement, histogram in self._queries.items():
+                self._prometheus_histogram(lines, f"{prefix}_query_duration_seconds", histogram, f"statement=\"{_label(statement)}\"")
+            lines.append(f"# HELP {prefix}_query_rows_total Rows returned or changed by SQL statements")
+            lines.append(f"# TYPE {prefix}_query_rows_total counter")
+            for statement, rows in self._query_rows.items():
+                lines.append(f"{prefix}_query_rows_total{{statement=\"{_label(statement)}\"}} {rows}")
+            lines.append(f"# HELP {prefix}_commit_duration_seconds Latency of transaction commits")
+            lines.append(f"# TYPE {prefix}_commit_duration_seconds histogram")
+            self._prometheus_histogram(lines, f"{prefix}_commit_duration_seconds", self._commits)
+            lines.append(f"# HELP {prefix}_call_duration_seconds Latency of instrumented logic methods")
+            lines.append(f"# TYPE {prefix}_call_duration_seconds histogram")
+            for name, histogram in self._calls.items():
+                self._prometheus_histogram(lines, f"{prefix}_call_duration_seconds", histogram, f"method=\"{_label(name)}\"")
+        return "\n".join(lines) + "\n"
+
+# shared by the @instrumented logic methods, off until enabled
+registry = Metrics(enabled=False)
+
+def instrumented(function):
+    name = function.__qualname__
+
+    @wraps(function)
+    def wrapper(*args, **kwargs):
+        if not registry.enabled:
+            return function(*args, **kwargs)
+        start = time.perf_counter()
+        try:
+            return function(*args, **kwargs)
+        finally:
+            registry.observe_call(name, time.perf_counter() - start)
+    return wrapper
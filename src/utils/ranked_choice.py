@@ -0,0 +1,145 @@
+from collections import Counter
+from fractions import Fraction
+from typing import NamedTuple
+
+class TallyRound(NamedTuple):
+    counts: tuple[float, ...]
+    elected: tuple[int, ...]
+    eliminated: tuple[int, ...]
+    exhausted: float
+
+class ElectionResult(NamedTuple):
+    winners: tuple[int, ...]
+    rounds: list[TallyRound]
+
+class _Count:
+    # ballots with the same ranking are collapsed into one group with a weight, and every
+    # candidate keeps the list of groups currently sitting on it, so a transfer only
+    # touches the groups of the candidate that was elected or eliminated
+    def __init__(self, ballots, candidate_count) -> None:
+        self.candidate_count = candidate_count
+        self.rankings = []
+        self.weights = []
+        self.positions = []
+        self.piles = [[] for _ in range(candidate_count)]
+        self.counts = [Fraction(0)] * candidate_count
+        self.continuing = [True] * candidate_count
+        self.exhausted = Fraction(0)
+        self.history = []
+        self.rounds = []
+
+        for ranking, amount in Counter(tuple(ballot) for ballot in ballots).items():
+            group = len(self.rankings)
+            self.rankings.append(ranking)
+            self.weights.append(Fraction(amount))
+            self.positions.append(-1)
+            self._advance(group)
+
+    def _advance(self, group):
+        ranking = self.rankings[group]
+        position = self.positions[group] + 1
+        while position < len(ranking) and not self.continuing[ranking[position]]:
+            position += 1
+        self.positions[group] = position
+        if position < len(ranking):
+            candidate = ranking[position]
+            self.piles[candidate].append(group)
+            self.counts[candidate] += self.weights[group]
+        else:
+            self.exhausted += self.weights[group]
+
+    def remaining(self):
+        return [candidate for candidate in range(self.candidate_count) if self.continuing[candidate]]
+
+    def transfer(self, candidate, ratio = 1):
+        groups = self.piles[candidate]
+        self.piles[candidate] = []
+        for group in groups:
+            self.weights[group] *= ratio
+            self._advance(group)
+
+    def remove(self, candidate):
+        self.continuing[candidate] = False
+
+    def record(self, elected = (), eliminated = ()):
+        self.history.append(list(self.counts))
+        self.rounds.append(TallyRound(tuple(float(count) for count in self.counts), tuple(elected), tuple(eliminated), float(self.exhausted)))
+
+    def order_key(self, candidate):
+        # highest count first, ties are broken by the most recent round in which the candidates differed,
+        # then by registration order
+        return (-self.counts[candidate], tuple(-counts[candidate] for counts in reversed(self.history)), candidate)
+
+    def lowest(self):
+        return max(self.remaining(), key=self.order_key)
+
+def _validate(ballots, candidate_count, seats):
+    if candidate_count <= 0:
+        raise ValueError("An election needs at least one candidate")
+    if not 0 < seats <= candidate_count:
+        raise ValueError("The number of seats must be between 1 and the number of candidates")
+    for ballot in ballots:
+        if len(set(ballot)) != len(ballot) or any(not 0 <= candidate < candidate_count for candidate in ballot):
+            raise ValueError(f"Invalid ballot {tuple(ballot)}")
+
+def plurality(ballots, candidate_count, seats = 1) -> ElectionResult:
+    _validate(ballots, candidate_count, seats)
+    count = _Count([ballot[:1] for ballot in ballots], candidate_count)
+    winners = tuple(sorted(range(candidate_count), key=count.order_key)[:seats])
+    count.record(elected=winners)
+    return ElectionResult(winners, count.rounds)
+
+def instant_runoff(ballots, candidate_count) -> ElectionResult:
+    _validate(ballots, candidate_count, 1)
+    count = _Count(ballots, candidate_count)
+    while True:
+        remaining = count.remaining()
+        leader = min(remaining, key=count.order_key)
+        active = sum(count.counts[candidate] for candidate in remaining)
+        if len(remaining) == 1 or count.counts[leader] * 2 > active:
+            count.record(elected=(leader,))
+            return ElectionResult((leader,), count.rounds)
+        lowest = count.lowest()
+        count.record(eliminated=(lowest,))
+        count.remove(lowest)
+        count.transfer(lowest)
+        count.counts[lowest] = Fraction(0)
+
+def single_transferable_vote(ballots, candidate_count, seats) -> ElectionResult:
+    _validate(ballots, candidate_count, seats)
+    count = _Count(ballots, candidate_count)
+    quota = Fraction(len(ballots) // (seats + 1) + 1)
+    winners = []
+    while len(winners) < seats:
+        remaining = count.remaining()
+        if len(remaining) <= seats - len(winners):
+            elected = sorted(remaining, key=count.order_key)
+            winners.extend(elected)
+            count.record(elected=elected)
+            break
+
+        reached = sorted((candidate for candidate in remaining if count.counts[candidate] >= quota), key=count.order_key)
+        if reached:
+            count.record(elected=reached)
+            for candidate in reached:
+                winners.append(candidate)
+                count.remove(candidate)
+            for candidate in reached:
+                if len(winners) >= seats:
+                    break
+                # Gregory method: every ballot on the winner moves on at surplus / total of its weight
+                total = count.counts[candidate]
+                surplus = total - quota
+                if surplus > 0:
+                    count.transfer(candidate, surplus / total)
+                else:
+                    count.piles[candidate] = []
+                count.counts[candidate] = quota
+            continue
+
+        lowest = count.lowest()
+        count.record(eliminated=(lowest,))
+        count.remove(lowest)
+        count.transfer(lowest)
+        count.counts[lowest] = Fraction(0)
+    return ElectionResult(tuple(winners[:seats]), count.rounds)
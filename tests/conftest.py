@@ -0,0 +1,27 @@
+import os
+import sys
+
+import pytest
+
+# the modules import each other relative to src, as they do when the bot runs from there
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "src"))
+
+from database import Database
+
+class FakeClock:
+    def __init__(self, now = 0.0) -> None:
+        self.now = now
+
+    def __call__(self):
+        return self.now
+
+@pytest.fixture
+def clock():
+    return FakeClock()
+
+@pytest.fixture
+def db(tmp_path):
+    db = Database(str(tmp_path / "test.db"))
+    db.create_db()
+    yield db
+    db.close()
@@ -0,0 +1,95 @@
+import time
+
+import pytest
+
+from systems.analytics_system import AnalyticsRepository, AnalyticsLogic
+from systems.entry_system import EntryRepository, EntryLogic
+from systems.internal.user_system import UserRepository, UserLogic
+from systems.internal.vote_system import VoteRepository, VoteLogic
+
+class Council:
+    def __init__(self, db) -> None:
+        self.users = UserLogic(UserRepository(db))
+        self.entries = EntryLogic(EntryRepository(db))
+        self.votes = VoteLogic(VoteRepository(db), self.users, self.entries)
+        self.members = [self.users.register_user(str(i), f"user{i}", f"User {i}") for i in range(3)]
+
+    def resolution(self, votes):
+        entry_id = self.entries.register_entry("Resolution", "Content", "resolution", self.members[0], "everyone", time.time() + 1000)
+        self.entries.approve_entry(entry_id)
+        for member, vote in zip(self.members, votes):
+            self.votes.cast_vote(member, entry_id, vote)
+        return entry_id
+
+    def close(self, entry_id):
+        self.entries.complete_entry(entry_id, forced=True)
+
+@pytest.fixture
+def council(db):
+    return Council(db)
+
+def test_refresh_only_loads_newly_closed_entries(db, council, clock):
+    first = council.resolution(["approve", "disapprove"])
+    second = council.resolution(["approve", "approve", "abstain"])
+    council.close(first)
+    analytics = AnalyticsLogic(AnalyticsRepository(db), clock=clock)
+
+    assert analytics.refresh() == 1
+    assert analytics.refresh() == 0
+    council.close(second)
+    assert analytics.refresh() == 1
+    assert analytics.refresh() == 0
+
+    participation = analytics.participation()
+    assert participation[council.members[0]].votes == 2
+    assert participation[council.members[0]].approve == 2
+    assert participation[council.members[1]].approve == 1
+    assert participation[council.members[1]].disapprove == 1
+    assert participation[council.members[2]].abstain == 1
+    assert [turnout.entry_id for turnout in analytics.turnout()] == [first, second]
+
+def test_active_entries_are_not_counted(db, council, clock):
+    council.resolution(["approve", "approve"])
+    analytics = AnalyticsLogic(AnalyticsRepository(db), clock=clock)
+    assert analytics.refresh() == 0
+    assert analytics.participation() == {}
+
+def test_entries_without_a_deadline_are_left_out(db, council, clock):
+    dated = council.resolution(["approve"])
+    undated = council.entries.register_entry("Resolution", "Content", "resolution", council.members[0], "everyone", None)
+    council.entries.approve_entry(undated)
+    council.votes.cast_vote(council.members[1], undated, "approve")
+    # complete_entry needs a deadline, imported entries can be closed without one
+    EntryRepository(db).mark_as_completed(undated, early=True)
+    council.close(dated)
+    analytics = AnalyticsLogic(AnalyticsRepository(db), clock=clock)
+    assert analytics.refresh() == 1
+    assert [turnout.entry_id for turnout in analytics.turnout()] == [dated]
+    assert list(analytics.participation()) == [council.members[0]]
+
+def test_reads_refresh_once_the_interval_passed(db, council, clock):
+    first = council.resolution(["approve"])
+    second = council.resolution(["disapprove"])
+    council.close(first)
+    analytics = AnalyticsLogic(AnalyticsRepository(db), refresh_interval=300, clock=clock)
+    assert analytics.participation()[council.members[0]].votes == 1
+
+    council.close(second)
+    clock.now = 299
+    assert analytics.participation()[council.members[0]].votes == 1
+    clock.now = 300
+    assert analytics.participation()[council.members[0]].votes == 2
+
+def test_alignment_is_updated_with_new_entries(db, council, clock):
+    first = council.resolution(["approve", "approve"])
+    second = council.resolution(["approve", "disapprove"])
+    council.close(first)
+    analytics = AnalyticsLogic(AnalyticsRepository(db), clock=clock)
+    members = council.members[:2]
+    assert analytics.alignment(members).agreement[0, 1] == 1.0
+
+    council.close(second)
+    analytics.refresh()
+    alignment = analytics.alignment(members)
+    assert alignment.shared[0, 1] == 2
+    assert alignment.agreement[0, 1] == 0.5
@@ -0,0 +1,126 @@
+import time
+
+import pytest
+
+from database import Database
+from systems.archive_system import ArchiveRepository, ArchiveLogic
+from systems.entry_system import EntryRepository, EntryLogic
+from systems.internal.user_system import UserRepository, UserLogic
+from systems.internal.vote_system import Tally, VoteRepository, VoteLogic
+from systems.repeal_system import RepealRepository, RepealLogic
+
+class Council:
+    def __init__(self, db) -> None:
+        self.db = db
+        self.users = UserLogic(UserRepository(db))
+        self.entries = EntryLogic(EntryRepository(db))
+        self.votes = VoteLogic(VoteRepository(db), self.users, self.entries)
+        self.repeals = RepealLogic(RepealRepository(db), self.votes, self.entries)
+        self.archive = ArchiveLogic(ArchiveRepository(db))
+        self.members = [self.users.register_user(str(i), f"user{i}", f"User {i}") for i in range(2)]
+
+    def resolution(self, title, content, deadline):
+        entry_id = self.entries.register_entry(title, content, "resolution", self.members[0], "everyone", deadline)
+        self.entries.approve_entry(entry_id)
+        return entry_id
+
+    def fresh(self):
+        # new logic objects with empty caches, so every read goes to the database
+        entries = EntryLogic(EntryRepository(self.db))
+        votes = VoteLogic(VoteRepository(self.db), self.users, entries)
+        return entries, votes, RepealLogic(RepealRepository(self.db), votes, entries)
+
+@pytest.fixture
+def council(tmp_path):
+    db = Database(str(tmp_path / "main.db"), archive_path=str(tmp_path / "archive.db"))
+    db.create_db()
+    council = Council(db)
+    yield council
+    db.close()
+
+@pytest.fixture
+def passed(council):
+    entry_id = council.resolution("Free trade", "All tariffs are abolished " * 50, time.time() + 0.05)
+    council.votes.cast_vote(council.members[0], entry_id, "approve")
+    council.votes.cast_vote(council.members[1], entry_id, "disapprove")
+    time.sleep(0.1)
+    council.entries.complete_entry(entry_id)
+    return entry_id
+
+def test_finished_entries_move_to_the_archive(council, passed):
+    active = council.resolution("Tariff review", "Reviewed yearly", time.time() + 1000)
+    assert council.archive.archive(older_than=0) == 1
+    assert council.archive.count() == 1
+    assert council.db.query("SELECT id FROM entry_data") == [(active,)]
+    assert council.db.query_once("SELECT COUNT(*) FROM vote_store WHERE entry = ?", passed)[0] == 0
+
+def test_archived_entries_are_read_through_the_archive(council, passed):
+    council.archive.archive(older_than=0)
+    entries, votes, repeals = council.fresh()
+    entry = entries.get(passed)
+    assert entry.state == "completed"
+    assert entry.content == "All tariffs are abolished " * 50
+    assert entries.get_entries([passed])[passed].content == entry.content
+    assert votes.get_tally(passed) == Tally(passed, 1, 1, 0)
+    assert votes.get_tallies([passed])[passed] == Tally(passed, 1, 1, 0)
+    assert votes.get_vote(passed).votes == {council.members[0]: "approve", council.members[1]: "disapprove"}
+
+def test_archived_resolutions_can_still_be_repealed(council, passed):
+    repeal = council.entries.register_entry("Repeal", "No", "repeal", council.members[0], "everyone", time.time() + 1000)
+    council.repeals.set_repeal(repeal, passed)
+    council.archive.archive(older_than=0)
+    entries, votes, repeals = council.fresh()
+    assert repeals.get(repeal).repealed_id == passed
+    assert entries.repeal_entry(passed)
+    assert council.fresh()[0].get(passed).state == "repealed"
+
+def test_recent_entries_stay_until_they_are_old_enough(council, passed):
+    clock_now = time.time()
+    archive = ArchiveLogic(ArchiveRepository(council.db), clock=lambda: clock_now)
+    assert archive.archive(older_than=3600) == 0
+    assert archive.archive(older_than=0) == 1
+
+def test_interrupted_runs_are_finished_by_the_next_one(council, passed):
+    repository = ArchiveRepository(council.db)
+    # copied but not removed, as a crash between the two commits leaves it
+    repository.copy_entries([passed])
+    entries, votes, repeals = council.fresh()
+    assert entries.get(passed).state == "completed"
+    assert [result.entry.id for result in entries.search_entries("tariffs").results] == [passed]
+    assert council.archive.archive(older_than=0) == 1
+    assert council.archive.count() == 1
+
+def test_archived_entries_can_be_searched(council, passed):
+    council.resolution("Tariff review", "tariffs are reviewed yearly", time.time() + 1000)
+    council.archive.archive(older_than=0)
+    entries, votes, repeals = council.fresh()
+    results = entries.search_entries("abolished").results
+    assert [result.entry.id for result in results] == [passed]
+    assert "**abolished**" in results[0].snippet
+    assert len(entries.search_entries("tariffs").results) == 2
+
+def test_archive_matches_are_ranked_against_their_own_index(council):
+    # the archive is a small index where every entry mentions the term, its raw bm25 scores are close to zero
+    archived = [council.resolution(title, "harbour rules and a tariff", time.time() + 0.05) for title in ("Tariff act", "Harbour", "Harbour")]
+    time.sleep(0.1)
+    for entry_id in archived:
+        council.entries.complete_entry(entry_id)
+    active = council.resolution("Tariff review", "The tariff is reviewed", time.time() + 1000)
+    mentions = [council.resolution("Harbour", "harbour rules " * 5 + "and a tariff", time.time() + 1000) for _ in range(3)]
+    for i in range(20):
+        council.resolution(f"Other {i}", "Unrelated", time.time() + 1000)
+    council.archive.archive(older_than=0)
+    entries, votes, repeals = council.fresh()
+    results = [result.entry.id for result in entries.search_entries("tariff").results]
+    assert sorted(results) == sorted(archived + [active] + mentions)
+    assert set(results[:2]) == {active, archived[0]}
+    page = entries.search_entries("tariff", limit=3, offset=2).results
+    assert [result.entry.id for result in page] == results[2:5]
+
+def test_new_entries_do_not_reuse_archived_ids(council, passed):
+    council.archive.archive(older_than=0)
+    entry_id = council.resolution("Tariff review", "Reviewed yearly", time.time() + 1000)
+    assert entry_id > passed
+    entries, votes, repeals = council.fresh()
+    assert entries.get(passed).title == "Free trade"
+    assert entries.get(entry_id).title == "Tariff review"
@@ -0,0 +1,95 @@
+import threading
+
+import pytest
+
+from utils.cache import Cache
+
+def test_least_recently_used_entries_are_evicted():
+    cache = Cache(max_size=2)
+    cache.set(1, "a")
+    cache.set(2, "b")
+    assert cache.get(1) == "a"
+    cache.set(3, "c")
+    assert 1 in cache and 3 in cache and 2 not in cache
+    assert cache.stats().evictions == 1
+
+def test_entries_expire_after_their_ttl(clock):
+    cache = Cache(ttl=10, clock=clock)
+    cache.set(1, "a")
+    clock.now = 9.9
+    assert cache.get(1) == "a"
+    clock.now = 10
+    assert cache.get(1) is None
+    assert cache.stats().expirations == 1
+
+def test_not_found_is_cached_for_the_negative_ttl(clock):
+    cache = Cache(ttl=300, negative_ttl=5, clock=clock)
+    loads = []
+    def load():
+        loads.append(1)
+        return None
+    assert cache.get(1, load) is None
+    assert cache.get(1, load) is None
+    assert len(loads) == 1
+    clock.now = 5
+    cache.get(1, load)
+    assert len(loads) == 2
+
+def test_a_zero_negative_ttl_caches_nothing_missing():
+    cache = Cache(negative_ttl=0)
+    cache.get(1, lambda: None)
+    assert 1 not in cache
+
+def test_concurrent_misses_share_one_load():
+    cache = Cache()
+    started = threading.Event()
+    release = threading.Event()
+    loads = []
+    def load():
+        loads.append(1)
+        started.set()
+        release.wait(5)
+        return "value"
+    results = []
+    owner = threading.Thread(target=lambda: results.append(cache.get(1, load)))
+    owner.start()
+    started.wait(5)
+    waiters = [threading.Thread(target=lambda: results.append(cache.get(1, load))) for _ in range(4)]
+    for waiter in waiters:
+        waiter.start()
+    release.set()
+    for thread in [owner, *waiters]:
+        thread.join()
+    assert results == ["value"] * 5
+    assert len(loads) == 1
+
+def test_load_errors_reach_waiters_and_are_not_cached():
+    cache = Cache()
+    def load():
+        raise KeyError("missing")
+    with pytest.raises(KeyError):
+        cache.get(1, load)
+    assert 1 not in cache
+    assert cache.get(1, lambda: "value") == "value"
+
+def test_invalidation_during_a_load_drops_its_result():
+    cache = Cache()
+    def load():
+        # written meanwhile, the loaded value may already be stale
+        cache.clear_cache(1)
+        return "stale"
+    assert cache.get(1, load) == "stale"
+    assert 1 not in cache
+
+def test_get_many_only_loads_what_is_missing():
+    cache = Cache()
+    cache.set(1, "a")
+    requested = []
+    def load(ids):
+        requested.append(ids)
+        return {2: "b"}
+    assert cache.get_many([1, 2, 3], load) == {1: "a", 2: "b", 3: None}
+    assert requested == [[2, 3]]
+    assert cache.get_many([2, 3], load) == {2: "b", 3: None}
+    assert len(requested) == 1
+    assert cache.stats().hits == 3
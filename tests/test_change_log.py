@@ -0,0 +1,70 @@
+import pytest
+
+from database import Database
+from systems.change_system import ChangeLogRepository, ChangeLogTailer
+from systems.internal.user_system import UserRepository, UserLogic
+
+@pytest.fixture
+def other(db, tmp_path):
+    # a second process writing to the same file
+    other = Database(str(tmp_path / "test.db"))
+    yield other
+    other.close()
+
+@pytest.fixture
+def tailer(db):
+    tailer = ChangeLogTailer(ChangeLogRepository(db))
+    yield tailer
+    tailer.stop()
+
+def subscribe(tailer, kind):
+    invalidated = []
+    tailer.subscribe(kind, invalidated.append)
+    return invalidated
+
+def test_changes_from_another_connection_invalidate_their_keys(tailer, other):
+    users = subscribe(tailer, "user")
+    entries = subscribe(tailer, "entry")
+    repository = UserRepository(other)
+    first = repository.create_user("1", "One", "one")
+    second = repository.create_user("2", "Two", "two")
+    repository.set_role(first, "member")
+    assert tailer.poll() == 3
+    # a key changed twice in one poll is invalidated once
+    assert users == [first, second]
+    assert entries == []
+    assert tailer.version == ChangeLogRepository(other).get_version()
+
+def test_idle_polls_read_nothing(tailer, other):
+    subscribe(tailer, "user")
+    assert tailer.poll() == 0
+    UserRepository(other).create_user("1", "One", "one")
+    assert tailer.poll() == 1
+    assert tailer.poll() == 0
+
+def test_own_writes_are_not_reported_again(db, tailer):
+    users = subscribe(tailer, "user")
+    UserLogic(UserRepository(db)).register_user("1", "one", "One")
+    assert tailer.poll() == 0
+    assert users == []
+
+def test_pruned_changes_invalidate_everything(tailer, other):
+    users = subscribe(tailer, "user")
+    votes = subscribe(tailer, "vote")
+    repository = UserRepository(other)
+    repository.create_user("1", "One", "one")
+    repository.create_user("2", "Two", "two")
+    other.execute("DELETE FROM change_log WHERE version <= ?", tailer.version + 1)
+    other.commit()
+    assert tailer.poll() == 1
+    assert users == [None]
+    assert votes == [None]
+    assert tailer.version == ChangeLogRepository(other).get_version()
+
+def test_unsubscribed_callbacks_are_not_called(tailer, other):
+    invalidated = []
+    tailer.subscribe("user", invalidated.append)
+    tailer.unsubscribe("user", invalidated.append)
+    UserRepository(other).create_user("1", "One", "one")
+    tailer.poll()
+    assert invalidated == []
@@ -0,0 +1,112 @@
+import threading
+
+import pytest
+
+from database import Database
+from systems.internal.user_system import UserRepository, UserLogic
+from systems.internal.vote_system import VoteRepository
+
+@pytest.fixture
+def group_db(tmp_path):
+    db = Database(str(tmp_path / "group.db"), group_commit=True)
+    db.create_db()
+    yield db
+    db.close()
+
+def test_group_commit_keeps_concurrent_votes_whole(group_db):
+    repository = VoteRepository(group_db)
+    entry_id = group_db.execute("INSERT INTO entry_data (title) VALUES('group')").lastrowid
+    group_db.commit()
+
+    def cast(offset):
+        for i in range(50):
+            repository.cast_vote(entry_id, offset, ("approve", "disapprove", "abstain")[i % 3])
+            repository.cast_vote(entry_id, 100 + offset * 50 + i, "approve")
+
+    def fail():
+        for _ in range(50):
+            with pytest.raises(RuntimeError):
+                with group_db.transaction():
+                    group_db.execute("INSERT INTO vote_store (entry, caster, vote) VALUES(?, -1, 0)", entry_id)
+                    raise RuntimeError
+
+    workers = [threading.Thread(target=cast, args=(i,)) for i in range(8)] + [threading.Thread(target=fail)]
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join()
+
+    assert repository.verify_tallies() == []
+    assert group_db.query_once("SELECT COUNT(*) FROM vote_store WHERE caster = -1")[0] == 0
+    assert repository.get_tally(entry_id).approve == 8 * 50
+    assert not group_db.connection.in_transaction
+
+@pytest.fixture(params=[False, True], ids=["commit", "group-commit"])
+def any_db(request, tmp_path):
+    db = Database(str(tmp_path / "any.db"), group_commit=request.param)
+    db.create_db()
+    yield db
+    db.close()
+
+def roles(db):
+    return [row[0] for row in db.read_query("SELECT role FROM roles WHERE role LIKE 'test%' ORDER BY role")]
+
+def test_rollback_undoes_deferred_commits(any_db):
+    with pytest.raises(RuntimeError):
+        with any_db.transaction():
+            any_db.execute("INSERT INTO roles (role) VALUES('test a')")
+            any_db.commit()
+            raise RuntimeError
+    assert roles(any_db) == []
+
+def test_nested_transactions_roll_back_on_their_own(any_db):
+    with any_db.transaction():
+        any_db.execute("INSERT INTO roles (role) VALUES('test a')")
+        with pytest.raises(RuntimeError):
+            with any_db.transaction():
+                any_db.execute("INSERT INTO roles (role) VALUES('test b')")
+                raise RuntimeError
+        with any_db.transaction():
+            any_db.execute("INSERT INTO roles (role) VALUES('test c')")
+        # reads inside the transaction see its own writes
+        assert roles(any_db) == ["test a", "test c"]
+    assert roles(any_db) == ["test a", "test c"]
+
+def test_after_commit_callbacks_only_run_for_committed_work(any_db):
+    called = []
+    with any_db.transaction():
+        any_db.after_commit(lambda: called.append("outer"))
+        with pytest.raises(RuntimeError):
+            with any_db.transaction():
+                any_db.after_commit(lambda: called.append("rolled back"))
+                raise RuntimeError
+        assert called == []
+    assert called == ["outer"]
+
+    with pytest.raises(RuntimeError):
+        with any_db.transaction():
+            any_db.after_commit(lambda: called.append("failed"))
+            raise RuntimeError
+    assert called == ["outer"]
+    any_db.after_commit(lambda: called.append("now"))
+    assert called == ["outer", "now"]
+
+def test_transactions_belong_to_their_thread(any_db):
+    seen = []
+    with any_db.transaction():
+        assert any_db.in_transaction()
+        worker = threading.Thread(target=lambda: seen.append(any_db.in_transaction()))
+        worker.start()
+        worker.join()
+    assert seen == [False]
+    assert not any_db.in_transaction()
+
+def test_bulk_getters_leave_the_caches_alone_inside_a_transaction(any_db):
+    users = UserLogic(UserRepository(any_db))
+    user_id = users.register_user("1", "name", "name")
+    with pytest.raises(RuntimeError):
+        with any_db.transaction():
+            any_db.execute("UPDATE user SET display_name = 'uncommitted' WHERE id = ?", user_id)
+            assert users.get_users([user_id])[user_id].display_name == "uncommitted"
+            raise RuntimeError
+    assert users.get_users([user_id])[user_id].display_name == "name"
@@ -0,0 +1,73 @@
+import time
+
+import pytest
+
+from exceptions import *
+from systems.election_system import ElectionRepository, ElectionLogic, encode_ranking, decode_ranking
+from systems.entry_system import EntryRepository, EntryLogic
+from systems.internal.user_system import UserRepository, UserLogic
+
+@pytest.fixture
+def council(db):
+    users = UserLogic(UserRepository(db))
+    entries = EntryLogic(EntryRepository(db))
+    elections = ElectionLogic(ElectionRepository(db), users, entries)
+    electors = [users.register_user(str(i), f"user{i}", f"User {i}") for i in range(3)]
+    return entries, elections, electors
+
+def open_election(entries, elections, author, candidates, method = "instant-runoff", seats = 1):
+    entry_id = entries.register_entry("Election", "Pick one", "election", author, "everyone", time.time() + 1000)
+    elections.set_election(entry_id, candidates, method, seats)
+    entries.approve_entry(entry_id)
+    return entry_id
+
+def test_rankings_use_one_byte_up_to_256_candidates():
+    encoded = encode_ranking([255, 0, 17], 256)
+    assert len(encoded) == 3
+    assert list(decode_ranking(encoded, 256)) == [255, 0, 17]
+
+def test_rankings_use_two_bytes_past_256_candidates():
+    encoded = encode_ranking([299, 256, 0], 300)
+    assert len(encoded) == 6
+    assert list(decode_ranking(encoded, 300)) == [299, 256, 0]
+
+def test_ballots_round_trip_through_a_large_election(council):
+    entries, elections, electors = council
+    candidates = [1000 + i for i in range(300)]
+    entry_id = open_election(entries, elections, electors[0], candidates)
+    elections.elect(electors[0], entry_id, [1299, 1256, 1000])
+    elections.elect(electors[1], entry_id, [1256, 1299])
+    elections.elect(electors[2], entry_id, [1299])
+    assert elections.get_ballot(entry_id, electors[0]) == [1299, 1256, 1000]
+
+    with pytest.raises(ElectionNotDoneError):
+        elections.get_result(entry_id)
+    entries.complete_entry(entry_id, forced=True)
+    result = elections.get_result(entry_id)
+    assert result.winners == (1299,)
+    assert len(result.rounds[0].counts) == 300
+
+def test_counts_are_mapped_back_to_candidates(council):
+    entries, elections, electors = council
+    entry_id = open_election(entries, elections, electors[0], [30, 20, 10], method="stv", seats=2)
+    elections.elect(electors[0], entry_id, [10, 20])
+    elections.elect(electors[1], entry_id, [10, 30])
+    elections.elect(electors[2], entry_id, [20])
+    entries.complete_entry(entry_id, forced=True)
+    result = elections.get_result(entry_id)
+    assert result.winners == (10, 20)
+    assert result.rounds[0].counts == (0, 1, 2)
+    assert result.rounds[0].elected == (10,)
+
+def test_plurality_keeps_only_the_first_choice(council):
+    entries, elections, electors = council
+    entry_id = open_election(entries, elections, electors[0], [1, 2, 3], method="plurality")
+    elections.elect(electors[0], entry_id, [2, 1])
+    assert elections.get_ballot(entry_id, electors[0]) == [2]
+
+def test_invalid_ballots_are_rejected(council):
+    entries, elections, electors = council
+    entry_id = open_election(entries, elections, electors[0], [1, 2, 3])
+    for ranking in ([], [1, 1], [4]):
+        with pytest.raises(ElectionInvalidBallotError):
+            elections.elect(electors[0], entry_id, ranking)
@@ -0,0 +1,54 @@
+import importlib.util
+import os
+
+import pytest
+
+from exceptions import *
+from systems.entry_system import EntryRepository, EntryLogic
+from systems.internal.user_system import UserRepository, UserLogic
+
+@pytest.fixture
+def entries(db):
+    return EntryLogic(EntryRepository(db))
+
+@pytest.fixture
+def author(db):
+    return UserLogic(UserRepository(db)).register_user("1", "author", "Author")
+
+def load_http():
+    path = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "src", "flask", "flask.py")
+    spec = importlib.util.spec_from_file_location("ambassador_http", path)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+def test_pages_cover_entries_without_a_deadline(entries, author):
+    created = [entries.register_entry(f"Entry {i}", "Content", "resolution", author, "everyone", deadline)
+               for i, deadline in enumerate([None, 300, None, 100, None, 200])]
+    seen = []
+    cursor = None
+    while True:
+        page = entries.list_entries(after=cursor, limit=2)
+        seen.extend(header.id for header in page.entries)
+        cursor = page.next_cursor
+        if cursor is None:
+            break
+    # no deadline sorts first, then by deadline and id
+    assert seen == [created[0], created[2], created[4], created[3], created[5], created[1]]
+
+def test_http_cursor_round_trips_a_missing_deadline():
+    pytest.importorskip("flask")
+    http = load_http()
+    assert http.format_cursor((None, 2)) == "null:2"
+    assert http.parse_cursor("null:2") == (None, 2)
+    assert http.parse_cursor(http.format_cursor((1700000000.5, 3))) == (1700000000.5, 3)
+    assert http.parse_cursor(http.format_cursor((100, 4))) == (100, 4)
+
+def test_approving_twice_raises(entries, author):
+    entry_id = entries.register_entry("Entry", "Content", "resolution", author, "everyone", None)
+    assert entries.approve_entry(entry_id)
+    with pytest.raises(EntryAlreadyApprovedError):
+        entries.approve_entry(entry_id)
+    entries.cancel_entry(entry_id)
+    with pytest.raises(EntryAlreadyApprovedError):
+        entries.approve_entry(entry_id)
@@ -0,0 +1,113 @@
+import asyncio
+import time
+
+import pytest
+
+from async_database import AsyncDatabase
+from event_dispatcher import EventDispatcher
+from systems.entry_system import EntryRepository, EntryLogic
+from systems.event_system import EventRepository
+from systems.internal.user_system import UserRepository, UserLogic
+from systems.internal.vote_system import VoteRepository, VoteLogic
+
+@pytest.fixture
+def activity(db):
+    users = UserLogic(UserRepository(db))
+    entries = EntryLogic(EntryRepository(db))
+    votes = VoteLogic(VoteRepository(db), users, entries)
+    author = users.register_user("1", "author", "Author")
+    member = users.register_user("2", "member", "Member")
+    entry_id = entries.register_entry("Free trade", "All trade is free", "resolution", author, "everyone", time.time() + 1000)
+    entries.approve_entry(entry_id)
+    votes.cast_vote(author, entry_id, "approve")
+    votes.cast_vote(member, entry_id, "disapprove")
+    votes.cast_vote(member, entry_id, "approve")
+    return entry_id, author, member
+
+def dispatch(db, *callbacks, consumer = "test", batch_size = 100, kinds = None):
+    async def run():
+        executor = AsyncDatabase(db)
+        try:
+            dispatcher = EventDispatcher(EventRepository(db), executor, consumer=consumer, batch_size=batch_size)
+            for callback in callbacks:
+                dispatcher.subscribe(callback, kinds)
+            return await dispatcher.dispatch_pending()
+        finally:
+            await executor.close(close_database=False)
+    return asyncio.run(run())
+
+def collector(events):
+    async def callback(event):
+        events.append(event)
+    return callback
+
+def test_events_are_delivered_in_commit_order(db, activity):
+    entry_id, author, member = activity
+    events = []
+    assert dispatch(db, collector(events), batch_size=2) == 4
+    assert [event.kind for event in events] == ["state_changed", "vote_cast", "vote_cast", "vote_cast"]
+    assert [event.id for event in events] == sorted(event.id for event in events)
+    assert all(event.entry_id == entry_id for event in events)
+    assert events[0].payload == {"state": "active"}
+    assert events[3].payload == {"caster": member, "vote": "approve", "previous": "disapprove"}
+
+def test_cursor_resumes_after_the_last_delivered_event(db, activity):
+    first = []
+    dispatch(db, collector(first))
+    repository = EventRepository(db)
+    assert repository.get_cursor("test") == first[-1].id
+
+    again = []
+    assert dispatch(db, collector(again)) == 0
+    assert again == []
+    # another consumer keeps its own cursor and starts from the beginning
+    assert dispatch(db, collector([]), consumer="other") == len(first)
+
+def test_failed_event_is_delivered_again_before_later_ones(db, activity):
+    delivered = []
+    async def failing(event):
+        if len(delivered) == 2:
+            raise RuntimeError("delivery failed")
+        delivered.append(event)
+    with pytest.raises(RuntimeError):
+        dispatch(db, failing)
+    assert EventRepository(db).get_cursor("test") == delivered[-1].id
+
+    retried = []
+    dispatch(db, collector(retried))
+    assert [event.id for event in delivered + retried] == [event.id for event in EventRepository(db).get_events(0)]
+
+def test_kinds_filter_events_but_not_the_cursor(db, activity):
+    events = []
+    dispatch(db, collector(events), kinds=["state_changed"])
+    assert [event.kind for event in events] == ["state_changed"]
+    assert EventRepository(db).get_cursor("test") == EventRepository(db).get_events(0)[-1].id
+
+def test_rolled_back_changes_leave_no_event(db, activity):
+    entry_id, author, member = activity
+    count = len(EventRepository(db).get_events(0))
+    with pytest.raises(RuntimeError):
+        with db.transaction():
+            db.append_event("vote_cast", entry_id, {"caster": author, "vote": "abstain", "previous": "approve"})
+            raise RuntimeError
+    assert len(EventRepository(db).get_events(0)) == count
+
+def test_prune_keeps_events_a_consumer_has_not_processed(db, activity):
+    repository = EventRepository(db)
+    events = repository.get_events(0)
+    repository.set_cursor("fast", events[-1].id)
+    repository.set_cursor("slow", events[1].id)
+    assert repository.prune() == 2
+    assert [event.id for event in repository.get_events(0)] == [event.id for event in events[2:]]
+
+def test_state_change_is_rolled_back_without_its_event(db, activity, monkeypatch):
+    entry_id, author, member = activity
+    repository = EntryRepository(db)
+    def broken(*args, **kwargs):
+        raise RuntimeError("outbox unavailable")
+    monkeypatch.setattr(db, "append_event", broken)
+    with pytest.raises(RuntimeError):
+        repository.mark_as_cancelled(entry_id)
+    # another writer's commit does not pick up a half written state change
+    db.commit()
+    assert repository.get_header(entry_id).state == "active"
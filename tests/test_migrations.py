@@ -0,0 +1,84 @@
+import sqlite3
+
+import pytest
+
+from database import Database
+from systems.internal.vote_system import Tally, VoteRepository
+
+LEGACY_VOTES = [
+    (1, 1, "approve"),
+    (1, 1, "disapprove"),
+    (1, None, "approve"),
+    (None, 2, "approve"),
+    (1, 2, "abstain"),
+    (1, 3, "bogus"),
+    (2, 1, "approve"),
+]
+
+@pytest.fixture
+def legacy_path(tmp_path):
+    # a database from before votes were stored as codes, with every vote ever cast kept in a TEXT column
+    path = str(tmp_path / "legacy.db")
+    db = Database(path)
+    db.create_db()
+    db.close()
+    connection = sqlite3.connect(path)
+    connection.execute("DROP TABLE vote_store")
+    connection.execute("DROP TABLE vote_tally")
+    connection.execute("CREATE TABLE vote_store(entry INTEGER, caster INTEGER, vote TEXT)")
+    connection.executemany("INSERT INTO vote_store VALUES(?, ?, ?)", LEGACY_VOTES)
+    connection.commit()
+    connection.close()
+    return path
+
+def tables(db):
+    return {row[0] for row in db.query("SELECT name FROM sqlite_master WHERE type = 'table' AND name LIKE 'vote_store%'")}
+
+def test_latest_vote_per_caster_is_carried_over(legacy_path):
+    db = Database(legacy_path)
+    db.create_db()
+    assert db.query("SELECT entry, caster, vote FROM vote_store ORDER BY entry, caster") == [(1, 1, 1), (1, 2, 2), (2, 1, 0)]
+    assert tables(db) == {"vote_store"}
+    repository = VoteRepository(db)
+    assert repository.get_tally(1) == Tally(1, 0, 1, 1)
+    assert repository.verify_tallies() == []
+    db.close()
+
+def test_failed_migration_leaves_the_legacy_table(legacy_path):
+    db = Database(legacy_path)
+    execute = db.execute
+    def failing(statement, *args):
+        if statement.startswith("DROP TABLE vote_store_legacy"):
+            raise sqlite3.OperationalError("disk I/O error")
+        return execute(statement, *args)
+    db.execute = failing
+    with pytest.raises(sqlite3.OperationalError):
+        db.create_db()
+    # whatever commits next must not save a half migrated table
+    db.commit()
+    db.close()
+
+    db = Database(legacy_path)
+    assert tables(db) == {"vote_store"}
+    assert db.query("SELECT COUNT(*) FROM vote_store")[0][0] == len(LEGACY_VOTES)
+    db.create_db()
+    assert db.query("SELECT COUNT(*) FROM vote_store")[0][0] == 3
+    db.close()
+
+def test_leftover_legacy_table_is_copied_on_the_next_start(legacy_path):
+    db = Database(legacy_path)
+    db.create_db()
+    db.close()
+    # what an interrupted run used to leave behind, the renamed table next to the new one
+    connection = sqlite3.connect(legacy_path)
+    connection.execute("CREATE TABLE vote_store_legacy(entry INTEGER, caster INTEGER, vote TEXT)")
+    connection.executemany("INSERT INTO vote_store_legacy VALUES(?, ?, ?)", [(3, 1, "approve"), (3, 2, "disapprove")])
+    connection.commit()
+    connection.close()
+
+    db = Database(legacy_path)
+    db.create_db()
+    assert tables(db) == {"vote_store"}
+    assert VoteRepository(db).get_tally(3) == Tally(3, 1, 1, 0)
+    assert db.query("SELECT COUNT(*) FROM vote_store")[0][0] == 5
+    db.close()
@@ -0,0 +1,77 @@
+import pytest
+
+from utils.ranked_choice import plurality, instant_runoff, single_transferable_vote
+
+# the food election: oranges, pears, chocolate, strawberries, hamburgers, 20 voters for 3 seats
+ORANGES, PEARS, CHOCOLATE, STRAWBERRIES, HAMBURGERS = range(5)
+FOOD = ([[ORANGES]] * 4 + [[PEARS, ORANGES]] * 2 + [[CHOCOLATE, STRAWBERRIES]] * 8 + [[CHOCOLATE, HAMBURGERS]] * 4
+        + [[STRAWBERRIES]] + [[HAMBURGERS]])
+
+# the Tennessee capital election: Memphis, Nashville, Chattanooga, Knoxville
+MEMPHIS, NASHVILLE, CHATTANOOGA, KNOXVILLE = range(4)
+TENNESSEE = ([[MEMPHIS, NASHVILLE, CHATTANOOGA, KNOXVILLE]] * 42 + [[NASHVILLE, CHATTANOOGA, KNOXVILLE, MEMPHIS]] * 26
+             + [[CHATTANOOGA, KNOXVILLE, NASHVILLE, MEMPHIS]] * 15 + [[KNOXVILLE, CHATTANOOGA, NASHVILLE, MEMPHIS]] * 17)
+
+def test_stv_reference_election():
+    result = single_transferable_vote(FOOD, 5, 3)
+    assert result.winners == (CHOCOLATE, ORANGES, STRAWBERRIES)
+    assert result.rounds[0].counts == (4, 2, 12, 1, 1)
+    assert result.rounds[0].elected == (CHOCOLATE,)
+    # the surplus of 6 moves on at half the weight of each of chocolate's 12 ballots
+    assert result.rounds[1].counts == (4, 2, 6, 5, 3)
+    assert result.rounds[1].eliminated == (PEARS,)
+    assert result.rounds[2].elected == (ORANGES,)
+    assert result.rounds[-1].elected == (STRAWBERRIES,)
+
+def test_instant_runoff_reference_election():
+    result = instant_runoff(TENNESSEE, 4)
+    assert result.winners == (KNOXVILLE,)
+    assert [tally_round.eliminated for tally_round in result.rounds] == [(CHATTANOOGA,), (NASHVILLE,), ()]
+    assert result.rounds[-1].counts[KNOXVILLE] == 58
+
+def test_plurality_reference_election():
+    assert plurality(TENNESSEE, 4).winners == (MEMPHIS,)
+    assert plurality(TENNESSEE, 4, seats=2).winners == (MEMPHIS, NASHVILLE)
+
+def test_ties_without_history_follow_registration_order():
+    assert plurality([[0], [1]], 2).winners == (0,)
+    assert plurality([[1], [0]], 2).winners == (0,)
+    result = instant_runoff([[1], [0]], 2)
+    assert result.winners == (0,)
+    assert result.rounds[0].eliminated == (1,)
+
+def test_ties_are_broken_by_the_latest_round_that_differed():
+    ballots = [[0]] * 4 + [[1, 2]] * 2 + [[2]] * 3 + [[3, 1]]
+    result = instant_runoff(ballots, 4)
+    # 1 and 2 both hold 3 votes in the second round, 1 had fewer in the first and goes out
+    assert result.rounds[1].counts[1:3] == (3, 3)
+    assert result.rounds[1].eliminated == (1,)
+    assert result.winners == (2,)
+
+def test_exhausted_ballots_leave_the_majority():
+    result = instant_runoff([[0]] * 3 + [[1]] * 2 + [[2]] * 2, 3)
+    assert result.rounds[0].eliminated == (2,)
+    assert result.rounds[-1].exhausted == 2
+    # 3 of the 5 ballots still counting is a majority
+    assert result.winners == (0,)
+
+def test_stv_surplus_without_later_preferences_is_exhausted():
+    result = single_transferable_vote([[0]] * 3 + [[1]], 3, 2)
+    assert result.winners == (0, 1)
+    assert result.rounds[1].eliminated == (2,)
+    assert result.rounds[-1].exhausted == 1
+
+def test_stv_without_a_surplus_moves_no_ballots():
+    # quota is 2, the two ballots sitting on 0 are used up by its seat
+    result = single_transferable_vote([[0, 1]] * 2 + [[2]], 3, 2)
+    assert result.winners == (0, 2)
+
+def test_invalid_ballots_and_seats_are_rejected():
+    with pytest.raises(ValueError):
+        instant_runoff([[0, 0]], 2)
+    with pytest.raises(ValueError):
+        instant_runoff([[2]], 2)
+    with pytest.raises(ValueError):
+        single_transferable_vote([[0]], 2, 3)
+    with pytest.raises(ValueError):
+        plurality([], 0)
@@ -0,0 +1,97 @@
+import threading
+import time
+
+from systems.entry_system import EntryRepository, EntryLogic
+from systems.internal.tally_stream import TallyStream
+from systems.internal.user_system import UserRepository, UserLogic
+from systems.internal.vote_system import Tally, VoteRepository, VoteLogic
+
+def make_stream(clock, tallies, interval = 2.0):
+    updates = []
+    stream = TallyStream(tallies.__getitem__, interval=interval, clock=clock, background=False)
+    stream.subscribe(1, updates.append)
+    return stream, updates
+
+def test_first_update_carries_the_current_tally(clock):
+    tallies = {1: Tally(1, 2, 1, 0)}
+    stream, updates = make_stream(clock, tallies)
+    assert stream.run_pending() == 1
+    assert updates[0].tally == updates[0].delta == Tally(1, 2, 1, 0)
+    assert not updates[0].final
+
+def test_updates_within_an_interval_are_coalesced(clock):
+    tallies = {1: Tally(1, 0, 0, 0)}
+    stream, updates = make_stream(clock, tallies)
+    stream.run_pending()
+
+    clock.now = 0.5
+    tallies[1] = Tally(1, 1, 0, 0)
+    stream.publish(1)
+    clock.now = 1.0
+    tallies[1] = Tally(1, 1, 1, 0)
+    stream.publish(1)
+    assert stream.run_pending() == 0
+
+    clock.now = 2.0
+    assert stream.run_pending() == 1
+    assert len(updates) == 2
+    assert updates[1].tally == Tally(1, 1, 1, 0)
+    assert updates[1].delta == Tally(1, 1, 1, 0)
+
+def test_unchanged_tallies_are_skipped(clock):
+    tallies = {1: Tally(1, 1, 0, 0)}
+    stream, updates = make_stream(clock, tallies)
+    stream.run_pending()
+
+    clock.now = 5.0
+    stream.publish(1)
+    assert stream.run_pending() == 0
+    assert len(updates) == 1
+
+def test_finish_delivers_a_final_update_right_away(clock):
+    tallies = {1: Tally(1, 1, 0, 0)}
+    stream, updates = make_stream(clock, tallies)
+    stream.run_pending()
+
+    # inside the interval and unchanged, a final update is still sent
+    clock.now = 0.1
+    stream.finish(1)
+    assert stream.run_pending() == 1
+    assert updates[-1].final
+    assert updates[-1].tally == Tally(1, 1, 0, 0)
+    assert updates[-1].delta == Tally(1, 0, 0, 0)
+    assert not stream.is_streaming(1)
+
+    clock.now = 10.0
+    tallies[1] = Tally(1, 2, 0, 0)
+    stream.publish(1)
+    assert stream.run_pending() == 0
+
+def test_unsubscribed_callbacks_are_not_called(clock):
+    stream = TallyStream({1: Tally(1, 0, 0, 0)}.__getitem__, clock=clock, background=False)
+    updates = []
+    subscription = stream.subscribe(1, updates.append)
+    stream.unsubscribe(subscription)
+    assert stream.run_pending() == 0
+    assert updates == []
+
+def test_subscribing_to_a_closed_entry_gets_the_final_update(db):
+    users = UserLogic(UserRepository(db))
+    entries = EntryLogic(EntryRepository(db))
+    votes = VoteLogic(VoteRepository(db), users, entries)
+    author = users.register_user("1", "author", "Author")
+    entry_id = entries.register_entry("Free trade", "All trade is free", "resolution", author, "everyone", time.time() + 0.05)
+    entries.approve_entry(entry_id)
+    votes.cast_vote(author, entry_id, "approve")
+    time.sleep(0.1)
+    entries.complete_entry(entry_id)
+
+    received = threading.Event()
+    updates = []
+    def callback(update):
+        updates.append(update)
+        received.set()
+    votes.subscribe(entry_id, callback)
+    assert received.wait(5)
+    assert updates[0].final
+    assert updates[0].tally == Tally(entry_id, 1, 0, 0)
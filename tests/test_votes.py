@@ -0,0 +1,35 @@
+import time
+
+import pytest
+
+from exceptions import *
+from systems.entry_system import EntryRepository, EntryLogic
+from systems.internal.user_system import UserRepository, UserLogic
+from systems.internal.vote_system import Tally, VoteRepository, VoteLogic
+
+@pytest.fixture
+def council(db):
+    users = UserLogic(UserRepository(db))
+    entries = EntryLogic(EntryRepository(db))
+    votes = VoteLogic(VoteRepository(db), users, entries)
+    author = users.register_user("1", "author", "Author")
+    entry_id = entries.register_entry("Free trade", "All trade is free", "resolution", author, "everyone", time.time() + 1000)
+    entries.approve_entry(entry_id)
+    return entries, votes, author, entry_id
+
+def test_votes_are_counted_once_per_caster(council):
+    entries, votes, author, entry_id = council
+    votes.cast_vote(author, entry_id, "approve")
+    votes.cast_vote(author, entry_id, "disapprove")
+    assert votes.get_tally(entry_id) == Tally(entry_id, 0, 1, 0)
+    assert votes.get_vote(entry_id).votes == {author: "disapprove"}
+
+def test_vote_is_rejected_once_the_entry_closed_behind_a_cached_header(db, council):
+    entries, votes, author, entry_id = council
+    assert entries.get_header(entry_id).is_active()
+    # closed by another process, the cached header still says active
+    EntryRepository(db).mark_as_completed(entry_id, early=True)
+    assert entries.get_header(entry_id).is_active()
+    with pytest.raises(VoteAlreadyDoneError):
+        votes.cast_vote(author, entry_id, "approve")
+    assert votes.get_tally(entry_id) == Tally(entry_id, 0, 0, 0)